@@ -0,0 +1,301 @@
+"""
+Compact, column-backed storage for ad search results.
+
+A search result used to live in st.session_state as a list of ~25-key dicts
+per ad, one copy per browser session. AdResultSet keeps one column per field
+instead. Repetitive fields (page, CTA, category, flags, dates) are
+dictionary-encoded: an array of small integer codes plus one interned copy
+of each distinct value, so page names and CTA types are shared across
+sessions too. Per-ad text (ids, URLs) is packed as UTF-8 into one buffer
+with an offsets array, and list fields (creative_urls, matched_queries) are
+flattened the same way.
+
+Indexing or iterating yields AdRow views: read-only Mappings over one row
+that support .get(), [] and dict(row), so display and save code written for
+dicts keeps working.
+
+    results = AdResultSet(ads)
+    for i, ad in enumerate(results):
+        display_ad_card(ad, i)
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Fields whose values repeat across ads (per page, per CTA, flags, dates)
+CATEGORICAL_FIELDS = frozenset({
+    "page_name", "page_id", "page_profile_uri", "page_profile_picture_url", "page_entity_type",
+    "categories", "cta_text", "cta_type", "display_url", "entity_type", "state_media_run_label",
+    "is_active", "creative_found", "start_date", "end_date",
+})
+# Per-ad text: packed into a buffer, decoded on access
+TEXT_FIELDS = frozenset({
+    "ad_archive_id", "collation_id", "link_url", "website_url", "original_image_url", "video_url", "creative_url",
+})
+# List-valued fields, and whether their items repeat (query labels) or are per-ad text (URLs)
+LIST_FIELDS = {"creative_urls": False, "matched_queries": True}
+
+
+class _Missing:
+    """Marks a row that doesn't have the field at all (as opposed to None)."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class _ObjectColumn:
+    """Any other field: one list slot per row."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, rows: int = 0):
+        self.values: List[Any] = [_MISSING] * rows
+
+    def append(self, value: Any):
+        self.values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, i: int) -> Any:
+        return self.values[i]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.values)
+
+
+class _TextColumn:
+    """Strings packed as UTF-8 in one bytearray; row i is data[offsets[i]:offsets[i + 1]].
+
+    `state` marks rows that hold something else: 1 = missing, 2 = None,
+    3 = another type (kept as-is in `others`).
+    """
+
+    __slots__ = ("data", "offsets", "state", "others")
+
+    def __init__(self, rows: int = 0):
+        self.data = bytearray()
+        self.offsets = array("I", bytes(4 * (rows + 1)))
+        self.state = bytearray(b"\x01" * rows)
+        self.others: Dict[int, Any] = {}
+
+    def append(self, value: Any):
+        if type(value) is str:
+            self.state.append(0)
+            self.data += value.encode("utf-8", "surrogatepass")
+        elif value is _MISSING or value is None:
+            self.state.append(1 if value is _MISSING else 2)
+        else:
+            self.others[len(self.state)] = value
+            self.state.append(3)
+        self.offsets.append(len(self.data))
+
+    def __len__(self) -> int:
+        return len(self.state)
+
+    def get(self, i: int) -> Any:
+        state = self.state[i]
+        if state == 0:
+            return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8", "surrogatepass")
+        if state == 3:
+            return self.others[i]
+        return _MISSING if state == 1 else None
+
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self.data) + sys.getsizeof(self.offsets) + sys.getsizeof(self.state)
+                + sys.getsizeof(self.others))
+
+
+class _CategoricalColumn:
+    """Dictionary-encoded values: a code per row plus each distinct value once (code 0 = missing)."""
+
+    __slots__ = ("codes", "values", "_index")
+
+    def __init__(self, rows: int = 0):
+        self.codes = array("I", bytes(4 * rows))
+        self.values: List[Any] = [_MISSING]
+        self._index: Dict[Any, int] = {}
+
+    def encode(self, value: Any) -> int:
+        if value is _MISSING:
+            return 0
+        try:
+            # (type, value) keeps True apart from 1 and False from 0
+            key = (type(value), value)
+            code = self._index.get(key)
+        except TypeError:  # unhashable: stored as-is, not shared
+            self.values.append(value)
+            return len(self.values) - 1
+        if code is None:
+            code = self._index[key] = len(self.values)
+            self.values.append(_intern(value))
+        return code
+
+    def append(self, value: Any):
+        self.codes.append(self.encode(value))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def get(self, i: int) -> Any:
+        return self.values[self.codes[i]]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.codes) + sys.getsizeof(self.values) + sys.getsizeof(self._index)
+
+
+class _ListColumn:
+    """List values flattened into one item column; row i spans items[offsets[i]:offsets[i + 1]].
+
+    `state` marks rows whose value isn't a list: 1 = missing, 2 = None.
+    """
+
+    __slots__ = ("items", "offsets", "state")
+
+    def __init__(self, rows: int = 0, categorical: bool = False):
+        self.items = _CategoricalColumn() if categorical else _TextColumn()
+        self.offsets = array("I", bytes(4 * (rows + 1)))
+        self.state = bytearray(b"\x01" * rows)
+
+    def append(self, value: Any):
+        if value is _MISSING or value is None:
+            self.state.append(1 if value is _MISSING else 2)
+        elif isinstance(value, (list, tuple)):
+            self.state.append(0)
+            for item in value:
+                self.items.append(item)
+        else:
+            raise TypeError(f"expected a list, got {type(value).__name__}")
+        self.offsets.append(len(self.items))
+
+    def get(self, i: int) -> Any:
+        state = self.state[i]
+        if state:
+            return _MISSING if state == 1 else None
+        return [self.items.get(j) for j in range(self.offsets[i], self.offsets[i + 1])]
+
+    def nbytes(self) -> int:
+        return self.items.nbytes() + sys.getsizeof(self.offsets) + sys.getsizeof(self.state)
+
+
+class AdResultSet(Sequence):
+    """Search results stored column by column; rows are AdRow views.
+
+    Columns are created in the order fields first appear; dict(row) has the
+    same keys and values as the ad that was appended, in column order.
+    """
+
+    def __init__(self, ads: Iterable[Mapping] = ()):
+        self._columns: Dict[str, Any] = {}
+        self._rows = 0
+        self.extend(ads)
+
+    def _new_column(self, field: str):
+        if field in LIST_FIELDS:
+            return _ListColumn(self._rows, LIST_FIELDS[field])
+        if field in CATEGORICAL_FIELDS:
+            return _CategoricalColumn(self._rows)
+        if field in TEXT_FIELDS:
+            return _TextColumn(self._rows)
+        return _ObjectColumn(self._rows)
+
+    def append(self, ad: Mapping):
+        for field in ad:
+            if field not in self._columns:
+                self._columns[field] = self._new_column(field)
+        for field, column in self._columns.items():
+            column.append(ad.get(field, _MISSING))
+        self._rows += 1
+
+    def extend(self, ads: Iterable[Mapping]):
+        for ad in ads:
+            self.append(ad)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [AdRow(self, i) for i in range(*index.indices(self._rows))]
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError("AdResultSet index out of range")
+        return AdRow(self, index)
+
+    def __iter__(self) -> Iterator["AdRow"]:
+        for i in range(self._rows):
+            yield AdRow(self, i)
+
+    def value(self, index: int, field: str, default: Any = None) -> Any:
+        column = self._columns.get(field)
+        if column is None:
+            return default
+        value = column.get(index)
+        return default if value is _MISSING else value
+
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [row.to_dict() for row in self]
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns' containers (the distinct values themselves are not counted)."""
+        return sys.getsizeof(self._columns) + sum(column.nbytes() for column in self._columns.values())
+
+    def __repr__(self) -> str:
+        return f"AdResultSet({self._rows} ad(s), {len(self._columns)} field(s))"
+
+
+class AdRow(Mapping):
+    """Read-only view of one AdResultSet row; behaves like the ad dict it was built from."""
+
+    __slots__ = ("_results", "_index")
+
+    def __init__(self, results: AdResultSet, index: int):
+        self._results = results
+        self._index = index
+
+    def __getitem__(self, field: str) -> Any:
+        column = self._results._columns.get(field)
+        value = _MISSING if column is None else column.get(self._index)
+        if value is _MISSING:
+            raise KeyError(field)
+        return value
+
+    def get(self, field: str, default: Optional[Any] = None) -> Any:
+        return self._results.value(self._index, field, default)
+
+    def __iter__(self) -> Iterator[str]:
+        for field, column in self._results._columns.items():
+            if column.get(self._index) is not _MISSING:
+                yield field
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: value for field, column in self._results._columns.items()
+                if (value := column.get(self._index)) is not _MISSING}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, AdRow) and other._results is self._results:
+            return other._index == self._index
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"AdRow({self._index}, {self.to_dict()!r})"
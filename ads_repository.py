@@ -0,0 +1,1201 @@
+"""
+Data access for saved_ads.db.
+
+All helpers share one cached SQLite connection per thread instead of opening
+a fresh connection per call (a Streamlit rerun calls dozens of them). The
+connection runs in WAL mode with tuned pragmas, and its statement cache keeps
+the repeated queries prepared across calls.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import List, Dict, Any, Optional, BinaryIO, Callable, Iterable, Tuple
+
+from PIL import Image
+
+try:
+    from . import blob_store  # when packaged
+    from .image_fetcher import fetch_image_bytes as _fetch_image_bytes
+except Exception:
+    import blob_store  # when run directly
+    from image_fetcher import fetch_image_bytes as _fetch_image_bytes
+
+DB_PATH = os.getenv("SAVED_ADS_DB", "saved_ads.db")
+
+# Connection tuning (override via environment)
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+STATEMENT_CACHE_SIZE = 256
+
+# Gallery thumbnails (longest side in px, WebP quality)
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# Stay well under SQLite's bound-parameter limit for IN (...) lists
+MAX_IN_PARAMS = 500
+
+# =============================================================================
+# CONNECTION LAYER
+# =============================================================================
+
+_local = threading.local()
+
+
+def connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """Open a new tuned connection (WAL, NORMAL sync, larger page cache, mmap)."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=10, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's cached connection to DB_PATH, opening it on first use."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = conns[DB_PATH] = connect(DB_PATH)
+    return conn
+
+
+def close_connection():
+    """Close this thread's cached connections (they are also closed when the thread exits)."""
+    conns = getattr(_local, "conns", None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+# =============================================================================
+# DATABASE FUNCTIONS
+# =============================================================================
+
+def init_database():
+    """Initialize SQLite database"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Create tables table to track different collections
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ad_tables (
+            table_name TEXT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            description TEXT
+        )
+    ''')
+    
+    conn.commit()
+
+def init_generation_tables():
+    """Create tables for uploads and generated images if they don't exist"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            content_type TEXT,
+            sha256 TEXT UNIQUE,
+            data BLOB,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generated_ads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            upload_id INTEGER,
+            session_id INTEGER,
+            variant_id TEXT,
+            prompt_json TEXT,
+            variant_json TEXT,
+            image_data BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(upload_id) REFERENCES uploads(id)
+        )
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_upload ON generated_ads(upload_id)")
+
+    # Sessions table to group a batch generation
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_uploads (
+            session_id INTEGER,
+            upload_id INTEGER,
+            PRIMARY KEY (session_id, upload_id),
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(upload_id) REFERENCES uploads(id)
+        )
+    ''')
+
+    # Ensure session_id column exists on generated_ads (for upgrade path)
+    try:
+        cursor.execute("PRAGMA table_info(generated_ads)")
+        cols = [r[1] for r in cursor.fetchall()]
+        if 'session_id' not in cols:
+            cursor.execute("ALTER TABLE generated_ads ADD COLUMN session_id INTEGER")
+        # Background job that generated the row (NULL for interactive runs)
+        if 'job_id' not in cols:
+            cursor.execute("ALTER TABLE generated_ads ADD COLUMN job_id INTEGER")
+    except Exception:
+        pass
+
+    # Create index on session_id after the column is guaranteed to exist
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_session ON generated_ads(session_id)")
+        # Keyset pagination walks (session_id, created_at DESC, id DESC)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_session_created ON generated_ads(session_id, created_at, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_job ON generated_ads(job_id)")
+    except Exception:
+        pass
+
+    # Image bytes live in the blob store; rows keep sha256 + size (data/image_data stay for legacy rows)
+    blob_store.ensure_blob_columns(cursor)
+
+    # Small WebP previews for the galleries, keyed by the source image's sha256
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (sha256, size)
+        )
+    ''')
+    
+    conn.commit()
+    init_openai_file_table()
+    init_analysis_cache_table()
+    init_generation_cache_table()
+    init_job_tables()
+
+def create_ads_table(table_name: str, description: str = ""):
+    """Create a new table for saving ads"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Sanitize table name - make it unique with timestamp if needed
+    base_name = "ads_" + "".join(c for c in table_name if c.isalnum() or c in ('_',)).lower()
+    safe_table_name = base_name
+    
+    # Check if table already exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (safe_table_name,))
+    if cursor.fetchone():
+        # Add timestamp to make unique
+        safe_table_name = f"{base_name}_{int(time.time())}"
+    
+    # Create the ads table with all fields
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {safe_table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ad_archive_id TEXT UNIQUE,
+            page_name TEXT,
+            page_id TEXT,
+            categories TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            is_active BOOLEAN,
+            cta_text TEXT,
+            cta_type TEXT,
+            link_url TEXT,
+            display_url TEXT,
+            website_url TEXT,
+            original_image_url TEXT,
+            video_url TEXT,
+            collation_count INTEGER,
+            collation_id TEXT,
+            entity_type TEXT,
+            page_entity_type TEXT,
+            page_profile_picture_url TEXT,
+            page_profile_uri TEXT,
+            state_media_run_label TEXT,
+            total_active_time TEXT,
+            upload_id INTEGER,
+            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT
+        )
+    ''')
+    
+    # Add to tables registry
+    cursor.execute('''
+        INSERT OR REPLACE INTO ad_tables (table_name, description, created_at)
+        VALUES (?, ?, datetime('now'))
+    ''', (safe_table_name, description))
+    
+    conn.commit()
+    
+    return safe_table_name
+
+def get_available_tables():
+    """Get list of available tables"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # First check if ad_tables exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ad_tables'")
+    if not cursor.fetchone():
+        return []
+    
+    cursor.execute('SELECT table_name, description, created_at FROM ad_tables ORDER BY created_at DESC')
+    tables = cursor.fetchall()
+    
+    return tables
+
+def save_ad_to_table(table_name: str, ad_data: dict, notes: str = ""):
+    """Save an ad to specified table"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Check if ad already exists
+        cursor.execute(f'''
+            SELECT id FROM {table_name} WHERE ad_archive_id = ?
+        ''', (ad_data.get("ad_archive_id"),))
+
+        if cursor.fetchone():
+            return False, "Ad already exists in this collection"
+
+        # Save image data to uploads table if we have an image URL
+        upload_id = None
+        image_url = ad_data.get("original_image_url") or ad_data.get("creative_url")
+        if image_url:
+            # Try to fetch and save the image
+            image_bytes = _fetch_image_bytes(image_url)
+            if image_bytes:
+                # Generate a filename based on ad_archive_id
+                filename = f"ad_{ad_data.get('ad_archive_id', 'unknown')}.png"
+                upload_id = save_uploaded_image(filename, "image/png", image_bytes)
+                print(f"💾 Saved image for ad {ad_data.get('ad_archive_id')} as upload_id {upload_id}")
+
+        # Insert the ad
+        cursor.execute(f'''
+            INSERT INTO {table_name} (
+                ad_archive_id, page_name, page_id, categories, start_date, end_date,
+                is_active, cta_text, cta_type, link_url, display_url, website_url,
+                original_image_url, video_url, collation_count, collation_id,
+                entity_type, page_entity_type, page_profile_picture_url,
+                page_profile_uri, state_media_run_label, total_active_time, upload_id, notes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            ad_data.get("ad_archive_id"),
+            ad_data.get("page_name"),
+            ad_data.get("page_id"),
+            ad_data.get("categories"),
+            ad_data.get("start_date"),
+            ad_data.get("end_date"),
+            ad_data.get("is_active"),
+            ad_data.get("cta_text"),
+            ad_data.get("cta_type"),
+            ad_data.get("link_url"),
+            ad_data.get("display_url"),
+            ad_data.get("website_url"),
+            ad_data.get("original_image_url"),
+            ad_data.get("video_url"),
+            ad_data.get("collation_count"),
+            ad_data.get("collation_id"),
+            ad_data.get("entity_type"),
+            ad_data.get("page_entity_type"),
+            ad_data.get("page_profile_picture_url"),
+            ad_data.get("page_profile_uri"),
+            ad_data.get("state_media_run_label"),
+            ad_data.get("total_active_time"),
+            upload_id,
+            notes
+        ))
+
+        conn.commit()
+        return True, "Ad saved successfully!"
+    except Exception as e:
+        conn.rollback()
+        return False, f"Error saving ad: {str(e)}"
+
+def get_saved_ads(table_name: str):
+    """Get all saved ads from a table"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f'''
+            SELECT * FROM {table_name} ORDER BY saved_at DESC
+        ''')
+        
+        columns = [description[0] for description in cursor.description]
+        ads = []
+        
+        for row in cursor.fetchall():
+            ad_dict = dict(zip(columns, row))
+            ads.append(ad_dict)
+        
+        return ads
+    except Exception as e:
+        print(f"Error getting saved ads: {e}")
+        return []
+
+def delete_saved_ad(table_name: str, ad_id: int):
+    """Delete a saved ad"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(f'DELETE FROM {table_name} WHERE id = ?', (ad_id,))
+
+    conn.commit()
+
+def delete_generated_images(gen_ids: List[int]):
+    """Delete generated images by their IDs"""
+    if not gen_ids:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    placeholders = ','.join('?' for _ in gen_ids)
+    cursor.execute(f'SELECT image_sha256 FROM generated_ads WHERE id IN ({placeholders})', gen_ids)
+    hashes = [r[0] for r in cursor.fetchall()]
+
+    # Delete from generated_ads table
+    cursor.execute(f'DELETE FROM generated_ads WHERE id IN ({placeholders})', gen_ids)
+
+    conn.commit()
+    blob_store.release_blobs(cursor, hashes)
+    _release_thumbnails(cursor, hashes)
+    conn.commit()
+
+def clear_generation_data():
+    """Remove all uploads, sessions, generated images (and their blobs), cached analyses, cached generations and jobs"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT image_sha256 FROM generated_ads UNION SELECT sha256 FROM uploads')
+    blob_hashes = [r[0] for r in cursor.fetchall()]
+    cursor.execute('DELETE FROM generated_ads')
+    cursor.execute('DELETE FROM session_uploads')
+    cursor.execute('DELETE FROM sessions')
+    cursor.execute('DELETE FROM uploads')
+    cursor.execute('DELETE FROM thumbnails')
+    conn.commit()
+    clear_analysis_cache()
+    clear_generation_cache()
+    clear_jobs()
+    blob_store.release_blobs(cursor, blob_hashes)
+
+def delete_table(table_name: str):
+    """Delete an entire table and its registry entry"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
+        cursor.execute('DELETE FROM ad_tables WHERE table_name = ?', (table_name,))
+        
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Error deleting table: {e}")
+        return False
+
+# =============================================================================
+# GENERATION STORAGE HELPERS
+# =============================================================================
+
+def _sha256_bytes(data: bytes) -> str:
+    # Same content hash as the blob store and image cache, so uploads and blobs share keys
+    return blob_store.sha256_hex(data)
+
+def save_uploaded_image(filename: str, content_type: str, data: bytes) -> int:
+    """Save an uploaded image and return its row id. Dedup by sha256.
+
+    The bytes go to the blob store; the row keeps only the hash and size.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    hash_hex = blob_store.get_blob_store().put(data)
+    try:
+        cursor.execute('''
+            INSERT INTO uploads (filename, content_type, sha256, size)
+            VALUES (?, ?, ?, ?)
+        ''', (filename, content_type, hash_hex, len(data)))
+        upload_id = cursor.lastrowid
+        _store_thumbnail(cursor, hash_hex, data)
+        conn.commit()
+        return upload_id
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        cursor.execute('SELECT id FROM uploads WHERE sha256 = ?', (hash_hex,))
+        row = cursor.fetchone()
+        return row[0] if row else -1
+
+def list_uploaded_images() -> List[Dict[str, Any]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, filename, content_type, uploaded_at FROM uploads ORDER BY uploaded_at DESC')
+    rows = cursor.fetchall()
+    return [
+        {"id": r[0], "filename": r[1], "content_type": r[2], "uploaded_at": r[3]}
+        for r in rows
+    ]
+
+def get_upload_bytes(upload_id: int) -> Optional[bytes]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT data, sha256 FROM uploads WHERE id = ?', (upload_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row[0] is not None:  # not migrated yet
+        return bytes(row[0])
+    return blob_store.get_blob_store().get(row[1])
+
+def save_generated_image(upload_id: int, variant_id: str, prompt_json: dict, variant_json: dict, image_bytes: bytes, session_id: Optional[int] = None, job_id: Optional[int] = None) -> int:
+    hash_hex = blob_store.get_blob_store().put(image_bytes)
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO generated_ads (upload_id, session_id, job_id, variant_id, prompt_json, variant_json, image_sha256, image_size)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        upload_id,
+        session_id,
+        job_id,
+        str(variant_id) if variant_id is not None else None,
+        json.dumps(prompt_json, ensure_ascii=False),
+        json.dumps(variant_json, ensure_ascii=False),
+        hash_hex,
+        len(image_bytes)
+    ))
+    rowid = cursor.lastrowid
+    _store_thumbnail(cursor, hash_hex, image_bytes)
+    conn.commit()
+    return rowid
+
+def list_generated_for_upload(upload_id: int) -> List[Dict[str, Any]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, variant_id, created_at FROM generated_ads
+        WHERE upload_id = ? ORDER BY created_at DESC
+    ''', (upload_id,))
+    rows = cursor.fetchall()
+    return [
+        {"id": r[0], "variant_id": r[1], "created_at": r[2]}
+        for r in rows
+    ]
+
+def get_generated_image_bytes(gen_id: int) -> Optional[bytes]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT image_data, image_sha256 FROM generated_ads WHERE id = ?', (gen_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row[0] is not None:  # not migrated yet
+        return bytes(row[0])
+    return blob_store.get_blob_store().get(row[1]) if row[1] else None
+
+def open_generated_image(gen_id: int) -> Optional[BinaryIO]:
+    """Like get_generated_image_bytes, but returns a stream so exports can copy it in chunks."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT image_data IS NOT NULL, image_sha256 FROM generated_ads WHERE id = ?', (gen_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row[0]:  # not migrated yet
+        data = get_generated_image_bytes(gen_id)
+        return BytesIO(data) if data is not None else None
+    return blob_store.get_blob_store().open(row[1]) if row[1] else None
+
+def create_session(source: str, note: str = "") -> int:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO sessions (source, note) VALUES (?, ?)', (source, note))
+    sid = cursor.lastrowid
+    conn.commit()
+    return sid
+
+def link_session_uploads(session_id: int, upload_ids: List[int]):
+    conn = get_connection()
+    cursor = conn.cursor()
+    for uid in upload_ids:
+        cursor.execute('INSERT OR IGNORE INTO session_uploads (session_id, upload_id) VALUES (?, ?)', (session_id, uid))
+    conn.commit()
+
+def list_session_uploads(session_id: int) -> List[int]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT upload_id FROM session_uploads WHERE session_id = ?', (session_id,))
+    rows = [r[0] for r in cursor.fetchall()]
+    return rows
+
+def list_sessions() -> List[Dict[str, Any]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, source, note, created_at FROM sessions ORDER BY created_at DESC, id DESC')
+    rows = cursor.fetchall()
+    return [
+        {"id": r[0], "source": r[1], "note": r[2], "created_at": r[3]}
+        for r in rows
+    ]
+
+def list_generated_for_session(session_id: int) -> List[Dict[str, Any]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, upload_id, variant_id, created_at FROM generated_ads WHERE session_id = ? ORDER BY created_at DESC, id DESC', (session_id,))
+    rows = cursor.fetchall()
+    return [
+        {"id": r[0], "upload_id": r[1], "variant_id": r[2], "created_at": r[3]}
+        for r in rows
+    ]
+
+def list_generated_for_collection(table_name: str) -> List[Dict[str, Any]]:
+    """Get all generated images for a collection by finding sessions with matching source"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Find sessions that were created from this collection
+    cursor.execute("SELECT id FROM sessions WHERE source = ?", (f"collection:{table_name}",))
+    session_ids = [r[0] for r in cursor.fetchall()]
+
+    if not session_ids:
+        return []
+
+    # Get all generated images from these sessions
+    placeholders = ','.join('?' for _ in session_ids)
+    cursor.execute(f'SELECT id, session_id, upload_id, variant_id, created_at FROM generated_ads WHERE session_id IN ({placeholders}) ORDER BY created_at DESC, id DESC', session_ids)
+    rows = cursor.fetchall()
+
+    return [
+        {"id": r[0], "session_id": r[1], "upload_id": r[2], "variant_id": r[3], "created_at": r[4]}
+        for r in rows
+    ]
+
+# Keyset cursor: (created_at, id) of the last row on the previous page
+PageCursor = Tuple[str, int]
+
+def _generated_page(where: str, params: list, limit: int, after: Optional[PageCursor]) -> Tuple[List[Dict[str, Any]], Optional[PageCursor]]:
+    """One page of generated_ads (newest first) plus the cursor for the next page (None on the last page)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    if after is not None:
+        where += ' AND (created_at, id) < (?, ?)'
+        params = [*params, after[0], after[1]]
+    cursor.execute(f'''
+        SELECT id, session_id, upload_id, variant_id, created_at FROM generated_ads
+        WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', [*params, limit + 1])
+    rows = cursor.fetchall()
+    page = [
+        {"id": r[0], "session_id": r[1], "upload_id": r[2], "variant_id": r[3], "created_at": r[4]}
+        for r in rows[:limit]
+    ]
+    next_cursor = (page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+    return page, next_cursor
+
+def list_generated_for_session_page(session_id: int, limit: int, after: Optional[PageCursor] = None):
+    """Keyset-paginated list_generated_for_session: returns (rows, next_cursor)."""
+    return _generated_page('session_id = ?', [session_id], limit, after)
+
+def list_generated_for_collection_page(table_name: str, limit: int, after: Optional[PageCursor] = None):
+    """Keyset-paginated list_generated_for_collection: returns (rows, next_cursor)."""
+    return _generated_page('session_id IN (SELECT id FROM sessions WHERE source = ?)', [f"collection:{table_name}"], limit, after)
+
+def count_generated_for_session(session_id: int) -> int:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM generated_ads WHERE session_id = ?', (session_id,))
+    return cursor.fetchone()[0]
+
+def count_generated_for_collection(table_name: str) -> int:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM generated_ads WHERE session_id IN (SELECT id FROM sessions WHERE source = ?)',
+                   (f"collection:{table_name}",))
+    return cursor.fetchone()[0]
+
+def get_upload_meta(upload_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, filename, content_type, uploaded_at FROM uploads WHERE id = ?', (upload_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {"id": row[0], "filename": row[1], "content_type": row[2], "uploaded_at": row[3]}
+
+def get_upload_metas(upload_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Batched get_upload_meta: one query for all ids, keyed by upload id."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    metas = {}
+    for chunk in _id_chunks(upload_ids):
+        placeholders = ','.join('?' for _ in chunk)
+        cursor.execute(f'SELECT id, filename, content_type, uploaded_at FROM uploads WHERE id IN ({placeholders})', chunk)
+        for r in cursor.fetchall():
+            metas[r[0]] = {"id": r[0], "filename": r[1], "content_type": r[2], "uploaded_at": r[3]}
+    return metas
+
+# =============================================================================
+# GALLERY THUMBNAILS
+# =============================================================================
+
+def _id_chunks(ids: Iterable[int]) -> Iterable[List[int]]:
+    ids = list(ids)
+    for i in range(0, len(ids), MAX_IN_PARAMS):
+        yield ids[i:i + MAX_IN_PARAMS]
+
+def make_thumbnail(image_bytes: bytes, size: Optional[int] = None) -> Optional[bytes]:
+    """Downscale to fit size x size and encode as WebP. Returns None if the image can't be decoded."""
+    size = size or THUMBNAIL_SIZE
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        img.draft('RGB', (size, size))  # JPEG: decode at reduced scale
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        img.thumbnail((size, size), Image.LANCZOS)
+        out = BytesIO()
+        img.save(out, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        return out.getvalue()
+    except Exception as e:  # noqa: BLE001
+        print(f"⚠️ Thumbnail generation failed: {e}")
+        return None
+
+def _store_thumbnail(cursor: sqlite3.Cursor, hash_hex: str, image_bytes: bytes):
+    """Build the gallery thumbnail up front so the first gallery view doesn't pay for it."""
+    thumb = make_thumbnail(image_bytes)
+    if thumb is not None:
+        cursor.execute('INSERT OR IGNORE INTO thumbnails (sha256, size, data) VALUES (?, ?, ?)',
+                       (hash_hex, THUMBNAIL_SIZE, sqlite3.Binary(thumb)))
+
+def _load_thumbnails(rows: List[Tuple[int, Optional[str], Optional[bytes]]],
+                     load_full: Callable[[int], Optional[bytes]]) -> Dict[int, bytes]:
+    """Resolve (id, sha256, cached thumbnail) rows; build and store the missing thumbnails.
+
+    Images that can't be thumbnailed fall back to their full bytes.
+    """
+    thumbs: Dict[int, bytes] = {}
+    created = []
+    for row_id, hash_hex, thumb in rows:
+        if thumb is not None:
+            thumbs[row_id] = bytes(thumb)
+            continue
+        full = load_full(row_id)
+        if not full:
+            continue
+        thumb = make_thumbnail(full)
+        if thumb is None:
+            thumbs[row_id] = full
+            continue
+        thumbs[row_id] = thumb
+        created.append((hash_hex or blob_store.sha256_hex(full), THUMBNAIL_SIZE, sqlite3.Binary(thumb)))
+
+    if created:
+        conn = get_connection()
+        conn.executemany('INSERT OR IGNORE INTO thumbnails (sha256, size, data) VALUES (?, ?, ?)', created)
+        conn.commit()
+    return thumbs
+
+def get_upload_thumbnails(upload_ids: List[int]) -> Dict[int, bytes]:
+    """Thumbnails for many uploads in one query, keyed by upload id (missing ones are generated once)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    rows = []
+    for chunk in _id_chunks(upload_ids):
+        placeholders = ','.join('?' for _ in chunk)
+        cursor.execute(f'''
+            SELECT u.id, u.sha256, t.data FROM uploads u
+            LEFT JOIN thumbnails t ON t.sha256 = u.sha256 AND t.size = ?
+            WHERE u.id IN ({placeholders})
+        ''', [THUMBNAIL_SIZE, *chunk])
+        rows.extend(cursor.fetchall())
+    return _load_thumbnails(rows, get_upload_bytes)
+
+def get_generated_thumbnails(gen_ids: List[int]) -> Dict[int, bytes]:
+    """Thumbnails for many generated images in one query, keyed by generated id."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    rows = []
+    for chunk in _id_chunks(gen_ids):
+        placeholders = ','.join('?' for _ in chunk)
+        cursor.execute(f'''
+            SELECT g.id, g.image_sha256, t.data FROM generated_ads g
+            LEFT JOIN thumbnails t ON t.sha256 = g.image_sha256 AND t.size = ?
+            WHERE g.id IN ({placeholders})
+        ''', [THUMBNAIL_SIZE, *chunk])
+        rows.extend(cursor.fetchall())
+    return _load_thumbnails(rows, get_generated_image_bytes)
+
+def _release_thumbnails(cursor: sqlite3.Cursor, hashes: Iterable[Optional[str]]):
+    """Drop thumbnails whose source image is no longer referenced."""
+    for hash_hex in set(h for h in hashes if h):
+        cursor.execute('''
+            DELETE FROM thumbnails WHERE sha256 = ?
+              AND NOT EXISTS (SELECT 1 FROM uploads WHERE sha256 = ?)
+              AND NOT EXISTS (SELECT 1 FROM generated_ads WHERE image_sha256 = ?)
+        ''', (hash_hex, hash_hex, hash_hex))
+
+# =============================================================================
+# CACHE TABLES
+# =============================================================================
+# Tables the engine writes to outside of app startup (worker threads, CLI,
+# benchmarks) are created on first use, once per database per process.
+
+_ready_tables = set()
+
+def _ensure_table(name: str, *ddl: str):
+    if (DB_PATH, name) in _ready_tables:
+        return
+    conn = get_connection()
+    for statement in ddl:
+        conn.execute(statement)
+    conn.commit()
+    _ready_tables.add((DB_PATH, name))
+
+# =============================================================================
+# OPENAI FILE-ID CACHE
+# =============================================================================
+# Maps an image's sha256 (the same hash uploads are stored under) to the id of
+# the file already uploaded to OpenAI for it, per account and upload encoding.
+# Timestamps are unix seconds so expiry checks are plain arithmetic.
+
+def init_openai_file_table():
+    """Create the file-id cache table if it doesn't exist."""
+    _ensure_table("openai_files", """
+        CREATE TABLE IF NOT EXISTS openai_files (
+            sha256 TEXT NOT NULL,
+            account TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            size INTEGER,
+            created_at REAL NOT NULL,
+            validated_at REAL NOT NULL,
+            PRIMARY KEY (sha256, account, variant)
+        )
+    """, "CREATE INDEX IF NOT EXISTS idx_openai_files_created ON openai_files(account, created_at)")
+
+def get_openai_files(hashes: Iterable[str], account: str, variant: str) -> Dict[str, Dict[str, Any]]:
+    """Cached uploads for these hashes, keyed by sha256: {file_id, size, created_at, validated_at}."""
+    init_openai_file_table()
+    cursor = get_connection().cursor()
+    found: Dict[str, Dict[str, Any]] = {}
+    for chunk in _id_chunks(hashes):
+        placeholders = ','.join('?' for _ in chunk)
+        cursor.execute(f'''
+            SELECT sha256, file_id, size, created_at, validated_at FROM openai_files
+            WHERE account = ? AND variant = ? AND sha256 IN ({placeholders})
+        ''', [account, variant, *chunk])
+        for hash_hex, file_id, size, created_at, validated_at in cursor.fetchall():
+            found[hash_hex] = {"file_id": file_id, "size": size, "created_at": created_at, "validated_at": validated_at}
+    return found
+
+def remember_openai_files(entries: Iterable[Tuple[str, str, int]], account: str, variant: str):
+    """Record freshly uploaded (sha256, file_id, size) entries."""
+    init_openai_file_table()
+    now = time.time()
+    conn = get_connection()
+    conn.executemany('''
+        INSERT OR REPLACE INTO openai_files (sha256, account, variant, file_id, size, created_at, validated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(h, account, variant, fid, size, now, now) for h, fid, size in entries])
+    conn.commit()
+
+def touch_openai_files(file_ids: Iterable[str]):
+    """Mark cached files as just validated against the API."""
+    init_openai_file_table()
+    conn = get_connection()
+    conn.executemany('UPDATE openai_files SET validated_at = ? WHERE file_id = ?',
+                     [(time.time(), fid) for fid in file_ids])
+    conn.commit()
+
+def forget_openai_files(file_ids: Iterable[str]):
+    """Drop cache entries whose remote file is gone or is being replaced."""
+    init_openai_file_table()
+    conn = get_connection()
+    conn.executemany('DELETE FROM openai_files WHERE file_id = ?', [(fid,) for fid in file_ids])
+    conn.commit()
+
+def pop_expired_openai_files(account: str, max_age: float) -> List[str]:
+    """Remove and return the file ids uploaded more than max_age seconds ago (caller deletes them remotely)."""
+    init_openai_file_table()
+    conn = get_connection()
+    cutoff = time.time() - max_age
+    rows = conn.execute('SELECT file_id FROM openai_files WHERE account = ? AND created_at < ?', (account, cutoff)).fetchall()
+    if rows:
+        conn.execute('DELETE FROM openai_files WHERE account = ? AND created_at < ?', (account, cutoff))
+        conn.commit()
+    return [r[0] for r in rows]
+
+# =============================================================================
+# ANALYSIS CACHE
+# =============================================================================
+# Assistant analysis results (base + variants JSON) memoized by a key the
+# engine derives from the sorted image hashes, desired_count, assistant id and
+# instruction version; the components are stored alongside for inspection.
+
+def init_analysis_cache_table():
+    """Create the analysis cache table if it doesn't exist."""
+    _ensure_table("analysis_cache", """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            assistant_id TEXT,
+            desired_count INTEGER NOT NULL,
+            instruction_version TEXT NOT NULL,
+            image_hashes TEXT NOT NULL,
+            base_json TEXT NOT NULL,
+            variants_json TEXT NOT NULL,
+            analysis_seconds REAL,
+            created_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_hit_at REAL
+        )
+    """)
+
+def get_analysis_result(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Cached {base, variants, analysis_seconds, created_at, hits} for a key (counts the hit), or None."""
+    init_analysis_cache_table()
+    conn = get_connection()
+    row = conn.execute('''
+        SELECT base_json, variants_json, analysis_seconds, created_at, hits
+        FROM analysis_cache WHERE cache_key = ?
+    ''', (cache_key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute('UPDATE analysis_cache SET hits = hits + 1, last_hit_at = ? WHERE cache_key = ?',
+                 (time.time(), cache_key))
+    conn.commit()
+    return {"base": json.loads(row[0]), "variants": json.loads(row[1]), "analysis_seconds": row[2],
+            "created_at": row[3], "hits": row[4] + 1}
+
+def save_analysis_result(cache_key: str, *, assistant_id: Optional[str], desired_count: int, instruction_version: str,
+                         image_hashes: List[str], base: dict, variants: dict, analysis_seconds: float):
+    init_analysis_cache_table()
+    conn = get_connection()
+    conn.execute('''
+        INSERT OR REPLACE INTO analysis_cache
+            (cache_key, assistant_id, desired_count, instruction_version, image_hashes,
+             base_json, variants_json, analysis_seconds, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, assistant_id, desired_count, instruction_version, json.dumps(image_hashes),
+          json.dumps(base), json.dumps(variants), analysis_seconds, time.time()))
+    conn.commit()
+
+def analysis_cache_summary() -> Dict[str, Any]:
+    """Entries, lifetime hits and the Assistant time those hits skipped."""
+    init_analysis_cache_table()
+    entries, hits, saved = get_connection().execute(
+        'SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * analysis_seconds), 0) FROM analysis_cache'
+    ).fetchone()
+    return {"entries": entries, "hits": hits, "seconds_saved": saved}
+
+def clear_analysis_cache():
+    init_analysis_cache_table()
+    conn = get_connection()
+    conn.execute('DELETE FROM analysis_cache')
+    conn.commit()
+# =============================================================================
+# GENERATION CACHE
+# =============================================================================
+# Gemini outputs keyed by a hash of (model, prompt sha256, size, variation
+# index); the image itself lives in the blob store like every other image.
+
+def init_generation_cache_table():
+    """Create the generation cache table if it doesn't exist."""
+    _ensure_table("generation_cache", """
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            prompt_sha256 TEXT NOT NULL,
+            size TEXT NOT NULL,
+            variation INTEGER NOT NULL,
+            image_sha256 TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_hit_at REAL
+        )
+    """, "CREATE INDEX IF NOT EXISTS idx_generation_cache_image ON generation_cache(image_sha256)")
+
+def get_cached_generation(cache_key: str) -> Optional[bytes]:
+    """Image bytes stored for this key (counts the hit), or None. Entries whose blob is gone are dropped."""
+    init_generation_cache_table()
+    conn = get_connection()
+    row = conn.execute('SELECT image_sha256 FROM generation_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+    if row is None:
+        return None
+    data = blob_store.get_blob_store().get(row[0])
+    if data is None:
+        conn.execute('DELETE FROM generation_cache WHERE cache_key = ?', (cache_key,))
+    else:
+        conn.execute('UPDATE generation_cache SET hits = hits + 1, last_hit_at = ? WHERE cache_key = ?',
+                     (time.time(), cache_key))
+    conn.commit()
+    return data
+
+def store_generation(cache_key: str, image_bytes: bytes, *, model: str, prompt_sha256: str, size: str, variation: int):
+    init_generation_cache_table()
+    hash_hex = blob_store.get_blob_store().put(image_bytes)
+    conn = get_connection()
+    replaced = conn.execute('SELECT image_sha256 FROM generation_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+    conn.execute('''
+        INSERT OR REPLACE INTO generation_cache (cache_key, model, prompt_sha256, size, variation, image_sha256, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, model, prompt_sha256, size, variation, hash_hex, time.time()))
+    conn.commit()
+    if replaced and replaced[0] != hash_hex:
+        blob_store.release_blobs(conn.cursor(), [replaced[0]])
+
+def generation_cache_summary() -> Dict[str, Any]:
+    """Entries and lifetime hits of the generation cache."""
+    init_generation_cache_table()
+    entries, hits = get_connection().execute(
+        'SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM generation_cache'
+    ).fetchone()
+    return {"entries": entries, "hits": hits}
+
+def clear_generation_cache():
+    init_generation_cache_table()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT image_sha256 FROM generation_cache')
+    hashes = [r[0] for r in cursor.fetchall()]
+    cursor.execute('DELETE FROM generation_cache')
+    conn.commit()
+    blob_store.release_blobs(cursor, hashes)
+
+# =============================================================================
+# GENERATION JOB QUEUE
+# =============================================================================
+# Durable queue for analyze+generate jobs run by generation_worker.py. Rows move
+# queued -> running -> done | failed | cancelled; a running job whose worker
+# stops heartbeating is requeued (or failed after too many attempts).
+
+JOB_ACTIVE_STATES = ("queued", "running")
+
+def init_job_tables():
+    """Create the job queue and worker registry tables if they don't exist."""
+    _ensure_table("generation_jobs", """
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            payload TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            prompts TEXT NOT NULL DEFAULT '[]',
+            message TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            heartbeat_at REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        )
+    """, "CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs(status, id)")
+    _ensure_table("job_workers", """
+        CREATE TABLE IF NOT EXISTS job_workers (
+            worker_id TEXT PRIMARY KEY,
+            pid INTEGER,
+            host TEXT,
+            started_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL
+        )
+    """)
+
+_JOB_COLUMNS = ('id', 'session_id', 'status', 'payload', 'total', 'completed', 'failed', 'prompts', 'message',
+                'error', 'cancel_requested', 'attempts', 'worker_id', 'heartbeat_at', 'created_at', 'started_at',
+                'finished_at')
+
+def _job_row(row) -> Dict[str, Any]:
+    job = dict(zip(_JOB_COLUMNS, row))
+    job["payload"] = json.loads(job["payload"])
+    job["prompts"] = json.loads(job["prompts"])
+    return job
+
+def enqueue_generation_job(session_id: int, payload: Dict[str, Any], total: int) -> int:
+    """Queue an analyze+generate job for a session; payload is JSON (upload_ids, desired_count, ...)."""
+    init_job_tables()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO generation_jobs (session_id, payload, total, message, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (session_id, json.dumps(payload), total, "Waiting for a worker", time.time()))
+    conn.commit()
+    return cursor.lastrowid
+
+def claim_next_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically move the oldest queued job to running for this worker; None when the queue is empty."""
+    return _claim_job(worker_id, "SELECT id FROM generation_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+
+def claim_job(job_id: int, worker_id: str) -> Optional[Dict[str, Any]]:
+    """Claim one specific queued job (e.g. one the caller just enqueued); None if it isn't queued anymore."""
+    return _claim_job(worker_id, "SELECT id FROM generation_jobs WHERE id = ? AND status = 'queued'", (job_id,))
+
+def _claim_job(worker_id: str, select_sql: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+    init_job_tables()
+    conn = get_connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')  # one writer at a time, so two workers can't claim the same row
+    try:
+        row = conn.execute(f'''
+            UPDATE generation_jobs
+            SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                started_at = ?, heartbeat_at = ?, message = 'Starting'
+            WHERE id = ({select_sql})
+            RETURNING {', '.join(_JOB_COLUMNS)}
+        ''', (worker_id, now, now, *params)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return _job_row(row) if row else None
+
+def update_job(job_id: int, **fields):
+    """Set progress fields (completed, failed, message, prompts, ...) and refresh the heartbeat."""
+    init_job_tables()
+    if "prompts" in fields:
+        fields["prompts"] = json.dumps(fields["prompts"])
+    fields["heartbeat_at"] = time.time()
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn = get_connection()
+    conn.execute(f'UPDATE generation_jobs SET {assignments} WHERE id = ?', [*fields.values(), job_id])
+    conn.commit()
+
+def finish_job(job_id: int, status: str, *, message: Optional[str] = None, error: Optional[str] = None):
+    init_job_tables()
+    conn = get_connection()
+    conn.execute('''
+        UPDATE generation_jobs SET status = ?, message = COALESCE(?, message), error = ?, finished_at = ?
+        WHERE id = ?
+    ''', (status, message, error, time.time(), job_id))
+    conn.commit()
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    init_job_tables()
+    row = get_connection().execute(f'SELECT {", ".join(_JOB_COLUMNS)} FROM generation_jobs WHERE id = ?',
+                                   (job_id,)).fetchone()
+    return _job_row(row) if row else None
+
+def get_jobs(job_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Several jobs in one query (the UI polls these), keyed by id."""
+    init_job_tables()
+    cursor = get_connection().cursor()
+    jobs: Dict[int, Dict[str, Any]] = {}
+    for chunk in _id_chunks(job_ids):
+        placeholders = ','.join('?' for _ in chunk)
+        cursor.execute(f'SELECT {", ".join(_JOB_COLUMNS)} FROM generation_jobs WHERE id IN ({placeholders})', chunk)
+        for row in cursor.fetchall():
+            job = _job_row(row)
+            jobs[job["id"]] = job
+    return jobs
+
+def list_jobs(limit: int = 50, statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    init_job_tables()
+    where, params = '', []
+    if statuses:
+        statuses = list(statuses)
+        where = f"WHERE status IN ({','.join('?' for _ in statuses)})"
+        params = statuses
+    rows = get_connection().execute(
+        f'SELECT {", ".join(_JOB_COLUMNS)} FROM generation_jobs {where} ORDER BY id DESC LIMIT ?', [*params, limit]
+    ).fetchall()
+    return [_job_row(r) for r in rows]
+
+def cancel_job(job_id: int) -> bool:
+    """Cancel a queued job outright, or ask the worker to stop a running one. Returns False if already finished."""
+    init_job_tables()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE generation_jobs SET status = 'cancelled', message = 'Cancelled', finished_at = ?
+        WHERE id = ? AND status = 'queued'
+    ''', (time.time(), job_id))
+    if cursor.rowcount == 0:
+        cursor.execute("UPDATE generation_jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+    conn.commit()
+    return cursor.rowcount > 0
+
+def clear_jobs():
+    """Drop finished jobs and cancel the active ones (a running job stops at its next checkpoint)."""
+    init_job_tables()
+    conn = get_connection()
+    conn.execute("DELETE FROM generation_jobs WHERE status NOT IN ('queued', 'running')")
+    conn.execute("UPDATE generation_jobs SET status = 'cancelled', message = 'Cancelled', finished_at = ? WHERE status = 'queued'",
+                 (time.time(),))
+    conn.execute("UPDATE generation_jobs SET cancel_requested = 1 WHERE status = 'running'")
+    conn.commit()
+
+def job_cancel_requested(job_id: int) -> bool:
+    init_job_tables()
+    row = get_connection().execute('SELECT cancel_requested FROM generation_jobs WHERE id = ?', (job_id,)).fetchone()
+    return bool(row and row[0])
+
+def requeue_stale_jobs(stale_after: float, max_attempts: int) -> Tuple[int, int]:
+    """Requeue running jobs whose worker stopped heartbeating; fail those out of attempts. Returns (requeued, failed)."""
+    init_job_tables()
+    conn = get_connection()
+    cutoff = time.time() - stale_after
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE generation_jobs SET status = 'failed', error = 'Worker stopped responding', finished_at = ?
+        WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+    ''', (time.time(), cutoff, max_attempts))
+    failed = cursor.rowcount
+    # Progress restarts with the next attempt, which skips the variants already saved (job_variant_ids)
+    cursor.execute('''
+        UPDATE generation_jobs SET status = 'queued', worker_id = NULL, message = 'Requeued after worker loss',
+            completed = 0, failed = 0, prompts = '[]'
+        WHERE status = 'running' AND heartbeat_at < ?
+    ''', (cutoff,))
+    requeued = cursor.rowcount
+    conn.commit()
+    return requeued, failed
+
+def job_variant_ids(job_id: int) -> List[str]:
+    """Variant ids a job has already saved to generated_ads (by an earlier attempt, if it was requeued)."""
+    rows = get_connection().execute('SELECT DISTINCT variant_id FROM generated_ads WHERE job_id = ?', (job_id,)).fetchall()
+    return [r[0] for r in rows]
+
+def register_worker(worker_id: str, pid: int, host: str):
+    init_job_tables()
+    now = time.time()
+    conn = get_connection()
+    conn.execute('INSERT OR REPLACE INTO job_workers (worker_id, pid, host, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)',
+                 (worker_id, pid, host, now, now))
+    conn.commit()
+
+def worker_heartbeat(worker_id: str):
+    init_job_tables()
+    conn = get_connection()
+    conn.execute('UPDATE job_workers SET heartbeat_at = ? WHERE worker_id = ?', (time.time(), worker_id))
+    conn.commit()
+
+def unregister_worker(worker_id: str):
+    init_job_tables()
+    conn = get_connection()
+    conn.execute('DELETE FROM job_workers WHERE worker_id = ?', (worker_id,))
+    conn.commit()
+
+def live_worker_count(max_age: float) -> int:
+    """Workers that heartbeated within max_age seconds."""
+    init_job_tables()
+    row = get_connection().execute('SELECT COUNT(*) FROM job_workers WHERE heartbeat_at >= ?',
+                                   (time.time() - max_age,)).fetchone()
+    return row[0]
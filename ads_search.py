@@ -0,0 +1,1247 @@
+"""
+Facebook Ads Library search via Apify, plus creative extraction.
+
+Builds the Ads Library search URL, runs the Apify scraper, reads its dataset
+page by page, parses each item once into an AdRecord with the fields the app
+and collections store, and picks a validated creative image per ad
+(stream_facebook_ads_scrape yields ads as each page is validated). Nothing
+here depends on Streamlit:
+progress is reported through callbacks and errors are raised, so the same
+pipeline runs from the UI (app.py) and headless (batch_pipeline.py).
+"""
+
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+from urllib.parse import quote_plus, urlparse
+
+from apify_client import ApifyClient
+
+try:
+    from . import creative_validation as cv  # when packaged
+    from . import image_cache, image_fetcher
+except Exception:
+    import creative_validation as cv  # when run directly
+    import image_cache
+    import image_fetcher
+
+# =============================================================================
+# CREATIVE EXTRACTION FUNCTIONS
+# =============================================================================
+
+# URL matchers, compiled once. Patterns are lowercase; URLs are lowercased once per check.
+_CDN_HOSTS = ('fbcdn.net', 'facebook.com', 'fbsbx.com')
+_CREATIVE_EXCLUDE = (
+    'icon', 'avatar', 'emoji', 'badge', '1x1', 'pixel', 'spinner',
+    '/photos/', '/profile/', '/pages/', '/groups/', '/events/',
+    'logo', 'brand', 'company', 'profile_picture', 'page_profile',
+    'thumbnail', 'small', 'tiny',
+    'video', '.mp4', 'video_hd_url', 'video_preview_image_url'  # Skip video URLs
+)
+_CREATIVE_INCLUDE = (
+    'scontent',  # Static content CDN
+    '/t39.', '/t31.',  # Facebook image size indicators
+    'creative', 'ad', 'campaign'
+)
+_CDN_HOST_RE = re.compile('|'.join(map(re.escape, _CDN_HOSTS)))
+_CREATIVE_EXCLUDE_RE = re.compile('|'.join(map(re.escape, _CREATIVE_EXCLUDE)))
+_CREATIVE_INCLUDE_RE = re.compile('|'.join(map(re.escape, _CREATIVE_INCLUDE)))
+
+# Candidate types, best first; within a type, larger size hints rank first
+CREATIVE_PRIORITY = {
+    'creative_thumbnail': 1,
+    'link_data_image': 2,
+    'video_data_image': 3,
+    'direct_field': 4,
+    'deep_search': 5
+}
+
+def is_likely_creative_url(url: str) -> bool:
+    """Check if URL is likely to be an ad creative (not logo/profile pic)"""
+    if not _CDN_HOST_RE.search(url):
+        return False
+    lowered = url.lower()
+    # Exclude obvious non-creative URLs, then require a pattern that suggests a creative
+    return not _CREATIVE_EXCLUDE_RE.search(lowered) and _CREATIVE_INCLUDE_RE.search(lowered) is not None
+
+
+def download_ad_creative(apify_item: Union[Dict[str, Any], "AdRecord"], ad_archive_id: str) -> bool:
+    """Download the best creative for an ad using multi-attempt logic"""
+    if not apify_item:
+        return False
+
+    # Extract creatives using our enhanced logic
+    creatives = _item_creatives(apify_item, ad_archive_id)
+
+    if not creatives:
+        return False
+
+    # Sort creatives by priority (best first)
+    sorted_creatives = _rank_creatives(creatives)
+
+    # Try to download creatives in priority order until one succeeds
+    safe_id = re.sub(r'[^\w\-_]', '_', ad_archive_id)
+    save_path = f"creative_{safe_id}.png"
+
+    for i, creative in enumerate(sorted_creatives, 1):
+        url = creative['url']
+
+        # Try to download (streamed straight to disk)
+        written = image_fetcher.download_image_to_file(url, save_path)
+
+        if written:
+            print(f"🏆 Got creative for ad {ad_archive_id} on attempt {i}")
+            return True
+        else:
+            print(f"❌ Creative attempt {i} failed for ad {ad_archive_id}")
+
+    print(f"💥 All {len(sorted_creatives)} creatives failed for ad {ad_archive_id}")
+    return False
+
+def scrape_facebook_ad_creative_with_apify(ad_archive_id: str, apify_token: str) -> List[str]:
+    """Fallback: Use Apify to scrape individual Facebook Ads Library page for creative image"""
+    try:
+        print(f"🔄 FALLBACK: Using Apify to scrape Facebook page for ad {ad_archive_id}...")
+
+        # Construct Facebook Ads Library URL for this specific ad
+        fb_url = f"https://www.facebook.com/ads/library/?id={ad_archive_id}"
+
+        # Use Apify's Facebook Ads Library scraper to get detailed ad data
+        client = ApifyClient(apify_token)
+
+        run_input = {
+            "urls": [{"url": fb_url, "method": "GET"}],
+            "count": 1,  # We only want this specific ad
+            "scrapeAdDetails": True,
+            "scrapePageAds.activeStatus": "all",
+            "period": ""
+        }
+
+        run = client.actor("curious_coder/facebook-ads-library-scraper").call(run_input=run_input)
+        dataset_id = run.get("defaultDatasetId")
+        if not dataset_id:
+            print(f"❌ No dataset ID returned from Apify fallback for ad {ad_archive_id}")
+            return []
+
+        items = list(client.dataset(dataset_id).iterate_items())
+
+        print(f"📊 Fallback returned {len(items)} items:")
+        for i, item in enumerate(items):
+            item_id = item.get('ad_archive_id', 'NO_ID')
+            print(f"   {i+1}. Ad ID: {item_id}")
+
+        if not items:
+            print(f"❌ No items returned from Apify fallback for ad {ad_archive_id}")
+            return []
+
+        # Find the item with the correct ad_archive_id
+        fallback_item = None
+        for item in items:
+            if item.get('ad_archive_id') == ad_archive_id:
+                fallback_item = item
+                break
+
+        # If we didn't find the exact ad, try the first item as fallback
+        if not fallback_item:
+            print(f"⚠️  Exact ad {ad_archive_id} not found in fallback results, using first item")
+            fallback_item = items[0]
+
+        # Double-check we have the right item
+        found_id = fallback_item.get('ad_archive_id')
+        if found_id != ad_archive_id:
+            print(f"⚠️  Fallback returned different ad ID: {found_id} instead of {ad_archive_id}")
+        else:
+            print(f"✅ Found correct ad ID: {found_id}")
+
+        # Extract creative URLs from the fallback data
+        creative_urls = []
+
+        def add_creative_fallback(url: str):
+            if url and is_likely_creative_url(url):
+                creative_urls.append(url)
+
+        # Direct fields
+        if fallback_item.get('original_image_url'):
+            add_creative_fallback(fallback_item['original_image_url'])
+
+        if fallback_item.get('image_url'):
+            add_creative_fallback(fallback_item['image_url'])
+
+        # Snapshot-based extraction (same as main logic)
+        snapshot = fallback_item.get('snapshot', {})
+        if isinstance(snapshot, dict):
+            # Check various nested locations
+            if snapshot.get('creatives'):
+                for creative in snapshot['creatives']:
+                    if creative.get('thumbnail'):
+                        add_creative_fallback(creative['thumbnail'])
+                    if creative.get('object_story_spec', {}).get('link_data', {}).get('image', {}).get('url'):
+                        add_creative_fallback(creative['object_story_spec']['link_data']['image']['url'])
+                    if creative.get('object_story_spec', {}).get('video_data', {}).get('image', {}).get('url'):
+                        add_creative_fallback(creative['object_story_spec']['video_data']['image']['url'])
+
+            # Deep search in snapshot (same as main logic)
+            def find_images_recursive_fallback(obj, path=""):
+                if isinstance(obj, dict):
+                    for key, value in obj.items():
+                        if key in ['image', 'images', 'thumbnail', 'thumbnails', 'picture', 'pictures', 'photo', 'photos']:
+                            if isinstance(value, str) and value.startswith('http'):
+                                add_creative_fallback(value)
+                            elif isinstance(value, dict) and value.get('url'):
+                                add_creative_fallback(value['url'])
+                            elif isinstance(value, list):
+                                for i, item in enumerate(value):
+                                    if isinstance(item, str) and item.startswith('http'):
+                                        add_creative_fallback(item)
+                                    elif isinstance(item, dict) and item.get('url'):
+                                        add_creative_fallback(item['url'])
+                        elif isinstance(value, (dict, list)):
+                            find_images_recursive_fallback(value, f"{path}.{key}" if path else key)
+                elif isinstance(obj, list):
+                    for i, item in enumerate(obj):
+                        find_images_recursive_fallback(item, f"{path}[{i}]" if path else f"[{i}]")
+
+            find_images_recursive_fallback(snapshot)
+
+        # Remove duplicates
+        creative_urls = list(set(creative_urls))
+
+        print(f"📸 Found {len(creative_urls)} potential creative URLs via Apify fallback")
+
+        if not creative_urls:
+            print(f"❌ No creative images found via Apify fallback for ad {ad_archive_id}")
+            return []
+
+        # Return the URLs in priority order (same logic as main extraction)
+        priority_order = {
+            'creative_thumbnail': 1,
+            'link_data_image': 2,
+            'video_data_image': 3,
+            'direct_field': 4,
+            'deep_search': 5
+        }
+
+        # Classify URLs by priority
+        classified_creatives = []
+        for url in creative_urls:
+            # Simple classification based on URL patterns
+            if 'thumbnail' in url:
+                creative_type = 'creative_thumbnail'
+            elif 'link_data' in url or 'object_story_spec' in url:
+                creative_type = 'link_data_image'
+            elif 'video_data' in url:
+                creative_type = 'video_data_image'
+            else:
+                creative_type = 'direct_field'
+
+            classified_creatives.append({
+                'url': url,
+                'type': creative_type,
+                'size_hint': 100000  # Default size hint
+            })
+
+        # Sort by priority and return just the URLs
+        sorted_creatives = sorted(classified_creatives, key=lambda c: (
+            priority_order.get(c.get('type'), 999),
+            -c.get('size_hint', 0)
+        ))
+
+        sorted_urls = [creative['url'] for creative in sorted_creatives]
+        print(f"🏆 SUCCESS! Apify fallback extracted {len(sorted_urls)} creative URLs for ad {ad_archive_id}")
+        return sorted_urls
+
+    except Exception as e:
+        print(f"❌ Apify fallback failed for ad {ad_archive_id}: {e}")
+        return []
+
+def _get_snapshot_dict(item: dict) -> dict:
+    """Extract snapshot JSON from API response"""
+    snap = item.get("snapshot")
+    if isinstance(snap, str):
+        try:
+            snap = json.loads(snap)
+        except Exception:
+            snap = {}
+    if not isinstance(snap, dict):
+        snap = {}
+    return snap
+
+# Snapshot walk limits: containers nested deeper than this are skipped, and
+# ad-copy keys (plain text, never image URLs) are not descended into
+MAX_SNAPSHOT_DEPTH = 32
+_PRUNED_SNAPSHOT_KEYS = frozenset({
+    'body', 'title', 'caption', 'link_description', 'cta_text', 'cta_type',
+    'display_format', 'page_name', 'byline', 'extra_texts',
+})
+
+# Walk roles: the snapshot["creatives"] list, one of its entries, and snapshot["creative"]
+_ROLE_NONE, _ROLE_CREATIVES, _ROLE_CREATIVE_ENTRY, _ROLE_CREATIVE = range(4)
+
+def _creative_candidate(url: str, source: str, creative_type: str) -> Dict[str, Any]:
+    return {'url': url, 'source': source, 'type': creative_type, 'size_hint': estimate_image_size_from_url(url)}
+
+def _story_image_url(story_spec: dict, key: str) -> Optional[str]:
+    """object_story_spec.<key>.image.url, if present"""
+    data = story_spec.get(key)
+    if isinstance(data, dict) and data.get("image"):
+        img = data["image"]
+        if isinstance(img, dict) and isinstance(img.get("url"), str) and img["url"]:
+            return img["url"]
+    return None
+
+def _creative_field_candidates(creative_obj: dict) -> List[Dict[str, Any]]:
+    """Specific ad creative fields: creative.thumbnail and the object_story_spec images"""
+    found = []
+    thumb = creative_obj.get("thumbnail")
+    if thumb and isinstance(thumb, str) and is_likely_creative_url(thumb):
+        found.append(_creative_candidate(thumb, 'creative.thumbnail', 'creative_thumbnail'))
+
+    # object_story_spec is common in Facebook ads
+    story_spec = creative_obj.get("object_story_spec")
+    if story_spec and isinstance(story_spec, dict):
+        for key, creative_type in (("link_data", "link_data_image"), ("video_data", "video_data_image")):
+            url = _story_image_url(story_spec, key)
+            if url and is_likely_creative_url(url):
+                found.append(_creative_candidate(url, f'creative.object_story_spec.{key}.image.url', creative_type))
+    return found
+
+def _walk_snapshot(snap: dict) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """One iterative pass over the snapshot.
+
+    Returns (creative field candidates, snapshot["creatives"] entry candidates,
+    deep-search candidates), each in the order the separate walks used to
+    produce them: depth-first, dict keys in order, list items by index.
+    """
+    fields: List[Dict[str, Any]] = []
+    entries: List[Dict[str, Any]] = []
+    deep: List[Dict[str, Any]] = []
+    # (value, path, depth, role); string values are pushed only when they mention a Facebook host
+    stack: List[Tuple[Any, str, int, int]] = [(snap, "", 0, _ROLE_NONE)]
+    while stack:
+        obj, path, depth, role = stack.pop()
+        if isinstance(obj, str):
+            if is_likely_creative_url(obj):
+                deep.append(_creative_candidate(obj, path, 'deep_search'))
+            continue
+        if depth > MAX_SNAPSHOT_DEPTH:
+            continue
+        if isinstance(obj, dict):
+            if role == _ROLE_CREATIVE_ENTRY:
+                entries.extend(find_creative_urls_in_object(obj, path))
+            elif role == _ROLE_CREATIVE:
+                fields.extend(_creative_field_candidates(obj))
+            children = []
+            for k, v in obj.items():
+                if k in _PRUNED_SNAPSHOT_KEYS:
+                    continue
+                if isinstance(v, str):
+                    if _CDN_HOST_RE.search(v):
+                        children.append((v, f"{path}.{k}" if path else k, depth, _ROLE_NONE))
+                elif isinstance(v, (dict, list)) and v:
+                    child_role = _ROLE_NONE
+                    if depth == 0 and k == "creatives" and isinstance(v, list):
+                        child_role = _ROLE_CREATIVES
+                    elif depth == 0 and k == "creative" and isinstance(v, dict):
+                        child_role = _ROLE_CREATIVE
+                    children.append((v, f"{path}.{k}" if path else k, depth + 1, child_role))
+            stack.extend(reversed(children))
+        elif isinstance(obj, list):
+            item_role = _ROLE_CREATIVE_ENTRY if role == _ROLE_CREATIVES else _ROLE_NONE
+            for i in range(len(obj) - 1, -1, -1):
+                v = obj[i]
+                if isinstance(v, (dict, list)) and v:
+                    stack.append((v, f"{path}[{i}]", depth + 1, item_role if isinstance(v, dict) else _ROLE_NONE))
+    return fields, entries, deep
+
+def extract_ad_creatives_from_snapshot(item: dict, ad_id: str) -> List[Dict[str, Any]]:
+    """Extract ACTUAL ad creatives (not logos/profile pics) from Facebook ad data
+
+    Candidates come from snapshot["creative"] fields, snapshot["creatives"]
+    entries and a deep search of the whole snapshot, gathered in a single walk.
+    Returned by type priority (CREATIVE_PRIORITY, other types last), first
+    occurrence of each URL kept.
+    """
+    return _creatives_from_snapshot(_get_snapshot_dict(item))
+
+def _creatives_from_snapshot(snap: dict) -> List[Dict[str, Any]]:
+    fields, entries, deep = _walk_snapshot(snap)
+
+    # A stable sort by type priority over (entries, fields, deep) yields: creative
+    # fields, direct entry fields, deep search, then the rest (nested entry objects)
+    direct = [c for c in entries if c['type'] == 'direct_field']
+    nested = [c for c in entries if c['type'] != 'direct_field']
+
+    seen_urls = set()
+    unique_creatives = []
+    for creative in itertools.chain(fields, direct, deep, nested):
+        if creative['url'] not in seen_urls:
+            seen_urls.add(creative['url'])
+            unique_creatives.append(creative)
+
+    return unique_creatives
+
+def select_best_creative(creatives: List[Dict[str, Any]], ad_archive_id: str) -> Dict[str, Any] | None:
+    """Select the best single creative for an ad (highest quality, largest file)"""
+    if not creatives:
+        return None
+
+    # If only one creative, return it
+    if len(creatives) == 1:
+        return creatives[0]
+
+    # Sort by priority: prefer original images over resized, then by file size hint
+    sorted_creatives = _rank_creatives(creatives)
+
+    best_creative = sorted_creatives[0]
+    print(f"     🎯 Selected best creative for ad {ad_archive_id}: {best_creative['url'][:50]}... (type: {best_creative.get('type')}, size: {best_creative.get('size_hint')})")
+    if len(creatives) > 1:
+        print(f"     🗑️  Skipped {len(creatives) - 1} duplicate/resized versions")
+
+    return best_creative
+
+def find_creative_urls_in_object(obj: dict, path: str = "") -> List[Dict[str, Any]]:
+    """Find creative URLs in a specific object"""
+    urls = []
+
+    # Common creative-related keys
+    creative_keys = [
+        'image_url', 'image', 'picture', 'thumbnail', 'creative_url',
+        'media_url', 'asset_url', 'file_url', 'source_url'
+    ]
+
+    for key in creative_keys:
+        if key in obj:
+            value = obj[key]
+            if isinstance(value, str) and ('fbcdn.net' in value or 'facebook.com' in value):
+                urls.append({
+                    'url': value,
+                    'source': f"{path}.{key}",
+                    'type': 'direct_field',
+                    'size_hint': estimate_image_size_from_url(value)
+                })
+            elif isinstance(value, dict) and 'url' in value:
+                url_val = value.get('url')
+                if url_val and ('fbcdn.net' in url_val or 'facebook.com' in url_val):
+                    urls.append({
+                        'url': url_val,
+                        'source': f"{path}.{key}.url",
+                        'type': 'nested_object',
+                        'size_hint': estimate_image_size_from_url(url_val)
+                    })
+
+    return urls
+
+def estimate_image_size_from_url(url: str) -> int:
+    """Estimate image size from URL patterns (rough heuristic)"""
+    # Larger images often have different path patterns
+    if '/t39.' in url:  # Large images
+        return 100000  # ~100KB
+    elif '/t31.' in url:  # Medium images
+        return 50000   # ~50KB
+    elif 'scontent' in url:
+        return 25000   # ~25KB
+    else:
+        return 10000   # ~10KB (smaller, possibly logos)
+
+def _rank_creatives(creatives: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Creatives best first: type priority, then higher size_hint (likely higher quality)"""
+    return sorted(creatives, key=lambda c: (
+        CREATIVE_PRIORITY.get(c.get('type'), 999),
+        -c.get('size_hint', 0)
+    ))
+
+def _item_creatives(apify_item: Union[Dict[str, Any], "AdRecord"], ad_archive_id: str) -> List[Dict[str, Any]]:
+    """Creative candidates of a raw Apify item, or the ones an AdRecord already carries"""
+    if isinstance(apify_item, AdRecord):
+        return apify_item.creatives
+    return extract_ad_creatives_from_snapshot(apify_item, ad_archive_id)
+
+def rank_creative_candidate_urls(apify_item: Union[Dict[str, Any], "AdRecord"], ad_archive_id: str) -> List[str]:
+    """Return an ad's candidate creative URLs, best first (validation order)"""
+    return [creative['url'] for creative in _rank_creatives(_item_creatives(apify_item, ad_archive_id))]
+
+def _is_valid_creative(url: str) -> bool:
+    """Validation-only check (probe by default; CREATIVE_VALIDATION_MODE=full downloads the image)"""
+    return image_fetcher.check_creative_url(url, probe=cv.VALIDATION_MODE == "probe")
+
+def test_and_validate_creative(apify_item: Union[Dict[str, Any], "AdRecord"], ad_archive_id: str,
+                               on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[bool, str]:
+    """Test and validate creative URLs to ensure they're not profile pics/logos - using the test script logic
+
+    `on_progress(checked, total)` is called after each candidate is tested.
+    """
+
+    candidate_urls = rank_creative_candidate_urls(apify_item, ad_archive_id)
+
+    if not candidate_urls:
+        return False, ""
+
+    total_creatives = len(candidate_urls)
+
+    # Try to validate creatives in priority order until we find a real creative (not profile pic)
+    for i, url in enumerate(candidate_urls):
+        # Test the URL without keeping the image (it is fetched again only when saved/generated)
+        found = _is_valid_creative(url)
+        if on_progress:
+            on_progress(i + 1, total_creatives)
+        if found:
+            return True, url  # This is a real creative, not a profile pic!
+
+    # No valid creative found
+    return False, ""
+
+def get_ad_creative_urls_with_fallback(apify_item: Union[Dict[str, Any], "AdRecord"], ad_archive_id: str, apify_token: str, domain: str = "", validated: Optional[Tuple[bool, str]] = None) -> Tuple[bool, List[str]]:
+    """Get creative URLs using the WORKING extraction logic from the test script with validation
+
+    Pass `validated` (a test_and_validate_creative-style result) when the
+    candidates were already checked, e.g. by the concurrent validation pool.
+    """
+
+    # Test and validate creatives to ensure they're not profile pics/logos
+    if validated is None:
+        validated = test_and_validate_creative(apify_item, ad_archive_id)
+    found_valid_creative, valid_url = validated
+
+    if found_valid_creative and valid_url:
+        return True, [valid_url]
+
+    # If no valid creatives found, check if this is one of the problematic domains
+    fallback_domains = {"CAREERSEEKING.CO", "HEALTHANDWEALTHGUIDE.COM", "INFORMATIONSPHERE.CO"}
+    if domain.upper() in fallback_domains:
+        print(f"🔄 No valid images found in primary data for ad {ad_archive_id} ({domain}), trying fallback...")
+        # For now, disable the broken fallback
+        print(f"⚠️  Fallback temporarily disabled - primary extraction should work better")
+        # fallback_urls = scrape_facebook_ad_creative_with_apify(ad_archive_id, apify_token)
+        # if fallback_urls:
+        #     return True, fallback_urls
+
+    print(f"💥 No valid creatives found for ad {ad_archive_id} ({domain})")
+    return False, []
+
+# =============================================================================
+# DATE FILTERING HELPER
+# =============================================================================
+
+def is_date_in_range(date_str: str, start_date: date, end_date: date) -> bool:
+    """Check if date falls within selected date range"""
+    if not date_str:
+        return True
+    
+    try:
+        if 'T' in date_str:
+            ad_date = datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
+        else:
+            ad_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        
+        return start_date <= ad_date <= end_date
+    except Exception:
+        return True
+
+# =============================================================================
+# IMAGE EXTRACTION LOGIC
+# =============================================================================
+
+def get_original_image_url(item: dict) -> str | None:
+    """Extract image URL using comprehensive logic"""
+    return _original_image_url(item, _get_snapshot_dict(item))
+
+def _original_image_url(item: dict, snap: dict) -> str | None:
+
+    # Try multiple sources for images
+    imgs = snap.get("images")
+    if isinstance(imgs, dict):
+        imgs = [imgs]
+    elif not isinstance(imgs, (list, tuple)):
+        imgs = []
+
+    # Look through image objects
+    for im in imgs:
+        if not isinstance(im, dict):
+            continue
+        # Try multiple keys in order of preference
+        for k in ("original_image_url", "original_picture_url", "original_picture", "resized_image_url",
+                  "resized_picture_url", "url", "src", "uri", "secure_url"):
+            v = im.get(k)
+            if v and isinstance(v, str) and v.strip():
+                return v.strip()
+
+    # Fallback: look in other places in the snapshot
+    fallback_keys = ["image_url", "picture_url", "picture", "thumbnail_url", "thumbnail",
+                    "photo_url", "media_url", "creative_url"]
+
+    for key in fallback_keys:
+        v = snap.get(key)
+        if v and isinstance(v, str) and v.strip():
+            return v.strip()
+
+    # Last resort: look at top level of item
+    top_level_keys = ["original_image_url", "image_url", "imageUrl", "picture", "thumbnailUrl", "creative_url"]
+    for key in top_level_keys:
+        v = item.get(key)
+        if v and isinstance(v, str) and v.strip():
+            return v.strip()
+
+    return None
+
+def extract_selected_fields(item: dict) -> dict:
+    """Extract fields using original code logic"""
+    return _selected_fields(item, _get_snapshot_dict(item))
+
+def _selected_fields(item: dict, snap: dict) -> dict:
+
+    card0 = None
+    cards = snap.get("cards")
+    if isinstance(cards, list) and cards:
+        if isinstance(cards[0], dict):
+            card0 = cards[0]
+    elif isinstance(cards, dict):
+        card0 = cards
+    
+    pgcat0 = None
+    page_categories = snap.get("page_categories")
+    if isinstance(page_categories, list) and page_categories:
+        if isinstance(page_categories[0], dict):
+            pgcat0 = page_categories[0]
+    elif isinstance(page_categories, dict):
+        pgcat0 = page_categories
+    
+    link_url = snap.get("link_url")
+    if not link_url and isinstance(card0, dict):
+        link_url = card0.get("link_url")
+    
+    display_url = snap.get("caption")
+    website_url = snap.get("link_url") or snap.get("website") or snap.get("url")
+    
+    categories = item.get("categories")
+    if isinstance(categories, (list, tuple)):
+        categories_disp = ", ".join(str(c) for c in categories)
+    else:
+        categories_disp = categories
+    
+    image_url = _original_image_url(item, snap)
+    if not image_url:
+        img_keys = ["imageUrl", "image_url", "thumbnailUrl", "thumbnail_url", "image"]
+        for k in img_keys:
+            if item.get(k):
+                image_url = item[k]
+                break
+    
+    video_url = None
+    videos = snap.get("videos")
+    if isinstance(videos, dict):
+        videos = [videos]
+    elif not isinstance(videos, (list, tuple)):
+        videos = []
+    
+    for vid in videos:
+        if not isinstance(vid, dict):
+            continue
+        for k in ("video_hd_url", "video_sd_url", "video_preview_url", "url", "src"):
+            v = vid.get(k)
+            if v:
+                video_url = v
+                break
+        if video_url:
+            break
+    
+    if not video_url:
+        vid_keys = ["videoUrl", "video_url", "video", "video_hd_url", "video_sd_url"]
+        for k in vid_keys:
+            if item.get(k):
+                video_url = item[k]
+                break
+            if snap.get(k):
+                video_url = snap[k]
+                break
+    
+    return {
+        "ad_archive_id": item.get("ad_archive_id") or item.get("adId"),
+        "categories": categories_disp,
+        "collation_count": item.get("collation_count"),
+        "collation_id": item.get("collation_id"),
+        "start_date": item.get("start_date") or item.get("startDate"),
+        "end_date": item.get("end_date") or item.get("endDate"),
+        "entity_type": item.get("entity_type"),
+        "is_active": item.get("is_active"),
+        "page_id": item.get("page_id") or item.get("pageId"),
+        "page_name": item.get("page_name") or item.get("pageName"),
+        "cta_text": (card0.get("cta_text") if isinstance(card0, dict) else None) or snap.get("cta_text"),
+        "cta_type": (card0.get("cta_type") if isinstance(card0, dict) else None) or snap.get("cta_type"),
+        "link_url": link_url,
+        "display_url": display_url,
+        "website_url": website_url,
+        "page_entity_type": (pgcat0.get("page_entity_type") if isinstance(pgcat0, dict) else None) or item.get("page_entity_type"),
+        "page_profile_picture_url": item.get("page_profile_picture_url") or snap.get("page_profile_picture_url"),
+        "page_profile_uri": item.get("page_profile_uri") or snap.get("page_profile_uri"),
+        "state_media_run_label": item.get("state_media_run_label"),
+        "total_active_time": item.get("total_active_time"),
+        "original_image_url": image_url,
+        "video_url": video_url,
+    }
+
+# =============================================================================
+# NORMALIZED AD RECORDS
+# =============================================================================
+
+# extract_selected_fields keys, in the order the UI and save_ad_to_table see them
+AD_FIELDS = (
+    "ad_archive_id", "categories", "collation_count", "collation_id", "start_date", "end_date",
+    "entity_type", "is_active", "page_id", "page_name", "cta_text", "cta_type", "link_url",
+    "display_url", "website_url", "page_entity_type", "page_profile_picture_url", "page_profile_uri",
+    "state_media_run_label", "total_active_time", "original_image_url", "video_url",
+)
+
+class AdRecord:
+    """One Apify item parsed once: the selected fields, the creative candidates and the input URLs.
+
+    Built by parse_ad_item; the raw item and its snapshot are not kept.
+    Every AD_FIELDS key is an attribute; to_dict() gives the plain dict the
+    UI, save_ad_to_table and the ZIP export consume.
+    """
+
+    __slots__ = AD_FIELDS + ("creatives", "source_urls")
+
+    creatives: List[Dict[str, Any]]  # extraction order; ranked_creative_urls() for validation order
+    source_urls: Tuple[str, ...]  # search URL(s) the actor echoed back (_ITEM_URL_FIELDS order)
+
+    def __init__(self, fields: Dict[str, Any], creatives: List[Dict[str, Any]], source_urls: Tuple[str, ...] = ()):
+        for name in AD_FIELDS:
+            setattr(self, name, fields.get(name))
+        self.creatives = creatives
+        self.source_urls = source_urls
+
+    def ranked_creative_urls(self) -> List[str]:
+        return rank_creative_candidate_urls(self, self.ad_archive_id or "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in AD_FIELDS}
+
+    def __repr__(self) -> str:
+        return f"AdRecord({self.ad_archive_id!r}, {self.page_name!r}, {len(self.creatives)} creative(s))"
+
+def parse_ad_item(item: Dict[str, Any]) -> AdRecord:
+    """Normalize a raw Apify item: the snapshot is decoded (json.loads if it's a string) exactly once"""
+    snap = _get_snapshot_dict(item)
+    source_urls = tuple(item[f] for f in _ITEM_URL_FIELDS if isinstance(item.get(f), str) and item[f])
+    return AdRecord(_selected_fields(item, snap), _creatives_from_snapshot(snap), source_urls)
+
+# Item fields the actor may use to echo the input URL an ad came from
+_ITEM_URL_FIELDS = ("url", "inputUrl", "input_url", "search_url")
+
+# =============================================================================
+# SCRAPING FUNCTION
+# =============================================================================
+
+APIFY_ACTOR = "curious_coder/facebook-ads-library-scraper"
+
+# Fan-out searches: one actor run per query on a pool ("concurrent"), or every
+# query URL in a single actor run ("single_run", one start-up cost, shared timing)
+FANOUT_MODES = ("concurrent", "single_run")
+FANOUT_MODE = os.getenv("APIFY_FANOUT_MODE", "concurrent").strip().lower()
+FANOUT_CONCURRENCY = int(os.getenv("APIFY_FANOUT_CONCURRENCY", "4"))
+
+# Dataset items per list_items request; each page is parsed and validated while the next one downloads
+DATASET_PAGE_SIZE = max(1, int(os.getenv("APIFY_DATASET_PAGE_SIZE", "25")))
+
+# Start the actor without waiting for it and read items as it appends them (polling its status
+# with backoff), instead of a blocking call() followed by reading the finished dataset
+APIFY_INCREMENTAL_READS = os.getenv("APIFY_INCREMENTAL_READS", "true").strip().lower() not in ("0", "false", "no")
+APIFY_POLL_INITIAL = float(os.getenv("APIFY_POLL_INITIAL", "0.5"))
+APIFY_POLL_MAX = float(os.getenv("APIFY_POLL_MAX", "2"))
+_RUN_TERMINAL_STATES = ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT")
+
+def build_ads_library_url(
+    domain: str,
+    country: str = "US",
+    exact_phrase: bool = False,
+    active_status: str = "active",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> str:
+    """Ads Library search URL for one domain in one country"""
+    if exact_phrase:
+        domain_query = f'"{domain.strip()}"'
+        search_type = "keyword_exact_phrase"
+    else:
+        domain_query = domain.strip()
+        search_type = "keyword_unordered"
+    
+    domain_encoded = quote_plus(domain_query)
+    
+    url = (
+        f"https://www.facebook.com/ads/library/?"
+        f"active_status={active_status}&"
+        f"ad_type=all&"
+        f"country={country.upper()}&"
+        f"is_targeted_country=false&"
+        f"media_type=all&"
+        f"q={domain_encoded}&"
+        f"search_type={search_type}"
+    )
+    
+    if start_date and end_date:
+        url += f"&start_date[min]={start_date.strftime('%Y-%m-%d')}"
+        url += f"&start_date[max]={end_date.strftime('%Y-%m-%d')}"
+    return url
+
+def _run_input(urls: List[str], count: int, active_status: str) -> Dict[str, Any]:
+    """Actor input for one run over `urls` (the actor applies `count` per URL)"""
+    return {
+        "urls": [{"url": url, "method": "GET"} for url in urls],
+        "count": int(count),
+        "scrapeAdDetails": True,
+        "scrapePageAds.activeStatus": active_status,
+        "period": ""
+    }
+
+def _call_actor(client: ApifyClient, urls: List[str], count: int, active_status: str) -> str:
+    """One actor run over `urls`; blocks until it finishes, returns its dataset id"""
+    run = client.actor(APIFY_ACTOR).call(run_input=_run_input(urls, count, active_status))
+    dataset_id = run.get("defaultDatasetId")
+    if not dataset_id:
+        raise Exception("No dataset ID returned from Apify")
+    return dataset_id
+
+def _start_actor(client: ApifyClient, urls: List[str], count: int, active_status: str) -> Dict[str, Any]:
+    """Start one actor run over `urls` and return the run (id, status, defaultDatasetId) without waiting"""
+    run = client.actor(APIFY_ACTOR).start(run_input=_run_input(urls, count, active_status))
+    if not run or not run.get("id") or not run.get("defaultDatasetId"):
+        raise Exception("No run or dataset ID returned from Apify")
+    return run
+
+def iter_dataset_pages(client: ApifyClient, dataset_id: str, page_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """A finished dataset's items, one list_items page (`page_size`, default DATASET_PAGE_SIZE) at a time"""
+    page_size = max(1, page_size or DATASET_PAGE_SIZE)
+    dataset = client.dataset(dataset_id)
+    offset = 0
+    while True:
+        page = dataset.list_items(offset=offset, limit=page_size)
+        if not page.items:
+            return
+        yield page.items
+        offset += max(page.count or 0, len(page.items))
+        if page.total is not None and offset >= page.total:
+            return
+
+def iter_run_pages(
+    client: ApifyClient,
+    run: Dict[str, Any],
+    page_size: Optional[int] = None,
+    poll_initial: Optional[float] = None,
+    poll_max: Optional[float] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Pages of a started run's dataset as the actor appends them, read from a running offset.
+
+    Each round takes the run's status, then drains every item past the offset
+    (pages of `page_size`); once a round began with a finished status, the
+    dataset is complete and iteration stops. Between rounds the status poll
+    waits APIFY_POLL_INITIAL seconds, doubling up to APIFY_POLL_MAX while no
+    new items arrive. A run that doesn't succeed is reported, and the items
+    it produced are still yielded.
+    """
+    page_size = max(1, page_size or DATASET_PAGE_SIZE)
+    initial = APIFY_POLL_INITIAL if poll_initial is None else poll_initial
+    ceiling = max(initial, APIFY_POLL_MAX if poll_max is None else poll_max)
+    run_client = client.run(run["id"])
+    dataset = client.dataset(run["defaultDatasetId"])
+    offset = 0
+    delay = initial
+    while True:
+        status = run.get("status")
+        finished = status in _RUN_TERMINAL_STATES
+        before = offset
+        while True:
+            page = dataset.list_items(offset=offset, limit=page_size)
+            if page.items:
+                yield page.items
+                offset += max(page.count or 0, len(page.items))
+            if len(page.items) < page_size:
+                break
+        if finished:
+            break
+        delay = initial if offset > before else min(delay * 2, ceiling)
+        time.sleep(delay)
+        run = run_client.get() or run
+    if status != "SUCCEEDED":
+        print(f"⚠️ Apify run {run['id']} ended {status}; using the {offset} item(s) it produced")
+
+def _actor_pages(client: ApifyClient, urls: List[str], count: int, active_status: str,
+                 page_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Run the actor over `urls` and return its dataset pages, read in the background.
+
+    With APIFY_INCREMENTAL_READS pages arrive while the actor is still
+    scraping; otherwise after a blocking call(). Starting the run happens
+    here, so start errors are raised by this call rather than on iteration.
+    """
+    if APIFY_INCREMENTAL_READS:
+        run = _start_actor(client, urls, count, active_status)
+        return _prefetch(iter_run_pages(client, run, page_size))
+    dataset_id = _call_actor(client, urls, count, active_status)
+    return _prefetch(iter_dataset_pages(client, dataset_id, page_size))
+
+_T = TypeVar("_T")
+
+def _prefetch(pages: Iterable[_T], depth: int = 1) -> Iterator[_T]:
+    """Iterate `pages` on a background thread, up to `depth` pages ahead of the consumer.
+
+    Errors are re-raised in the consumer; closing the generator stops the reader.
+    """
+    ready: "queue.Queue[Tuple[Any, Optional[BaseException]]]" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    end = object()
+
+    def _put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read():
+        try:
+            for page in pages:
+                if not _put((page, None)):
+                    return
+            _put((end, None))
+        except BaseException as e:
+            _put((end, e))
+
+    reader = threading.Thread(target=_read, name="apify-dataset-prefetch", daemon=True)
+    reader.start()
+    try:
+        while True:
+            page, error = ready.get()
+            if page is end:
+                if error is not None:
+                    raise error
+                return
+            yield page
+    finally:
+        stop.set()
+
+def _in_date_range(record: AdRecord, start_date: Optional[date], end_date: Optional[date]) -> bool:
+    """Whether an ad's start date is inside the range (always, without a range or a start date)"""
+    if start_date and end_date:
+        start_date_str = record.start_date
+        if start_date_str and not is_date_in_range(start_date_str, start_date, end_date):
+            return False
+    return True
+
+def _select_items(items: Iterable[Dict[str, Any]], start_date: Optional[date], end_date: Optional[date]) -> List[AdRecord]:
+    """Parsed records for the items inside the date range"""
+    kept = []
+    for item in items:
+        record = parse_ad_item(item)
+        if _in_date_range(record, start_date, end_date):
+            kept.append(record)
+    return kept
+
+def _validate_creatives(
+    kept: List[Tuple[AdRecord, str]],
+    apify_token: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Validate every ad's creative candidates; returns the ads' field dicts with
+    creative_found/creative_urls/creative_url set.
+
+    `kept` holds (record, searched domain) pairs.
+    """
+    # Validate every ad's creative candidates concurrently (results keep input order)
+    candidate_lists = [record.ranked_creative_urls() if record.ad_archive_id else [] for record, _ in kept]
+    started = time.perf_counter()
+    validations = cv.validate_candidates_concurrently(candidate_lists, _is_valid_creative, on_progress=on_progress)
+    print(f"⏱️ Validated creatives for {len(kept)} ads in {time.perf_counter() - started:.1f}s")
+
+    processed_items = []
+    for (record, domain), validated in zip(kept, validations):
+        processed_item = record.to_dict()
+        # Get creative URLs for this ad (validated candidates + fallback scraping)
+        ad_archive_id = record.ad_archive_id
+        if ad_archive_id:
+            creative_found, creative_urls = get_ad_creative_urls_with_fallback(record, ad_archive_id, apify_token, domain, validated=validated)
+            processed_item["creative_found"] = creative_found
+            processed_item["creative_urls"] = creative_urls
+            processed_item["creative_url"] = creative_urls[0] if creative_urls else None
+
+            # Debug logging
+            if creative_found and creative_urls:
+                print(f"🎨 Ad {ad_archive_id} ({domain}): Found {len(creative_urls)} creative URLs")
+                print(f"   Display URL set to: {creative_urls[0][:100]}...")
+            elif creative_found is False:
+                print(f"❌ Ad {ad_archive_id} ({domain}): No creative URLs found")
+            else:
+                print(f"⚠️ Ad {ad_archive_id} ({domain}): creative_found is None")
+
+        processed_items.append(processed_item)
+    
+    return processed_items
+
+def _log_fetch_stats():
+    fetch_stats = image_fetcher.stats.snapshot()
+    print(f"🔌 Image fetch connections: {fetch_stats['requests']} requests, "
+          f"{fetch_stats['new_connections']} new, reuse rate {fetch_stats['reuse_rate']:.0%}")
+    cache_stats = image_cache.stats()
+    print(f"🗄️ Image cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['entries']} blobs ({cache_stats['bytes'] / 1048576:.1f} MB)")
+
+def _attach_creatives(
+    kept: List[Tuple[AdRecord, str]],
+    apify_token: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Dict[str, Any]]:
+    """_validate_creatives over a whole result set, then the fetch/cache stats"""
+    ads = _validate_creatives(kept, apify_token, on_progress)
+    _log_fetch_stats()
+    return ads
+
+def stream_facebook_ads_scrape(
+    apify_token: str,
+    domain: str,
+    count: int = 10,
+    country: str = "US",
+    exact_phrase: bool = False,
+    active_status: str = "active",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    page_size: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Run domain search via Apify and yield ads as soon as their dataset page is validated
+
+    The dataset is read `page_size` items at a time (default
+    DATASET_PAGE_SIZE) with the next page downloading in the background, so
+    only about two pages of raw items are in memory at once; with
+    APIFY_INCREMENTAL_READS the pages are read while the actor is still
+    running. Each page is parsed, date-filtered and validated before its ads
+    are yielded.
+    `on_progress(validated, seen)` counts ads validated so far against ads
+    kept so far. Apify errors are raised; ads yielded before an error stay valid.
+    """
+    url = build_ads_library_url(domain, country, exact_phrase, active_status, start_date, end_date)
+    pages = _actor_pages(ApifyClient(apify_token), [url], count, active_status, page_size)
+    tally = {"validated": 0, "kept": 0}
+
+    def _page_progress(done: int, total: int):
+        if on_progress:
+            on_progress(tally["validated"] + done, tally["kept"])
+
+    try:
+        for items in pages:
+            records = _select_items(items, start_date, end_date)
+            tally["kept"] += len(records)
+            ads = _validate_creatives([(record, domain) for record in records], apify_token, _page_progress)
+            tally["validated"] += len(records)
+            yield from ads
+    finally:
+        pages.close()
+    _log_fetch_stats()
+
+def run_facebook_ads_scrape(
+    apify_token: str,
+    domain: str,
+    count: int = 10,
+    country: str = "US",
+    exact_phrase: bool = False,
+    active_status: str = "active",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Run domain search via Apify
+
+    `on_progress(validated, total)` reports creative validation as ads finish.
+    Apify errors are raised; callers decide how to surface them.
+    """
+    return list(stream_facebook_ads_scrape(apify_token, domain, count, country, exact_phrase, active_status,
+                                           start_date, end_date, on_progress=on_progress))
+
+# =============================================================================
+# FAN-OUT SEARCH (many domains × countries)
+# =============================================================================
+
+def _search_records(client: ApifyClient, urls: List[str], count: int, active_status: str,
+                    start_date: Optional[date], end_date: Optional[date]) -> Tuple[int, List[AdRecord]]:
+    """One actor run; its dataset is parsed and date-filtered page by page. Returns (items read, kept records)"""
+    items = 0
+    kept: List[AdRecord] = []
+    for page in _actor_pages(client, urls, count, active_status):
+        items += len(page)
+        kept.extend(_select_items(page, start_date, end_date))
+    return items, kept
+
+def _query_label(query: Dict[str, Any]) -> str:
+    return f"{query['domain']}/{query['country']}"
+
+def _link_host(value: Any) -> str:
+    """Lower-case host of a URL or bare domain ("acme.com/p", "https://www.acme.com"), "" if there is none"""
+    value = str(value or "").strip()
+    if not value:
+        return ""
+    return (urlparse(value if "://" in value else f"//{value}").hostname or "").lower()
+
+def _attribute_item(record: AdRecord, queries: List[Dict[str, Any]],
+                    by_url: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Which query a single-run item came from: the echoed input URL, else the one query whose
+    domain is the host (or a parent domain of the host) of the item's links.
+
+    None when nothing matches or several queries do (e.g. one domain searched in several
+    countries), rather than guessing.
+    """
+    for url in record.source_urls:
+        query = by_url.get(url)
+        if query:
+            return query
+    hosts = {host for host in map(_link_host, (record.link_url, record.display_url, record.website_url)) if host}
+    matches = []
+    for query in queries:
+        domain = _link_host(query["domain"])
+        if domain and any(host == domain or host.endswith("." + domain) for host in hosts):
+            matches.append(query)
+    return matches[0] if len(matches) == 1 else None
+
+def run_facebook_ads_fanout(
+    apify_token: str,
+    domains: List[str],
+    countries: List[str],
+    count: int = 10,
+    exact_phrase: bool = False,
+    active_status: str = "active",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    mode: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    on_query: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Search every domain × country, merge the ads and dedup them by ad_archive_id.
+
+    `mode` (default APIFY_FANOUT_MODE) is "concurrent" (one actor run per
+    query, up to `max_concurrency` at once) or "single_run" (all query URLs in
+    one actor run; items are attributed to queries by URL or domain, and every
+    query reports the run's duration). Creative validation then runs once over
+    the merged, deduplicated ads.
+
+    Returns {"ads", "queries", "duplicates", "unattributed",
+    "scrape_seconds", "validation_seconds", "seconds"}. Each query entry has
+    domain, country, url, items (dataset items), kept (inside the date
+    range), new (ads not already found by an earlier query), seconds and
+    error. `unattributed` counts single-run items that matched no query;
+    their ads are still returned, with empty matched_queries. A failed query is reported there and doesn't stop the
+    others. `on_query(query)` is called from the calling thread as each query
+    finishes, before the merge (so `new` is only final in the result).
+    """
+    mode = (mode or FANOUT_MODE).strip().lower()
+    if mode not in FANOUT_MODES:
+        raise ValueError(f"Unknown fan-out mode {mode!r}; expected one of {', '.join(FANOUT_MODES)}")
+    queries: List[Dict[str, Any]] = []
+    seen_urls = set()
+    for domain in domains:
+        for country in countries:
+            url = build_ads_library_url(domain, country, exact_phrase, active_status, start_date, end_date)
+            if url not in seen_urls:
+                seen_urls.add(url)
+                queries.append({"domain": domain.strip(), "country": country.upper(), "url": url,
+                                "items": 0, "kept": 0, "new": 0, "seconds": 0.0, "error": None})
+    client = ApifyClient(apify_token)
+    started = time.perf_counter()
+    per_query: Dict[str, List[AdRecord]] = {q["url"]: [] for q in queries}
+    unattributed: List[AdRecord] = []
+    unattributed_items = 0
+
+    if mode == "single_run":
+        try:
+            # Every item is attributed (date-filtered ones too), so `items` counts the dataset per query
+            records = [parse_ad_item(item) for page in _actor_pages(client, [q["url"] for q in queries], count,
+                                                                    active_status) for item in page]
+        except Exception as e:
+            records = []
+            for q in queries:
+                q["error"] = str(e)
+        run_seconds = time.perf_counter() - started
+        by_url = {q["url"]: q for q in queries}
+        for record in records:
+            query = _attribute_item(record, queries, by_url)
+            if query is None:
+                unattributed_items += 1
+            else:
+                query["items"] += 1
+            if _in_date_range(record, start_date, end_date):
+                (unattributed if query is None else per_query[query["url"]]).append(record)
+        if unattributed_items:
+            print(f"⚠️ {unattributed_items} item(s) could not be matched to a query; reported as unattributed")
+        for q in queries:
+            q["kept"] = len(per_query[q["url"]])
+            q["seconds"] = run_seconds
+            if on_query:
+                on_query(q)
+    else:
+        def _search(query):
+            t0 = time.perf_counter()
+            try:
+                items, kept = _search_records(client, [query["url"]], count, active_status, start_date, end_date)
+                return items, kept, None, time.perf_counter() - t0
+            except Exception as e:
+                return 0, [], e, time.perf_counter() - t0
+
+        workers = max(1, min(len(queries) or 1, max_concurrency or FANOUT_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="apify-fanout") as pool:
+            futures = {pool.submit(_search, q): q for q in queries}
+            for future in as_completed(futures):
+                query = futures[future]
+                items, kept, error, seconds = future.result()
+                per_query[query["url"]] = kept
+                query.update(items=items, kept=len(kept), seconds=seconds, error=str(error) if error else None)
+                print(f"{'❌' if error else '🔎'} {_query_label(query)}: {items} ad(s) in {seconds:.1f}s"
+                      + (f" ({error})" if error else ""))
+                if on_query:
+                    on_query(query)
+    scrape_seconds = time.perf_counter() - started
+
+    # Merge in query order so results are stable whatever order the runs finished in
+    merged: List[Tuple[AdRecord, str]] = []
+    matched: List[List[str]] = []
+    by_ad_id: Dict[str, List[str]] = {}
+    duplicates = 0
+    groups = [(query, per_query[query["url"]]) for query in queries] + [(None, unattributed)]
+    for query, records in groups:
+        label = _query_label(query) if query else None
+        for record in records:
+            ad_id = record.ad_archive_id
+            if ad_id and ad_id in by_ad_id:
+                duplicates += 1
+                if label:
+                    by_ad_id[ad_id].append(label)
+                continue
+            labels = [label] if label else []
+            if ad_id:
+                by_ad_id[ad_id] = labels
+            if query:
+                query["new"] += 1
+            merged.append((record, query["domain"] if query else ""))
+            matched.append(labels)
+
+    validation_started = time.perf_counter()
+    ads = _attach_creatives(merged, apify_token, on_progress)
+    for ad, labels in zip(ads, matched):
+        ad["matched_queries"] = labels
+    validation_seconds = time.perf_counter() - validation_started
+    print(f"🧮 Fan-out: {len(queries)} quer(ies), {len(ads)} unique ad(s), {duplicates} duplicate(s) "
+          f"in {scrape_seconds:.1f}s scrape + {validation_seconds:.1f}s validation ({mode})")
+    return {
+        "ads": ads,
+        "queries": queries,
+        "duplicates": duplicates,
+        "unattributed": unattributed_items,
+        "scrape_seconds": scrape_seconds,
+        "validation_seconds": validation_seconds,
+        "seconds": time.perf_counter() - started,
+    }
@@ -4,19 +4,12 @@ Fixed version with working save functionality and real-time table creation
 """
 
 import streamlit as st
-import json
-import sqlite3
 import os
-from datetime import datetime, timedelta, timezone, date
-from apify_client import ApifyClient
+from datetime import timedelta, timezone, date
 from typing import List, Dict, Any, Optional, Tuple
-from urllib.parse import quote_plus
 import time
-import hashlib
-from io import BytesIO
 import zipfile
-import requests
-import re
+from functools import partial
 from bs4 import BeautifulSoup
 # =============================================================================
 # COUNTRY LIST (ISO 3166-1 alpha-2)
@@ -77,605 +70,27 @@ COUNTRY_NAME_BY_CODE: dict[str, str] = {code: name for code, name in COUNTRIES}
 # IMAGE FETCH HELPER (robust against CDN timeouts)
 # =============================================================================
 
-def _fetch_image_bytes(url: str, *, timeout: float = 10.0, retries: int = 3, save_path: str | None = None) -> bytes | None:
-    """Download image bytes with robust retry and comprehensive headers.
-
-    Returns None on failure.
-    """
-    if not url or not isinstance(url, str):
-        return None
-
-    # Clean and validate URL
-    url = url.strip()
-    if not url.startswith(('http://', 'https://')):
-        return None
-
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
-        ),
-        "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Referer": "https://www.facebook.com/ads/library/",
-        "Cache-Control": "no-cache",
-        "Pragma": "no-cache",
-        "Sec-Fetch-Dest": "image",
-        "Sec-Fetch-Mode": "no-cors",
-        "Sec-Fetch-Site": "cross-site",
-    }
-
-    last_err: Exception | None = None
-    for attempt in range(1, retries + 1):
-        try:
-            resp = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-            resp.raise_for_status()
-
-            # Check content type
-            ct = resp.headers.get("Content-Type", "").lower()
-            content_length = len(resp.content)
-
-            # Accept various image types
-            valid_types = ["image/", "application/octet-stream"]
-            is_valid_type = any(ct.startswith(vt) for vt in valid_types)
-
-            # Also check file extensions
-            url_lower = url.lower()
-            has_image_ext = any(url_lower.endswith(ext) for ext in [".png", ".jpg", ".jpeg", ".webp", ".gif", ".svg", ".bmp"])
-
-            if not (is_valid_type or has_image_ext):
-                last_err = RuntimeError(f"Unexpected content-type: {ct}, size: {content_length}")
-                continue
-
-            if content_length < 5000:  # Creatives should be much larger than profile pics (5KB+)
-                last_err = RuntimeError(f"Content too small for creative: {content_length} bytes")
-                continue
-
-            # Save to file if path provided
-            if save_path:
-                try:
-                    with open(save_path, 'wb') as f:
-                        f.write(resp.content)
-                    print(f"💾 Saved creative to: {save_path}")
-                except Exception as e:
-                    print(f"❌ Failed to save to {save_path}: {e}")
-                    return None
-
-            return resp.content
-
-        except Exception as e:  # noqa: BLE001
-            last_err = e
-            if attempt < retries:
-                import time
-                time.sleep(1)  # Brief pause between retries
-            continue
-
-    # Don't show warnings for validation attempts (save_path=None)
-    # Only show warnings if we're actually trying to save/display an image
-    if save_path is not None:
-        try:
-            import streamlit as _st  # local import to avoid circulars
-            _st.warning(f"Image fetch failed: {url[:50]}... ({str(last_err)[:50]})")
-        except Exception:
-            pass
-    return None
+try:
+    from .image_fetcher import fetch_image_bytes as _fetch_image_bytes  # when packaged
+except Exception:
+    from image_fetcher import fetch_image_bytes as _fetch_image_bytes  # when run directly
+try:
+    from . import zip_export  # when packaged
+    from . import generation_worker
+except Exception:
+    import zip_export  # when run directly
+    import generation_worker
 
 # =============================================================================
-# CREATIVE EXTRACTION FUNCTIONS
+# SEARCH & CREATIVE EXTRACTION (see ads_search.py)
 # =============================================================================
 
-def is_likely_creative_url(url: str) -> bool:
-    """Check if URL is likely to be an ad creative (not logo/profile pic)"""
-    if not ('fbcdn.net' in url or 'facebook.com' in url or 'fbsbx.com' in url):
-        return False
-
-    # Exclude obvious non-creative URLs
-    exclude_patterns = [
-        'icon', 'avatar', 'emoji', 'badge', '1x1', 'pixel', 'spinner',
-        '/photos/', '/profile/', '/pages/', '/groups/', '/events/',
-        'logo', 'brand', 'company', 'profile_picture', 'page_profile',
-        'thumbnail', 'small', 'tiny',
-        'video', '.mp4', 'video_hd_url', 'video_preview_image_url'  # Skip video URLs
-    ]
-
-    if any(pattern in url.lower() for pattern in exclude_patterns):
-        return False
-
-    # Include patterns that suggest creatives
-    include_patterns = [
-        'scontent',  # Static content CDN
-        '/t39.', '/t31.',  # Facebook image size indicators
-        'creative', 'ad', 'campaign'
-    ]
-
-    return any(pattern in url.lower() for pattern in include_patterns)
-
-
-def download_ad_creative(apify_item: Dict[str, Any], ad_archive_id: str) -> bool:
-    """Download the best creative for an ad using multi-attempt logic"""
-    if not apify_item:
-        return False
-
-    # Extract creatives using our enhanced logic
-    creatives = extract_ad_creatives_from_snapshot(apify_item, ad_archive_id)
-
-    if not creatives:
-        return False
-
-    # Sort creatives by priority (best first)
-    priority_order = {
-        'creative_thumbnail': 1,
-        'link_data_image': 2,
-        'video_data_image': 3,
-        'direct_field': 4,
-        'deep_search': 5
-    }
-
-    sorted_creatives = sorted(creatives, key=lambda c: (
-        priority_order.get(c.get('type'), 999),
-        -c.get('size_hint', 0)  # Higher size_hint first (likely higher quality)
-    ))
-
-    # Try to download creatives in priority order until one succeeds
-    safe_id = re.sub(r'[^\w\-_]', '_', ad_archive_id)
-    save_path = f"creative_{safe_id}.png"
-
-    for i, creative in enumerate(sorted_creatives, 1):
-        url = creative['url']
-
-        # Try to download
-        image_data = _fetch_image_bytes(url, save_path=save_path)
-
-        if image_data:
-            print(f"🏆 Got creative for ad {ad_archive_id} on attempt {i}")
-            return True
-        else:
-            print(f"❌ Creative attempt {i} failed for ad {ad_archive_id}")
-
-    print(f"💥 All {len(sorted_creatives)} creatives failed for ad {ad_archive_id}")
-    return False
-
-def scrape_facebook_ad_creative_with_apify(ad_archive_id: str, apify_token: str) -> List[str]:
-    """Fallback: Use Apify to scrape individual Facebook Ads Library page for creative image"""
-    try:
-        print(f"🔄 FALLBACK: Using Apify to scrape Facebook page for ad {ad_archive_id}...")
-
-        # Construct Facebook Ads Library URL for this specific ad
-        fb_url = f"https://www.facebook.com/ads/library/?id={ad_archive_id}"
-
-        # Use Apify's Facebook Ads Library scraper to get detailed ad data
-        client = ApifyClient(apify_token)
-
-        run_input = {
-            "urls": [{"url": fb_url, "method": "GET"}],
-            "count": 1,  # We only want this specific ad
-            "scrapeAdDetails": True,
-            "scrapePageAds.activeStatus": "all",
-            "period": ""
-        }
-
-        run = client.actor("curious_coder/facebook-ads-library-scraper").call(run_input=run_input)
-        dataset_id = run.get("defaultDatasetId")
-        if not dataset_id:
-            print(f"❌ No dataset ID returned from Apify fallback for ad {ad_archive_id}")
-            return []
-
-        items = list(client.dataset(dataset_id).iterate_items())
-
-        print(f"📊 Fallback returned {len(items)} items:")
-        for i, item in enumerate(items):
-            item_id = item.get('ad_archive_id', 'NO_ID')
-            print(f"   {i+1}. Ad ID: {item_id}")
-
-        if not items:
-            print(f"❌ No items returned from Apify fallback for ad {ad_archive_id}")
-            return []
-
-        # Find the item with the correct ad_archive_id
-        fallback_item = None
-        for item in items:
-            if item.get('ad_archive_id') == ad_archive_id:
-                fallback_item = item
-                break
-
-        # If we didn't find the exact ad, try the first item as fallback
-        if not fallback_item:
-            print(f"⚠️  Exact ad {ad_archive_id} not found in fallback results, using first item")
-            fallback_item = items[0]
-
-        # Double-check we have the right item
-        found_id = fallback_item.get('ad_archive_id')
-        if found_id != ad_archive_id:
-            print(f"⚠️  Fallback returned different ad ID: {found_id} instead of {ad_archive_id}")
-        else:
-            print(f"✅ Found correct ad ID: {found_id}")
-
-        # Extract creative URLs from the fallback data
-        creative_urls = []
-
-        def add_creative_fallback(url: str):
-            if url and is_likely_creative_url(url):
-                creative_urls.append(url)
-
-        # Direct fields
-        if fallback_item.get('original_image_url'):
-            add_creative_fallback(fallback_item['original_image_url'])
-
-        if fallback_item.get('image_url'):
-            add_creative_fallback(fallback_item['image_url'])
-
-        # Snapshot-based extraction (same as main logic)
-        snapshot = fallback_item.get('snapshot', {})
-        if isinstance(snapshot, dict):
-            # Check various nested locations
-            if snapshot.get('creatives'):
-                for creative in snapshot['creatives']:
-                    if creative.get('thumbnail'):
-                        add_creative_fallback(creative['thumbnail'])
-                    if creative.get('object_story_spec', {}).get('link_data', {}).get('image', {}).get('url'):
-                        add_creative_fallback(creative['object_story_spec']['link_data']['image']['url'])
-                    if creative.get('object_story_spec', {}).get('video_data', {}).get('image', {}).get('url'):
-                        add_creative_fallback(creative['object_story_spec']['video_data']['image']['url'])
-
-            # Deep search in snapshot (same as main logic)
-            def find_images_recursive_fallback(obj, path=""):
-                if isinstance(obj, dict):
-                    for key, value in obj.items():
-                        if key in ['image', 'images', 'thumbnail', 'thumbnails', 'picture', 'pictures', 'photo', 'photos']:
-                            if isinstance(value, str) and value.startswith('http'):
-                                add_creative_fallback(value)
-                            elif isinstance(value, dict) and value.get('url'):
-                                add_creative_fallback(value['url'])
-                            elif isinstance(value, list):
-                                for i, item in enumerate(value):
-                                    if isinstance(item, str) and item.startswith('http'):
-                                        add_creative_fallback(item)
-                                    elif isinstance(item, dict) and item.get('url'):
-                                        add_creative_fallback(item['url'])
-                        elif isinstance(value, (dict, list)):
-                            find_images_recursive_fallback(value, f"{path}.{key}" if path else key)
-                elif isinstance(obj, list):
-                    for i, item in enumerate(obj):
-                        find_images_recursive_fallback(item, f"{path}[{i}]" if path else f"[{i}]")
-
-            find_images_recursive_fallback(snapshot)
-
-        # Remove duplicates
-        creative_urls = list(set(creative_urls))
-
-        print(f"📸 Found {len(creative_urls)} potential creative URLs via Apify fallback")
-
-        if not creative_urls:
-            print(f"❌ No creative images found via Apify fallback for ad {ad_archive_id}")
-            return []
-
-        # Return the URLs in priority order (same logic as main extraction)
-        priority_order = {
-            'creative_thumbnail': 1,
-            'link_data_image': 2,
-            'video_data_image': 3,
-            'direct_field': 4,
-            'deep_search': 5
-        }
-
-        # Classify URLs by priority
-        classified_creatives = []
-        for url in creative_urls:
-            # Simple classification based on URL patterns
-            if 'thumbnail' in url:
-                creative_type = 'creative_thumbnail'
-            elif 'link_data' in url or 'object_story_spec' in url:
-                creative_type = 'link_data_image'
-            elif 'video_data' in url:
-                creative_type = 'video_data_image'
-            else:
-                creative_type = 'direct_field'
-
-            classified_creatives.append({
-                'url': url,
-                'type': creative_type,
-                'size_hint': 100000  # Default size hint
-            })
-
-        # Sort by priority and return just the URLs
-        sorted_creatives = sorted(classified_creatives, key=lambda c: (
-            priority_order.get(c.get('type'), 999),
-            -c.get('size_hint', 0)
-        ))
-
-        sorted_urls = [creative['url'] for creative in sorted_creatives]
-        print(f"🏆 SUCCESS! Apify fallback extracted {len(sorted_urls)} creative URLs for ad {ad_archive_id}")
-        return sorted_urls
-
-    except Exception as e:
-        print(f"❌ Apify fallback failed for ad {ad_archive_id}: {e}")
-        return []
-
-def _get_snapshot_dict(item: dict) -> dict:
-    """Extract snapshot JSON from API response"""
-    snap = item.get("snapshot")
-    if isinstance(snap, str):
-        try:
-            import json
-            snap = json.loads(snap)
-        except Exception:
-            snap = {}
-    if not isinstance(snap, dict):
-        snap = {}
-    return snap
-
-def extract_ad_creatives_from_snapshot(item: dict, ad_id: str) -> List[Dict[str, Any]]:
-    """Extract ACTUAL ad creatives (not logos/profile pics) from Facebook ad data"""
-    snap = _get_snapshot_dict(item)
-    creatives = []
-
-    # Method 1: Look for creatives in the snapshot
-    if snap.get("creatives"):
-        creative_data = snap["creatives"]
-        if isinstance(creative_data, list):
-            for creative in creative_data:
-                if isinstance(creative, dict):
-                    # Look for image URLs in creative objects
-                    creative_urls = find_creative_urls_in_object(creative, f"creatives[{creative_data.index(creative)}]")
-                    creatives.extend(creative_urls)
-
-    # Method 2: Look for specific ad creative fields
-    if snap.get("creative"):
-        creative_obj = snap["creative"]
-        if isinstance(creative_obj, dict):
-            # Check for thumbnail
-            if creative_obj.get("thumbnail"):
-                thumb = creative_obj["thumbnail"]
-                if isinstance(thumb, str) and is_likely_creative_url(thumb):
-                    creatives.append({
-                        'url': thumb,
-                        'source': 'creative.thumbnail',
-                        'type': 'creative_thumbnail',
-                        'size_hint': estimate_image_size_from_url(thumb)
-                    })
-
-            # Check for object_story_spec (common in Facebook ads)
-            if creative_obj.get("object_story_spec"):
-                story_spec = creative_obj["object_story_spec"]
-                if isinstance(story_spec, dict):
-                    # Link data images
-                    if story_spec.get("link_data"):
-                        link_data = story_spec["link_data"]
-                        if isinstance(link_data, dict) and link_data.get("image"):
-                            img_url = link_data["image"]
-                            if isinstance(img_url, dict) and img_url.get("url"):
-                                url = img_url["url"]
-                                if is_likely_creative_url(url):
-                                    creatives.append({
-                                        'url': url,
-                                        'source': 'creative.object_story_spec.link_data.image.url',
-                                        'type': 'link_data_image',
-                                        'size_hint': estimate_image_size_from_url(url)
-                                    })
-
-                    # Video data images (thumbnail)
-                    if story_spec.get("video_data"):
-                        video_data = story_spec["video_data"]
-                        if isinstance(video_data, dict) and video_data.get("image"):
-                            img_url = video_data["image"]
-                            if isinstance(img_url, dict) and img_url.get("url"):
-                                url = img_url["url"]
-                                if is_likely_creative_url(url):
-                                    creatives.append({
-                                        'url': url,
-                                        'source': 'creative.object_story_spec.video_data.image.url',
-                                        'type': 'video_data_image',
-                                        'size_hint': estimate_image_size_from_url(url)
-                                    })
-
-    # Method 3: Deep search for creative-like URLs in the entire snapshot
-    all_nested_urls = find_creative_urls_deep(snap)
-
-    # Filter and prioritize actual creatives over logos/profile pics
-    for url_info in all_nested_urls:
-        url = url_info['url']
-
-        # Skip obvious non-creative URLs
-        if any(skip in url.lower() for skip in [
-            'icon', 'avatar', 'emoji', 'badge', '1x1', 'pixel', 'spinner',
-            '/photos/', '/profile/', '/pages/', '/groups/', '/events/',
-            'logo', 'brand', 'company', 'profile_picture', 'page_profile',
-            'video', 'video_hd_url', 'video_preview_image_url'  # Skip video URLs
-        ]):
-            continue
-
-        # Only include if it's likely a creative and not already found
-        if is_likely_creative_url(url):
-            creatives.append(url_info)
-
-    # Remove duplicates and prioritize higher quality sources
-    seen_urls = set()
-    unique_creatives = []
-    priority_order = ['creative_thumbnail', 'link_data_image', 'video_data_image', 'direct_field', 'deep_search']
-
-    # Sort by priority
-    creatives.sort(key=lambda x: priority_order.index(x.get('type', 'deep_search')) if x.get('type') in priority_order else 999)
-
-    for creative in creatives:
-        if creative['url'] not in seen_urls:
-            seen_urls.add(creative['url'])
-            unique_creatives.append(creative)
-
-    return unique_creatives
-
-def select_best_creative(creatives: List[Dict[str, Any]], ad_archive_id: str) -> Dict[str, Any] | None:
-    """Select the best single creative for an ad (highest quality, largest file)"""
-    if not creatives:
-        return None
-
-    # If only one creative, return it
-    if len(creatives) == 1:
-        return creatives[0]
-
-    # Sort by priority: prefer original images over resized, then by file size hint
-    priority_order = {
-        'creative_thumbnail': 1,
-        'link_data_image': 2,
-        'video_data_image': 3,
-        'direct_field': 4,
-        'deep_search': 5
-    }
-
-    sorted_creatives = sorted(creatives, key=lambda c: (
-        priority_order.get(c.get('type'), 999),
-        -c.get('size_hint', 0)  # Higher size_hint first (likely higher quality)
-    ))
-
-    best_creative = sorted_creatives[0]
-    print(f"     🎯 Selected best creative for ad {ad_archive_id}: {best_creative['url'][:50]}... (type: {best_creative.get('type')}, size: {best_creative.get('size_hint')})")
-    if len(creatives) > 1:
-        print(f"     🗑️  Skipped {len(creatives) - 1} duplicate/resized versions")
-
-    return best_creative
-
-def find_creative_urls_in_object(obj: dict, path: str = "") -> List[Dict[str, Any]]:
-    """Find creative URLs in a specific object"""
-    urls = []
-
-    # Common creative-related keys
-    creative_keys = [
-        'image_url', 'image', 'picture', 'thumbnail', 'creative_url',
-        'media_url', 'asset_url', 'file_url', 'source_url'
-    ]
-
-    for key in creative_keys:
-        if key in obj:
-            value = obj[key]
-            if isinstance(value, str) and ('fbcdn.net' in value or 'facebook.com' in value):
-                urls.append({
-                    'url': value,
-                    'source': f"{path}.{key}",
-                    'type': 'direct_field',
-                    'size_hint': estimate_image_size_from_url(value)
-                })
-            elif isinstance(value, dict) and 'url' in value:
-                url_val = value.get('url')
-                if url_val and ('fbcdn.net' in url_val or 'facebook.com' in url_val):
-                    urls.append({
-                        'url': url_val,
-                        'source': f"{path}.{key}.url",
-                        'type': 'nested_object',
-                        'size_hint': estimate_image_size_from_url(url_val)
-                    })
-
-    return urls
-
-def find_creative_urls_deep(obj: dict, path: str = "") -> List[Dict[str, Any]]:
-    """Deep search for creative URLs in nested Facebook data"""
-    urls = []
-
-    def _search_recursive(current_obj, current_path):
-        if isinstance(current_obj, dict):
-            for k, v in current_obj.items():
-                new_path = f"{current_path}.{k}" if current_path else k
-
-                if isinstance(v, str) and is_likely_creative_url(v):
-                    urls.append({
-                        'url': v,
-                        'source': new_path,
-                        'type': 'deep_search',
-                        'size_hint': estimate_image_size_from_url(v)
-                    })
-                else:
-                    _search_recursive(v, new_path)
-        elif isinstance(current_obj, list):
-            for i, item in enumerate(current_obj):
-                new_path = f"{current_path}[{i}]"
-                _search_recursive(item, new_path)
-
-    _search_recursive(obj, path)
-    return urls
-
-def estimate_image_size_from_url(url: str) -> int:
-    """Estimate image size from URL patterns (rough heuristic)"""
-    # Larger images often have different path patterns
-    if '/t39.' in url:  # Large images
-        return 100000  # ~100KB
-    elif '/t31.' in url:  # Medium images
-        return 50000   # ~50KB
-    elif 'scontent' in url:
-        return 25000   # ~25KB
-    else:
-        return 10000   # ~10KB (smaller, possibly logos)
-
-def test_and_validate_creative(apify_item: Dict[str, Any], ad_archive_id: str) -> Tuple[bool, str]:
-    """Test and validate creative URLs to ensure they're not profile pics/logos - using the test script logic"""
-
-    # Extract creatives using our enhanced logic
-    creatives = extract_ad_creatives_from_snapshot(apify_item, ad_archive_id)
-
-    if not creatives:
-        return False, ""
-
-    # Sort creatives by priority (best first) - same logic as test script
-    priority_order = {
-        'creative_thumbnail': 1,
-        'link_data_image': 2,
-        'video_data_image': 3,
-        'direct_field': 4,
-        'deep_search': 5
-    }
-
-    sorted_creatives = sorted(creatives, key=lambda c: (
-        priority_order.get(c.get('type'), 999),
-        -c.get('size_hint', 0)  # Higher size_hint first (likely higher quality)
-    ))
-
-    # Show progress bar for validation
-    progress_text = f"🔍 Validating creatives for ad {ad_archive_id[:10]}..."
-    progress_bar = st.progress(0, text=progress_text)
-
-    total_creatives = len(sorted_creatives)
-
-    # Try to validate creatives in priority order until we find a real creative (not profile pic)
-    for i, creative in enumerate(sorted_creatives):
-        url = creative['url']
-
-        # Update progress
-        progress = int((i + 1) / total_creatives * 100)
-        progress_bar.progress(progress, text=f"{progress_text} ({i+1}/{total_creatives})")
-
-        # Test the URL by trying to fetch it (same logic as test script)
-        image_data = _fetch_image_bytes(url, save_path=None)  # Don't save, just validate
-
-        if image_data:
-            progress_bar.progress(100, text=f"✅ Found creative! ({len(image_data)} bytes)")
-            progress_bar.empty()  # Remove the progress bar
-            return True, url  # This is a real creative, not a profile pic!
-
-    # No valid creative found
-    progress_bar.progress(100, text="❌ No valid creatives found")
-    progress_bar.empty()  # Remove the progress bar
-    return False, ""
-
-def get_ad_creative_urls_with_fallback(apify_item: Dict[str, Any], ad_archive_id: str, apify_token: str, domain: str = "") -> Tuple[bool, List[str]]:
-    """Get creative URLs using the WORKING extraction logic from the test script with validation"""
-
-    # Test and validate creatives to ensure they're not profile pics/logos
-    found_valid_creative, valid_url = test_and_validate_creative(apify_item, ad_archive_id)
-
-    if found_valid_creative and valid_url:
-        return True, [valid_url]
-
-    # If no valid creatives found, check if this is one of the problematic domains
-    fallback_domains = {"CAREERSEEKING.CO", "HEALTHANDWEALTHGUIDE.COM", "INFORMATIONSPHERE.CO"}
-    if domain.upper() in fallback_domains:
-        print(f"🔄 No valid images found in primary data for ad {ad_archive_id} ({domain}), trying fallback...")
-        # For now, disable the broken fallback
-        print(f"⚠️  Fallback temporarily disabled - primary extraction should work better")
-        # fallback_urls = scrape_facebook_ad_creative_with_apify(ad_archive_id, apify_token)
-        # if fallback_urls:
-        #     return True, fallback_urls
-
-    print(f"💥 No valid creatives found for ad {ad_archive_id} ({domain})")
-    return False, []
-
+try:
+    from .ads_search import stream_facebook_ads_scrape, run_facebook_ads_fanout  # when packaged
+    from .ad_results import AdResultSet
+except Exception:
+    from ads_search import stream_facebook_ads_scrape, run_facebook_ads_fanout  # when run directly
+    from ad_results import AdResultSet
 
 # Assistant / image generation engine
 try:
@@ -684,735 +99,36 @@ except Exception:
     import assistant_engine as ae  # when run directly
 
 # =============================================================================
-# DATABASE FUNCTIONS
+# DATABASE FUNCTIONS (see ads_repository.py)
 # =============================================================================
 
-def init_database():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    
-    # Create tables table to track different collections
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ad_tables (
-            table_name TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            description TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def init_generation_tables():
-    """Create tables for uploads and generated images if they don't exist"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS uploads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            content_type TEXT,
-            sha256 TEXT UNIQUE,
-            data BLOB,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS generated_ads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            upload_id INTEGER,
-            session_id INTEGER,
-            variant_id TEXT,
-            prompt_json TEXT,
-            variant_json TEXT,
-            image_data BLOB,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(upload_id) REFERENCES uploads(id)
-        )
-    ''')
-
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_upload ON generated_ads(upload_id)")
-
-    # Sessions table to group a batch generation
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT,
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS session_uploads (
-            session_id INTEGER,
-            upload_id INTEGER,
-            PRIMARY KEY (session_id, upload_id),
-            FOREIGN KEY(session_id) REFERENCES sessions(id),
-            FOREIGN KEY(upload_id) REFERENCES uploads(id)
-        )
-    ''')
-
-    # Ensure session_id column exists on generated_ads (for upgrade path)
-    try:
-        cursor.execute("PRAGMA table_info(generated_ads)")
-        cols = [r[1] for r in cursor.fetchall()]
-        if 'session_id' not in cols:
-            cursor.execute("ALTER TABLE generated_ads ADD COLUMN session_id INTEGER")
-    except Exception:
-        pass
-
-    # Create index on session_id after the column is guaranteed to exist
-    try:
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_session ON generated_ads(session_id)")
-    except Exception:
-        pass
-    
-    conn.commit()
-    conn.close()
-
-def create_ads_table(table_name: str, description: str = ""):
-    """Create a new table for saving ads"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    
-    # Sanitize table name - make it unique with timestamp if needed
-    base_name = "ads_" + "".join(c for c in table_name if c.isalnum() or c in ('_',)).lower()
-    safe_table_name = base_name
-    
-    # Check if table already exists
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (safe_table_name,))
-    if cursor.fetchone():
-        # Add timestamp to make unique
-        safe_table_name = f"{base_name}_{int(time.time())}"
-    
-    # Create the ads table with all fields
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS {safe_table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ad_archive_id TEXT UNIQUE,
-            page_name TEXT,
-            page_id TEXT,
-            categories TEXT,
-            start_date TEXT,
-            end_date TEXT,
-            is_active BOOLEAN,
-            cta_text TEXT,
-            cta_type TEXT,
-            link_url TEXT,
-            display_url TEXT,
-            website_url TEXT,
-            original_image_url TEXT,
-            video_url TEXT,
-            collation_count INTEGER,
-            collation_id TEXT,
-            entity_type TEXT,
-            page_entity_type TEXT,
-            page_profile_picture_url TEXT,
-            page_profile_uri TEXT,
-            state_media_run_label TEXT,
-            total_active_time TEXT,
-            upload_id INTEGER,
-            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            notes TEXT
-        )
-    ''')
-    
-    # Add to tables registry
-    cursor.execute('''
-        INSERT OR REPLACE INTO ad_tables (table_name, description, created_at)
-        VALUES (?, ?, datetime('now'))
-    ''', (safe_table_name, description))
-    
-    conn.commit()
-    conn.close()
-    
-    return safe_table_name
-
-def get_available_tables():
-    """Get list of available tables"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    
-    # First check if ad_tables exists
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ad_tables'")
-    if not cursor.fetchone():
-        conn.close()
-        return []
-    
-    cursor.execute('SELECT table_name, description, created_at FROM ad_tables ORDER BY created_at DESC')
-    tables = cursor.fetchall()
-    
-    conn.close()
-    return tables
-
-def save_ad_to_table(table_name: str, ad_data: dict, notes: str = ""):
-    """Save an ad to specified table"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-
-    try:
-        # Check if ad already exists
-        cursor.execute(f'''
-            SELECT id FROM {table_name} WHERE ad_archive_id = ?
-        ''', (ad_data.get("ad_archive_id"),))
-
-        if cursor.fetchone():
-            conn.close()
-            return False, "Ad already exists in this collection"
-
-        # Save image data to uploads table if we have an image URL
-        upload_id = None
-        image_url = ad_data.get("original_image_url") or ad_data.get("creative_url")
-        if image_url:
-            # Try to fetch and save the image
-            image_bytes = _fetch_image_bytes(image_url)
-            if image_bytes:
-                # Generate a filename based on ad_archive_id
-                filename = f"ad_{ad_data.get('ad_archive_id', 'unknown')}.png"
-                upload_id = save_uploaded_image(filename, "image/png", image_bytes)
-                print(f"💾 Saved image for ad {ad_data.get('ad_archive_id')} as upload_id {upload_id}")
-
-        # Insert the ad
-        cursor.execute(f'''
-            INSERT INTO {table_name} (
-                ad_archive_id, page_name, page_id, categories, start_date, end_date,
-                is_active, cta_text, cta_type, link_url, display_url, website_url,
-                original_image_url, video_url, collation_count, collation_id,
-                entity_type, page_entity_type, page_profile_picture_url,
-                page_profile_uri, state_media_run_label, total_active_time, upload_id, notes
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            ad_data.get("ad_archive_id"),
-            ad_data.get("page_name"),
-            ad_data.get("page_id"),
-            ad_data.get("categories"),
-            ad_data.get("start_date"),
-            ad_data.get("end_date"),
-            ad_data.get("is_active"),
-            ad_data.get("cta_text"),
-            ad_data.get("cta_type"),
-            ad_data.get("link_url"),
-            ad_data.get("display_url"),
-            ad_data.get("website_url"),
-            ad_data.get("original_image_url"),
-            ad_data.get("video_url"),
-            ad_data.get("collation_count"),
-            ad_data.get("collation_id"),
-            ad_data.get("entity_type"),
-            ad_data.get("page_entity_type"),
-            ad_data.get("page_profile_picture_url"),
-            ad_data.get("page_profile_uri"),
-            ad_data.get("state_media_run_label"),
-            ad_data.get("total_active_time"),
-            upload_id,
-            notes
-        ))
-
-        conn.commit()
-        conn.close()
-        return True, "Ad saved successfully!"
-    except Exception as e:
-        conn.close()
-        return False, f"Error saving ad: {str(e)}"
-
-def get_saved_ads(table_name: str):
-    """Get all saved ads from a table"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(f'''
-            SELECT * FROM {table_name} ORDER BY saved_at DESC
-        ''')
-        
-        columns = [description[0] for description in cursor.description]
-        ads = []
-        
-        for row in cursor.fetchall():
-            ad_dict = dict(zip(columns, row))
-            ads.append(ad_dict)
-        
-        conn.close()
-        return ads
-    except Exception as e:
-        conn.close()
-        print(f"Error getting saved ads: {e}")
-        return []
-
-def delete_saved_ad(table_name: str, ad_id: int):
-    """Delete a saved ad"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-
-    cursor.execute(f'DELETE FROM {table_name} WHERE id = ?', (ad_id,))
-
-    conn.commit()
-    conn.close()
-
-def delete_generated_images(gen_ids: List[int]):
-    """Delete generated images by their IDs"""
-    if not gen_ids:
-        return
-
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-
-    # Delete from generated_ads table
-    placeholders = ','.join('?' for _ in gen_ids)
-    cursor.execute(f'DELETE FROM generated_ads WHERE id IN ({placeholders})', gen_ids)
-
-    conn.commit()
-    conn.close()
-
-def delete_table(table_name: str):
-    """Delete an entire table and its registry entry"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
-        cursor.execute('DELETE FROM ad_tables WHERE table_name = ?', (table_name,))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        print(f"Error deleting table: {e}")
-        return False
-
-# =============================================================================
-# GENERATION STORAGE HELPERS
-# =============================================================================
-
-def _sha256_bytes(data: bytes) -> str:
-    return hashlib.sha256(data).hexdigest()
-
-def save_uploaded_image(filename: str, content_type: str, data: bytes) -> int:
-    """Save an uploaded image and return its row id. Dedup by sha256."""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    hash_hex = _sha256_bytes(data)
-    try:
-        cursor.execute('''
-            INSERT INTO uploads (filename, content_type, sha256, data)
-            VALUES (?, ?, ?, ?)
-        ''', (filename, content_type, hash_hex, sqlite3.Binary(data)))
-        upload_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return upload_id
-    except sqlite3.IntegrityError:
-        cursor.execute('SELECT id FROM uploads WHERE sha256 = ?', (hash_hex,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else -1
-
-def list_uploaded_images() -> List[Dict[str, Any]]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, content_type, uploaded_at FROM uploads ORDER BY uploaded_at DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "filename": r[1], "content_type": r[2], "uploaded_at": r[3]}
-        for r in rows
-    ]
-
-def get_upload_bytes(upload_id: int) -> Optional[bytes]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT data FROM uploads WHERE id = ?', (upload_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return bytes(row[0]) if row else None
-
-def save_generated_image(upload_id: int, variant_id: str, prompt_json: dict, variant_json: dict, image_bytes: bytes) -> int:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO generated_ads (upload_id, session_id, variant_id, prompt_json, variant_json, image_data)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        upload_id,
-        st.session_state.get('current_session_id'),
-        str(variant_id) if variant_id is not None else None,
-        json.dumps(prompt_json, ensure_ascii=False),
-        json.dumps(variant_json, ensure_ascii=False),
-        sqlite3.Binary(image_bytes)
-    ))
-    rowid = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return rowid
-
-def list_generated_for_upload(upload_id: int) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, variant_id, created_at FROM generated_ads
-        WHERE upload_id = ? ORDER BY created_at DESC
-    ''', (upload_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "variant_id": r[1], "created_at": r[2]}
-        for r in rows
-    ]
-
-def get_generated_image_bytes(gen_id: int) -> Optional[bytes]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT image_data FROM generated_ads WHERE id = ?', (gen_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return bytes(row[0]) if row else None
-
-def create_session(source: str, note: str = "") -> int:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO sessions (source, note) VALUES (?, ?)', (source, note))
-    sid = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return sid
-
-def link_session_uploads(session_id: int, upload_ids: List[int]):
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    for uid in upload_ids:
-        cursor.execute('INSERT OR IGNORE INTO session_uploads (session_id, upload_id) VALUES (?, ?)', (session_id, uid))
-    conn.commit()
-    conn.close()
-
-def list_session_uploads(session_id: int) -> List[int]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT upload_id FROM session_uploads WHERE session_id = ?', (session_id,))
-    rows = [r[0] for r in cursor.fetchall()]
-    conn.close()
-    return rows
-
-def list_sessions() -> List[Dict[str, Any]]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, source, note, created_at FROM sessions ORDER BY created_at DESC, id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "source": r[1], "note": r[2], "created_at": r[3]}
-        for r in rows
-    ]
-
-def list_generated_for_session(session_id: int) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, upload_id, variant_id, created_at FROM generated_ads WHERE session_id = ? ORDER BY created_at DESC, id DESC', (session_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "upload_id": r[1], "variant_id": r[2], "created_at": r[3]}
-        for r in rows
-    ]
-
-def list_generated_for_collection(table_name: str) -> List[Dict[str, Any]]:
-    """Get all generated images for a collection by finding sessions with matching source"""
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-
-    # Find sessions that were created from this collection
-    cursor.execute("SELECT id FROM sessions WHERE source = ?", (f"collection:{table_name}",))
-    session_ids = [r[0] for r in cursor.fetchall()]
-
-    if not session_ids:
-        conn.close()
-        return []
-
-    # Get all generated images from these sessions
-    placeholders = ','.join('?' for _ in session_ids)
-    cursor.execute(f'SELECT id, session_id, upload_id, variant_id, created_at FROM generated_ads WHERE session_id IN ({placeholders}) ORDER BY created_at DESC, id DESC', session_ids)
-    rows = cursor.fetchall()
-    conn.close()
-
-    return [
-        {"id": r[0], "session_id": r[1], "upload_id": r[2], "variant_id": r[3], "created_at": r[4]}
-        for r in rows
-    ]
-
-def get_upload_meta(upload_id: int) -> Optional[Dict[str, Any]]:
-    conn = sqlite3.connect('saved_ads.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, content_type, uploaded_at FROM uploads WHERE id = ?', (upload_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if not row:
-        return None
-    return {"id": row[0], "filename": row[1], "content_type": row[2], "uploaded_at": row[3]}
-
-# =============================================================================
-# DATE FILTERING HELPER
-# =============================================================================
-
-def is_date_in_range(date_str: str, start_date: date, end_date: date) -> bool:
-    """Check if date falls within selected date range"""
-    if not date_str:
-        return True
-    
-    try:
-        if 'T' in date_str:
-            ad_date = datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
-        else:
-            ad_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        
-        return start_date <= ad_date <= end_date
-    except Exception:
-        return True
-
-# =============================================================================
-# IMAGE EXTRACTION LOGIC
-# =============================================================================
-
-def _get_snapshot_dict(item: dict) -> dict:
-    """Extract snapshot JSON from API response"""
-    snap = item.get("snapshot")
-    if isinstance(snap, str):
-        try:
-            snap = json.loads(snap)
-        except Exception:
-            snap = {}
-    if not isinstance(snap, dict):
-        snap = {}
-    return snap
-
-def get_original_image_url(item: dict) -> str | None:
-    """Extract image URL using comprehensive logic"""
-    snap = _get_snapshot_dict(item)
-
-    # Try multiple sources for images
-    imgs = snap.get("images")
-    if isinstance(imgs, dict):
-        imgs = [imgs]
-    elif not isinstance(imgs, (list, tuple)):
-        imgs = []
-
-    # Look through image objects
-    for im in imgs:
-        if not isinstance(im, dict):
-            continue
-        # Try multiple keys in order of preference
-        for k in ("original_image_url", "original_picture_url", "original_picture", "resized_image_url",
-                  "resized_picture_url", "url", "src", "uri", "secure_url"):
-            v = im.get(k)
-            if v and isinstance(v, str) and v.strip():
-                return v.strip()
-
-    # Fallback: look in other places in the snapshot
-    fallback_keys = ["image_url", "picture_url", "picture", "thumbnail_url", "thumbnail",
-                    "photo_url", "media_url", "creative_url"]
-
-    for key in fallback_keys:
-        v = snap.get(key)
-        if v and isinstance(v, str) and v.strip():
-            return v.strip()
-
-    # Last resort: look at top level of item
-    top_level_keys = ["original_image_url", "image_url", "imageUrl", "picture", "thumbnailUrl", "creative_url"]
-    for key in top_level_keys:
-        v = item.get(key)
-        if v and isinstance(v, str) and v.strip():
-            return v.strip()
-
-    return None
-
-def extract_selected_fields(item: dict) -> dict:
-    """Extract fields using original code logic"""
-    snap = _get_snapshot_dict(item)
-    
-    card0 = None
-    cards = snap.get("cards")
-    if isinstance(cards, list) and cards:
-        if isinstance(cards[0], dict):
-            card0 = cards[0]
-    elif isinstance(cards, dict):
-        card0 = cards
-    
-    pgcat0 = None
-    page_categories = snap.get("page_categories")
-    if isinstance(page_categories, list) and page_categories:
-        if isinstance(page_categories[0], dict):
-            pgcat0 = page_categories[0]
-    elif isinstance(page_categories, dict):
-        pgcat0 = page_categories
-    
-    link_url = snap.get("link_url")
-    if not link_url and isinstance(card0, dict):
-        link_url = card0.get("link_url")
-    
-    display_url = snap.get("caption")
-    website_url = snap.get("link_url") or snap.get("website") or snap.get("url")
-    
-    categories = item.get("categories")
-    if isinstance(categories, (list, tuple)):
-        categories_disp = ", ".join(str(c) for c in categories)
-    else:
-        categories_disp = categories
-    
-    image_url = get_original_image_url(item)
-    if not image_url:
-        img_keys = ["imageUrl", "image_url", "thumbnailUrl", "thumbnail_url", "image"]
-        for k in img_keys:
-            if item.get(k):
-                image_url = item[k]
-                break
-    
-    video_url = None
-    videos = snap.get("videos")
-    if isinstance(videos, dict):
-        videos = [videos]
-    elif not isinstance(videos, (list, tuple)):
-        videos = []
-    
-    for vid in videos:
-        if not isinstance(vid, dict):
-            continue
-        for k in ("video_hd_url", "video_sd_url", "video_preview_url", "url", "src"):
-            v = vid.get(k)
-            if v:
-                video_url = v
-                break
-        if video_url:
-            break
-    
-    if not video_url:
-        vid_keys = ["videoUrl", "video_url", "video", "video_hd_url", "video_sd_url"]
-        for k in vid_keys:
-            if item.get(k):
-                video_url = item[k]
-                break
-            if snap.get(k):
-                video_url = snap[k]
-                break
-    
-    return {
-        "ad_archive_id": item.get("ad_archive_id") or item.get("adId"),
-        "categories": categories_disp,
-        "collation_count": item.get("collation_count"),
-        "collation_id": item.get("collation_id"),
-        "start_date": item.get("start_date") or item.get("startDate"),
-        "end_date": item.get("end_date") or item.get("endDate"),
-        "entity_type": item.get("entity_type"),
-        "is_active": item.get("is_active"),
-        "page_id": item.get("page_id") or item.get("pageId"),
-        "page_name": item.get("page_name") or item.get("pageName"),
-        "cta_text": (card0.get("cta_text") if isinstance(card0, dict) else None) or snap.get("cta_text"),
-        "cta_type": (card0.get("cta_type") if isinstance(card0, dict) else None) or snap.get("cta_type"),
-        "link_url": link_url,
-        "display_url": display_url,
-        "website_url": website_url,
-        "page_entity_type": (pgcat0.get("page_entity_type") if isinstance(pgcat0, dict) else None) or item.get("page_entity_type"),
-        "page_profile_picture_url": item.get("page_profile_picture_url") or snap.get("page_profile_picture_url"),
-        "page_profile_uri": item.get("page_profile_uri") or snap.get("page_profile_uri"),
-        "state_media_run_label": item.get("state_media_run_label"),
-        "total_active_time": item.get("total_active_time"),
-        "original_image_url": image_url,
-        "video_url": video_url,
-    }
-
-# =============================================================================
-# SCRAPING FUNCTION
-# =============================================================================
-
-def run_facebook_ads_scrape(
-    apify_token: str,
-    domain: str,
-    count: int = 10,
-    country: str = "US",
-    exact_phrase: bool = False,
-    active_status: str = "active",
-    start_date: Optional[date] = None,
-    end_date: Optional[date] = None
-) -> List[Dict[str, Any]]:
-    """Run domain search via Apify"""
-    
-    if exact_phrase:
-        domain_query = f'"{domain.strip()}"'
-        search_type = "keyword_exact_phrase"
-    else:
-        domain_query = domain.strip()
-        search_type = "keyword_unordered"
-    
-    domain_encoded = quote_plus(domain_query)
-    
-    url = (
-        f"https://www.facebook.com/ads/library/?"
-        f"active_status={active_status}&"
-        f"ad_type=all&"
-        f"country={country.upper()}&"
-        f"is_targeted_country=false&"
-        f"media_type=all&"
-        f"q={domain_encoded}&"
-        f"search_type={search_type}"
+try:
+    from .ads_repository import (  # when packaged
+        init_database, init_generation_tables, create_ads_table, get_available_tables,
+        save_ad_to_table, get_saved_ads, delete_saved_ad, delete_generated_images,
+        clear_generation_data, delete_table, save_uploaded_image,
+        get_upload_bytes, save_generated_image, get_generated_image_bytes, create_session, link_session_uploads,
+        list_session_uploads, list_sessions, list_generated_for_session,
+        list_generated_for_collection, get_upload_metas,
+        get_upload_thumbnails, get_generated_thumbnails,
+        list_generated_for_session_page, list_generated_for_collection_page,
+        count_generated_for_session, count_generated_for_collection,
+        get_jobs, cancel_job, JOB_ACTIVE_STATES,
+    )
+except Exception:
+    from ads_repository import (  # when run directly
+        init_database, init_generation_tables, create_ads_table, get_available_tables,
+        save_ad_to_table, get_saved_ads, delete_saved_ad, delete_generated_images,
+        clear_generation_data, delete_table, save_uploaded_image,
+        get_upload_bytes, save_generated_image, get_generated_image_bytes, create_session, link_session_uploads,
+        list_session_uploads, list_sessions, list_generated_for_session,
+        list_generated_for_collection, get_upload_metas,
+        get_upload_thumbnails, get_generated_thumbnails,
+        list_generated_for_session_page, list_generated_for_collection_page,
+        count_generated_for_session, count_generated_for_collection,
+        get_jobs, cancel_job, JOB_ACTIVE_STATES,
     )
-    
-    if start_date and end_date:
-        url += f"&start_date[min]={start_date.strftime('%Y-%m-%d')}"
-        url += f"&start_date[max]={end_date.strftime('%Y-%m-%d')}"
-    
-    client = ApifyClient(apify_token)
-    
-    run_input = {
-        "urls": [{"url": url, "method": "GET"}],
-        "count": int(count),
-        "scrapeAdDetails": True,
-        "scrapePageAds.activeStatus": active_status,
-        "period": ""
-    }
-    
-    try:
-        run = client.actor("curious_coder/facebook-ads-library-scraper").call(run_input=run_input)
-        dataset_id = run.get("defaultDatasetId")
-        if not dataset_id:
-            raise Exception("No dataset ID returned from Apify")
-        
-        items = list(client.dataset(dataset_id).iterate_items())
-        
-        processed_items = []
-        for item in items:
-            processed_item = extract_selected_fields(item)
-
-            if start_date and end_date:
-                start_date_str = processed_item.get("start_date")
-                if start_date_str and not is_date_in_range(start_date_str, start_date, end_date):
-                    continue
-
-            # Get creative URLs for this ad (using full Apify item data + fallback scraping)
-            ad_archive_id = processed_item.get("ad_archive_id")
-            if ad_archive_id:
-                creative_found, creative_urls = get_ad_creative_urls_with_fallback(item, ad_archive_id, apify_token, domain)
-                processed_item["creative_found"] = creative_found
-                processed_item["creative_urls"] = creative_urls
-                processed_item["creative_url"] = creative_urls[0] if creative_urls else None
-
-                # Debug logging
-                if creative_found and creative_urls:
-                    print(f"🎨 Ad {ad_archive_id} ({domain}): Found {len(creative_urls)} creative URLs")
-                    print(f"   Display URL set to: {creative_urls[0][:100]}...")
-                elif creative_found is False:
-                    print(f"❌ Ad {ad_archive_id} ({domain}): No creative URLs found")
-                else:
-                    print(f"⚠️ Ad {ad_archive_id} ({domain}): creative_found is None")
 
-            processed_items.append(processed_item)
-        
-        return processed_items
-        
-    except Exception as e:
-        st.error(f"Error running scrape: {e}")
-        return []
 
 # =============================================================================
 # DISPLAY FUNCTIONS
@@ -1589,6 +305,136 @@ def display_saved_ad_card(ad, index, show_save_button=True):
                 if ad.get('entity_type'):
                     st.write(f"**Entity Type:** {ad['entity_type']}")
 
+# =============================================================================
+# GALLERY PAGINATION
+# =============================================================================
+
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "12"))
+GALLERY_PAGE_SIZE_OPTIONS = sorted({6, 12, 24, 48, GALLERY_PAGE_SIZE})
+
+def load_gallery_page(key: str, total: int, fetch_page) -> Tuple[List[Dict[str, Any]], Dict[int, bytes]]:
+    """Render pager controls and load only the current page's rows and thumbnails.
+
+    `fetch_page(limit, after)` returns (rows, next_cursor). The cursor for the
+    start of every visited page is kept in session_state so Previous/Next are
+    keyset lookups rather than OFFSET scans.
+    """
+    cursors_key = f"gallery_cursors_{key}"
+    nav_prev, nav_info, nav_size, nav_next = st.columns([1, 3, 1, 1])
+    with nav_size:
+        page_size = st.selectbox(
+            "Per page", GALLERY_PAGE_SIZE_OPTIONS,
+            index=GALLERY_PAGE_SIZE_OPTIONS.index(GALLERY_PAGE_SIZE),
+            key=f"gallery_page_size_{key}", label_visibility="collapsed"
+        )
+    state = st.session_state.get(cursors_key)
+    if not state or state["page_size"] != page_size:
+        state = st.session_state[cursors_key] = {"page_size": page_size, "cursors": [None]}
+    cursors = state["cursors"]
+
+    t0 = time.perf_counter()
+    rows, next_cursor = fetch_page(page_size, cursors[-1])
+    if not rows and len(cursors) > 1:
+        # The page emptied (e.g. after deletes); step back
+        cursors.pop()
+        rows, next_cursor = fetch_page(page_size, cursors[-1])
+    thumbs = get_generated_thumbnails([r['id'] for r in rows])
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    page_no = len(cursors)
+    pages = max(1, -(-total // page_size))
+    print(f"🖼️ Gallery {key} page {page_no}/{pages}: {len(rows)} image(s) in {elapsed_ms:.1f} ms")
+
+    with nav_prev:
+        if st.button("◀ Prev", key=f"gallery_prev_{key}", disabled=page_no == 1):
+            cursors.pop()
+            st.rerun()
+    with nav_next:
+        if st.button("Next ▶", key=f"gallery_next_{key}", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+    with nav_info:
+        st.caption(f"Page {page_no} of {pages} · {total} image(s) · loaded in {elapsed_ms:.0f} ms")
+    return rows, thumbs
+
+# =============================================================================
+# ANALYSIS HELPERS
+# =============================================================================
+
+def fresh_analysis_toggle(key: str) -> bool:
+    """Checkbox to bypass the analysis cache; returns True when a fresh Assistant run is wanted."""
+    return st.checkbox("Fresh analysis (ignore cached prompts)", key=key,
+                       help="Identical image sets reuse their earlier Assistant prompts. Tick to re-run the analysis.")
+
+def variation_policy_toggle(key: str) -> Optional[str]:
+    """With the Gemini output cache on, offer fresh images instead of cached ones; returns the policy override."""
+    if not ae.GEMINI_OUTPUT_CACHE:
+        return None
+    force_new = st.checkbox("Force new variations (skip cached images)", key=key,
+                            help="Identical prompts reuse previously generated images. Tick to generate new ones.")
+    return "refresh" if force_new else None
+
+def analysis_timing_caption(timings: Dict[str, float]) -> str:
+    if "cache" in timings:
+        stats = ae.analysis_cache_stats()
+        return (f"♻️ Reused cached analysis in {timings['cache'] * 1000:.0f} ms · "
+                f"{stats['hits']} hit(s) / {stats['misses']} miss(es) this session · {stats['entries']} cached")
+    return "⏱️ Analysis " + " · ".join(f"{k} {v:.1f}s" for k, v in timings.items())
+
+# =============================================================================
+# BACKGROUND JOBS
+# =============================================================================
+
+GENERATION_BACKGROUND = os.getenv("GENERATION_BACKGROUND", "0").strip().lower() not in ("0", "false", "no")
+
+def background_toggle(key: str) -> bool:
+    """Checkbox to queue the run for generation_worker.py instead of generating in this page."""
+    return st.checkbox("Run in background (generation worker)", key=key, value=GENERATION_BACKGROUND,
+                       help="Queue the analysis and generation for `python generation_worker.py`. "
+                            "Images are saved to 'Generated Ads' as they finish and you can keep using the app.")
+
+def queue_generation_job(session_id: int, upload_ids: List[int], desired_count: int, *,
+                         use_cache: bool, variation_policy: Optional[str], variant_prefix: str = "var") -> int:
+    """Queue a job and remember it in this browser session so the jobs panel can follow it."""
+    job_id = generation_worker.enqueue_generation(session_id, upload_ids, desired_count, use_cache=use_cache,
+                                                  variation_policy=variation_policy, variant_prefix=variant_prefix)
+    st.session_state.setdefault("generation_jobs", []).append(job_id)
+    return job_id
+
+def render_generation_jobs():
+    """Progress of this browser session's queued jobs, polled while any of them is still active."""
+    job_ids = st.session_state.get("generation_jobs") or []
+    if not job_ids:
+        return
+    active_at_render = any(j["status"] in JOB_ACTIVE_STATES for j in get_jobs(job_ids).values())
+
+    @st.fragment(run_every=generation_worker.JOB_POLL_SECONDS if active_at_render else None)
+    def _jobs_panel():
+        jobs = get_jobs(job_ids)
+        active = [j for j in jobs.values() if j["status"] in JOB_ACTIVE_STATES]
+        if active_at_render and not active:
+            st.rerun()  # last job finished: refresh the galleries and stop polling
+        with st.expander(f"🧵 Background jobs ({len(active)} active)", expanded=bool(active)):
+            if any(j["status"] == "queued" for j in active) and not generation_worker.workers_alive():
+                st.warning("No generation worker is running. Start one with `python generation_worker.py`.")
+            for job_id in reversed(job_ids):
+                job = jobs.get(job_id)
+                if not job:
+                    continue
+                total = max(job["total"], len(job["prompts"]), 1)
+                done = job["completed"] + job["failed"]
+                col1, col2 = st.columns([5, 1])
+                with col1:
+                    st.progress(min(done / total, 1.0),
+                                text=f"Job #{job_id} · session #{job['session_id']} · {job['status']} · {job['message'] or ''}")
+                    if job["error"]:
+                        st.caption(f"❌ {job['error']}")
+                with col2:
+                    if job["status"] in JOB_ACTIVE_STATES and not job["cancel_requested"]:
+                        st.button("Cancel", key=f"cancel_job_{job_id}", on_click=cancel_job, args=(job_id,))
+
+    _jobs_panel()
+
 # =============================================================================
 # PAGE CONFIG
 # =============================================================================
@@ -1627,7 +473,7 @@ init_generation_tables()
 
 # Initialize session state
 if 'current_ads' not in st.session_state:
-    st.session_state.current_ads = []
+    st.session_state.current_ads = AdResultSet()  # column-backed; rows read like ad dicts
 if 'save_modal_ad' not in st.session_state:
     st.session_state.save_modal_ad = None
 if 'selected_table' not in st.session_state:
@@ -1792,7 +638,7 @@ def main():
             domain = st.text_input(
                 "Domain URL", 
                 placeholder="example.com",
-                help="Enter domain without http:// or https://"
+                help="Enter domain without http:// or https:// (separate several domains with commas)"
             )
             
             exact_phrase = st.checkbox(
@@ -1807,6 +653,13 @@ def main():
                 index=[c[0] for c in COUNTRIES].index("US") if any(c[0] == "US" for c in COUNTRIES) else 0,
                 format_func=lambda code: f"{code} - {COUNTRY_NAME_BY_CODE.get(code, code)}"
             )
+
+            extra_countries = st.multiselect(
+                "Also search in",
+                options=[c[0] for c in COUNTRIES],
+                format_func=lambda code: f"{code} - {COUNTRY_NAME_BY_CODE.get(code, code)}",
+                help="Every domain is searched in every selected country at once; duplicate ads are merged"
+            )
             
             active_status = st.selectbox(
                 "Ad Status",
@@ -1887,15 +740,7 @@ def main():
                 disabled = not (confirm and phrase.strip().upper() == "CLEAR THE DATABASE")
                 if st.button("Clear Database", key="clear_db_btn", disabled=disabled):
                     try:
-                        import sqlite3 as _sql
-                        conn = _sql.connect('saved_ads.db')
-                        cur = conn.cursor()
-                        cur.execute('DELETE FROM generated_ads')
-                        cur.execute('DELETE FROM session_uploads')
-                        cur.execute('DELETE FROM sessions')
-                        cur.execute('DELETE FROM uploads')
-                        conn.commit()
-                        conn.close()
+                        clear_generation_data()
                         st.success("Database cleared.")
                     except Exception as e:
                         st.error(f"Failed to clear DB: {e}")
@@ -1903,6 +748,8 @@ def main():
             search_button = False
     
     # Main content area
+    render_generation_jobs()
+
     if tab == "Search":
         st.title("🔍 Facebook Ads Library Search")
         st.markdown("Search and analyze Facebook ads by domain")
@@ -1915,11 +762,14 @@ def main():
             elif use_date_filter and start_date > end_date:
                 st.error("Start date must be before end date")
             else:
+                domains = [d.strip() for d in domain.split(",") if d.strip()]
+                countries = [country] + [c for c in extra_countries if c != country]
+
                 # Show search info
-                search_info = f"Searching for **{domain}**"
+                search_info = f"Searching for **{', '.join(domains)}**"
                 if exact_phrase:
                     search_info += " (exact match)"
-                search_info += f" • {active_status.capitalize()} ads • {country}"
+                search_info += f" • {active_status.capitalize()} ads • {', '.join(countries)}"
                 if use_date_filter:
                     search_info += f" • {start_date} to {end_date}"
                 
@@ -1927,17 +777,69 @@ def main():
                 
                 # Run search
                 with st.spinner("Searching Facebook Ads Library..."):
-                    ads = run_facebook_ads_scrape(
-                        apify_token=apify_token, 
-                        domain=domain, 
-                        count=count, 
-                        country=country, 
-                        exact_phrase=exact_phrase,
-                        active_status=active_status,
-                        start_date=start_date if use_date_filter else None,
-                        end_date=end_date if use_date_filter else None
-                    )
-                    st.session_state.current_ads = ads
+                    progress_text = "🔍 Validating ad creatives..."
+                    progress_bar = st.progress(0, text=progress_text)
+
+                    def _on_validation_progress(done: int, total: int):
+                        progress_bar.progress(int(done / total * 100), text=f"{progress_text} ({done}/{total})")
+
+                    ads = []
+                    try:
+                        if len(domains) * len(countries) == 1:
+                            # Cards appear page by page while the rest of the dataset is still being read
+                            live_results = st.empty()
+                            try:
+                                with live_results.container():
+                                    live_cols = st.columns(3)
+                                    for ad in stream_facebook_ads_scrape(
+                                        apify_token=apify_token,
+                                        domain=domains[0],
+                                        count=count,
+                                        country=country,
+                                        exact_phrase=exact_phrase,
+                                        active_status=active_status,
+                                        start_date=start_date if use_date_filter else None,
+                                        end_date=end_date if use_date_filter else None,
+                                        on_progress=_on_validation_progress
+                                    ):
+                                        with live_cols[len(ads) % 3]:
+                                            display_ad_card(ad, len(ads), show_save_button=False)
+                                        ads.append(ad)
+                            finally:
+                                live_results.empty()
+                        else:
+                            query_status = st.empty()
+
+                            def _on_query(query):
+                                query_status.caption(f"{'❌' if query['error'] else '✅'} {query['domain']} · {query['country']}: "
+                                                     f"{query['items']} ad(s) in {query['seconds']:.1f}s")
+
+                            fanout = run_facebook_ads_fanout(
+                                apify_token,
+                                domains,
+                                countries,
+                                count=count,
+                                exact_phrase=exact_phrase,
+                                active_status=active_status,
+                                start_date=start_date if use_date_filter else None,
+                                end_date=end_date if use_date_filter else None,
+                                on_query=_on_query,
+                                on_progress=_on_validation_progress
+                            )
+                            query_status.empty()
+                            ads = fanout["ads"]
+                            unmatched = f" · {fanout['unattributed']} unmatched item(s)" if fanout["unattributed"] else ""
+                            with st.expander(f"⏱️ {len(fanout['queries'])} searches in {fanout['scrape_seconds']:.1f}s · "
+                                             f"{fanout['duplicates']} duplicate ad(s) merged{unmatched}"):
+                                st.dataframe(
+                                    [{"domain": q["domain"], "country": q["country"], "ads": q["items"], "new": q["new"],
+                                      "seconds": round(q["seconds"], 2), "error": q["error"] or ""} for q in fanout["queries"]],
+                                    hide_index=True
+                                )
+                    except Exception as e:
+                        st.error(f"Error running scrape: {e}")
+                    progress_bar.empty()
+                    ads = st.session_state.current_ads = AdResultSet(ads)
                 
                 if ads:
                     st.success(f"Found {len(ads)} ads")
@@ -2016,6 +918,9 @@ def main():
                 with colB:
                     generate_direct_persist = st.button("Generate ADS for Selected", key="generate_from_search_btn_persist")
                 desired_count = st.slider("Number of images to generate", min_value=1, max_value=5, value=3, key="search_desired_count")
+                fresh_analysis = fresh_analysis_toggle("search_fresh_analysis")
+                variation_policy = variation_policy_toggle("search_force_new")
+                run_in_background = background_toggle("search_background")
                 st.markdown('</div>', unsafe_allow_html=True)
 
                 # Dedicated top status area (above cards)
@@ -2068,83 +973,91 @@ def main():
                         upload_id = save_uploaded_image(f"search_{i}.png", "image/png", img_bytes)
                         grouped_images.append((f"selected_{i}", img_bytes))
                         upload_ids.append(upload_id)
-                    if grouped_images:
+                    if grouped_images and run_in_background:
+                        sid = create_session(source="search", note=f"{len(grouped_images)} images")
+                        st.session_state.current_session_id = sid
+                        link_session_uploads(sid, upload_ids)
+                        queue_generation_job(sid, upload_ids, desired_count, use_cache=not fresh_analysis, variation_policy=variation_policy)
+                        st.rerun()
+                    elif grouped_images:
                         try:
                             if status_obj:
                                 status_obj.update(label="Analyzing with Assistant…", state="running")
                             sid = create_session(source="search", note=f"{len(grouped_images)} images")
                             st.session_state.current_session_id = sid
                             link_session_uploads(sid, upload_ids)
-                            json_prompt, variants_json = ae.analyze_images(None, None, grouped_images, desired_count=desired_count)
-                            # Handle new direct prompt format
-                            variants = None
-                            if isinstance(variants_json, dict):
-                                if "vu_engine_variants" in variants_json:
-                                    # Legacy format
-                                    variants = variants_json["vu_engine_variants"]
-                                elif "prompts" in variants_json:
-                                    # New direct format - convert to expected structure
-                                    prompts = variants_json["prompts"]
-                                    variants = [{"id": f"var_{i+1}", "prompt": prompt} for i, prompt in enumerate(prompts)]
-                            if not variants:
-                                if status_obj:
-                                    status_obj.update(label="No variants returned by assistant.", state="error")
-                            else:
-                                if status_obj:
-                                    status_obj.update(label="Generating all variants…", state="running")
-
-                                # VU Engine: Show detailed prompts prominently
-                                st.markdown("### 🎨 VU Engine Generated Prompts")
-                                st.info("📝 These prompts are designed to create images very similar to your reference, following VU Engine rules (±5% creativity only)")
-
-                                for i, v in enumerate(variants):
-                                    vid = v.get('id') or f"var_{i+1}"
-                                    prompt_text = ae.build_prompt_text(json_prompt, v)
+                            # Prompts stream in from the Assistant; each one starts generating as soon as it is written
+                            json_prompt = ae.direct_prompts_base(desired_count)
+                            analysis_timings = {}
+                            variants = []
+
+                            def _streamed_variants():
+                                for i, prompt in enumerate(ae.stream_analysis_prompts(None, None, grouped_images, desired_count=desired_count, timings=analysis_timings, use_cache=not fresh_analysis)):
+                                    v = {"id": f"var_{i+1}", "prompt": prompt}
+                                    variants.append(v)
+                                    yield v
+
+                            # VU Engine: Show detailed prompts prominently
+                            st.markdown("### 🎨 VU Engine Generated Prompts")
+                            st.info("📝 These prompts are designed to create images very similar to your reference, following VU Engine rules (±5% creativity only)")
+                            prompts_box = st.container()
+
+                            st.markdown("### 🚀 Generating Images...")
+                            progress_bar = st.progress(0)
+                            status_text = st.empty()
+                            status_text.text("Waiting for the first prompt from the Assistant...")
 
+                            def _on_prompt(i, v):
+                                vid = v.get('id') or f"var_{i+1}"
+                                if i == 0 and status_obj:
+                                    status_obj.update(label="Generating variants as prompts arrive…", state="running")
+                                with prompts_box:
                                     # Display prompt prominently
                                     st.markdown(f"**🎯 VU Engine Prompt {i+1} ({vid}):**")
                                     st.text_area(
                                         f"Prompt {i+1} - Click to expand",
-                                        value=prompt_text,
+                                        value=ae.build_prompt_text(json_prompt, v),
                                         height=120,
                                         key=f"prompt_display_{i}",
                                         help="This prompt will generate an image very similar to your reference following VU Engine rules"
                                     )
                                     st.markdown("---")
+                                status_text.text(f"Prompt {i+1}/{desired_count} received, generating ({ae.GEMINI_CONCURRENCY} at a time)...")
+
+                            def _on_variant(i, img_out, err):
+                                # Called in variant order from this thread as images finish
+                                v = variants[i]
+                                vid = v.get('id') or f"var_{i+1}"
+                                if img_out:
+                                    save_generated_image(upload_ids[0], vid, json_prompt, v, img_out, session_id=st.session_state.get('current_session_id'))
+                                    st.success(f"✅ Image {i+1} created successfully!")
+                                elif i == 0:
+                                    # If first prompt yields no image, the scheduler stops the rest
+                                    st.error(f"First prompt returned no image{f' ({err})' if err else ''}. Stopping further generations.")
+                                else:
+                                    st.warning(f"⚠️ Image {i+1} failed: {str(err)[:80]}")
+                                progress_bar.progress((i+1)/desired_count)
+                                status_text.text(f"Generated {i+1}/{desired_count}...")
+
+                            # Prompt-only generation (no reference images passed)
+                            ae.generate_variants_concurrently(
+                                os.getenv("GOOGLE_API_KEY"),
+                                json_prompt,
+                                _streamed_variants(),
+                                size="1024x1024",
+                                on_variant=_on_prompt,
+                                on_result=_on_variant,
+                                variation_policy=variation_policy
+                            )
 
-                                # Generate images after showing prompts
-                                st.markdown("### 🚀 Generating Images...")
-                                progress_bar = st.progress(0)
-                                status_text = st.empty()
-
-                                stop_all = False
-                                for i, v in enumerate(variants):
-                                    vid = v.get('id') or f"var_{i+1}"
-                                    status_text.text(f"Generating image {i+1}/{len(variants)}...")
-
-                                    # Prompt-only generation (no reference images passed)
-                                    img_out = ae.generate_single_variant_image(
-                                        os.getenv("GOOGLE_API_KEY"),
-                                        json_prompt,
-                                        v,
-                                        size="1024x1024"
-                                    )
-                                    if img_out:
-                                        save_generated_image(upload_ids[0], vid, json_prompt, v, img_out)
-                                        st.success(f"✅ Image {i+1} created successfully!")
-                                        progress_bar.progress((i+1)/len(variants))
-                                    else:
-                                        # If first prompt yields no image, stop all
-                                        if i == 0:
-                                            stop_all = True
-                                            st.error("First prompt returned no image. Stopping further generations.")
-                                            break
-
-                                    time.sleep(0.5)  # Small delay for better UX
-
-                                progress_bar.empty()
-                                status_text.empty()
+                            progress_bar.empty()
+                            status_text.empty()
+                            st.caption(analysis_timing_caption(analysis_timings))
 
+                            if not variants:
+                                if status_obj:
+                                    status_obj.update(label="No variants returned by assistant.", state="error")
+                            else:
                                 if status_obj:
                                     status_obj.update(label="Generation complete.", state="complete")
                                 st.info("Go to the 'Generated Ads' tab to see originals and all generated variants for this run.")
@@ -2164,6 +1077,9 @@ def main():
 
         uploaded_files = st.file_uploader("Upload images", type=["png","jpg","jpeg","webp"], accept_multiple_files=True, key="external_ads_uploader")
         desired_count_qt = st.slider("Number of prompts per image", min_value=1, max_value=5, value=3, key="qt_desired_count")
+        fresh_analysis_qt = fresh_analysis_toggle("qt_fresh_analysis")
+        variation_policy_qt = variation_policy_toggle("qt_force_new")
+        run_in_background_qt = background_toggle("qt_background")
 
         # Show uploaded images preview
         if uploaded_files:
@@ -2186,14 +1102,26 @@ def main():
                         img_bytes = uploaded.read()
                         images_data.append((uploaded.name or f"upload_{len(images_data)}", img_bytes))
 
+                    if run_in_background_qt:
+                        # The worker runs the analysis too; prompts show up in the jobs panel
+                        upload_ids = [save_uploaded_image(name, "image/png", data) for name, data in images_data]
+                        session_id = create_session(source="external_ads_generator", note=f"External Ads Generator: {len(images_data)} images (background)")
+                        link_session_uploads(session_id, upload_ids)
+                        st.session_state.current_session_id = session_id
+                        queue_generation_job(session_id, upload_ids, desired_count_qt, use_cache=not fresh_analysis_qt,
+                                             variation_policy=variation_policy_qt, variant_prefix="external_ad")
+                        st.rerun()
+
                     with st.spinner("🔍 Analyzing images with Assistant…"):
-                        base_json, variants_json = ae.analyze_images(None, None, images_data, desired_count=desired_count_qt)
+                        analysis_timings = {}
+                        base_json, variants_json = ae.analyze_images(None, None, images_data, desired_count=desired_count_qt, timings=analysis_timings, use_cache=not fresh_analysis_qt)
                         prompts = []
                         if isinstance(variants_json, dict) and "prompts" in variants_json:
                             prompts = list(variants_json.get("prompts") or [])
 
                         if prompts:
                             st.success(f"✅ Found {len(prompts)} prompt(s) from {len(uploaded_files)} image(s)")
+                            st.caption(analysis_timing_caption(analysis_timings))
 
                             # Create a session for this generation
                             session_note = f"External Ads Generator: {len(uploaded_files)} images → {len(prompts)} prompts"
@@ -2224,25 +1152,25 @@ def main():
                             generated_images = []
                             size = "1024x1024"  # Default size
 
-                            for i, prompt in enumerate(prompts):
-                                status_text.text(f"Generating ad {i+1}/{len(prompts)}...")
-                                progress_bar.progress((i) / len(prompts))
-
-                                try:
-                                    variant_data = {"prompt": str(prompt)}
-                                    img_out = ae.generate_single_variant_image(os.getenv("GOOGLE_API_KEY"), base_json, variant_data, size=size)
-                                    if img_out:
-                                        # Save to database
-                                        variant_id = f"external_ad_{i+1}"
-                                        save_generated_image(upload_ids[0], variant_id, base_json, variant_data, img_out)
-                                        generated_images.append((f"Ad {i+1}", img_out))
-                                    else:
-                                        # Stop if first prompt fails
-                                        if i == 0:
-                                            st.error("❌ First prompt returned no image. Stopping generation.")
-                                            break
-                                except Exception as ge:
+                            variant_list = [{"prompt": str(prompt)} for prompt in prompts]
+                            status_text.text(f"Generating {len(prompts)} ads ({ae.GEMINI_CONCURRENCY} at a time)...")
+
+                            def _on_ad(i, img_out, ge):
+                                # Called in prompt order from this thread as images finish
+                                if img_out:
+                                    # Save to database
+                                    variant_id = f"external_ad_{i+1}"
+                                    save_generated_image(upload_ids[0], variant_id, base_json, variant_list[i], img_out, session_id=st.session_state.get('current_session_id'))
+                                    generated_images.append((f"Ad {i+1}", img_out))
+                                elif i == 0:
+                                    # Stop if first prompt fails (the scheduler drops the rest)
+                                    st.error("❌ First prompt returned no image. Stopping generation.")
+                                else:
                                     st.warning(f"⚠️ Failed to generate ad {i+1}: {str(ge)[:50]}...")
+                                progress_bar.progress((i + 1) / len(prompts))
+                                status_text.text(f"Generated ad {i+1}/{len(prompts)}...")
+
+                            ae.generate_variants_concurrently(os.getenv("GOOGLE_API_KEY"), base_json, variant_list, size=size, on_result=_on_ad, variation_policy=variation_policy_qt)
 
                             progress_bar.progress(1.0)
                             status_text.empty()
@@ -2271,20 +1199,17 @@ def main():
             # Download All button
             col1, col2 = st.columns([1, 4])
             with col1:
-                import zipfile
-
-                zip_buffer = BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for i, (title, img_bytes) in enumerate(generated_ads):
-                        # Clean filename
-                        safe_name = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                        safe_name = safe_name.replace(' ', '_')
-                        zip_file.writestr(f"{safe_name}_{i+1}.png", img_bytes)
-
-                zip_buffer.seek(0)
+                zip_files = []
+                for i, (title, img_bytes) in enumerate(generated_ads):
+                    # Clean filename
+                    safe_name = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+                    safe_name = safe_name.replace(' ', '_')
+                    zip_files.append((f"{safe_name}_{i+1}.png", img_bytes))
+
+                # Archive is streamed to disk (and cached) only when the button is clicked
                 st.download_button(
                     label="📦 Download All",
-                    data=zip_buffer.getvalue(),
+                    data=partial(zip_export.archive_bytes, zip_export.export_images, zip_files),
                     file_name=f"external_ads_session_{st.session_state.get('external_ads_session_id', 'unknown')}.zip",
                     mime="application/zip",
                     key="download_all_external_ads"
@@ -2344,6 +1269,9 @@ def main():
 
                 # Generation settings
                 desired_count = st.slider("Number of variants per ad", min_value=1, max_value=5, value=3, key="collection_desired_count")
+                fresh_analysis = fresh_analysis_toggle("collection_fresh_analysis")
+                variation_policy = variation_policy_toggle("collection_force_new")
+                run_in_background = background_toggle("collection_background")
 
                 # Controls to save/generate for the entire collection
                 st.markdown('<div class="generate-sticky">', unsafe_allow_html=True)
@@ -2448,11 +1376,15 @@ def main():
                 else:
                     st.info("No ads in this collection yet. Save some ads from your search results!")
 
-                # Display generated images for this collection
-                generated_images = list_generated_for_collection(table_name)
-                if generated_images:
+                # Display generated images for this collection, one page at a time
+                total_generated = count_generated_for_collection(table_name)
+                if total_generated:
                     st.markdown("---")
                     st.markdown("### 🎨 Generated Images")
+                    generated_images, thumbs = load_gallery_page(
+                        f"collection_{table_name}", total_generated,
+                        lambda limit, after: list_generated_for_collection_page(table_name, limit, after)
+                    )
 
                     # Bulk delete and download controls for generated images
                     col1, col2, col3 = st.columns([2, 1, 1])
@@ -2472,31 +1404,19 @@ def main():
                             else:
                                 st.warning("No generated images selected")
                     with col3:
-                        if st.button("📥 Download All", key=f"download_all_gen_{table_name}", help="Download all generated images in this collection as ZIP"):
-                            import zipfile
-                            import io
-
-                            # Create a ZIP file in memory
-                            zip_buffer = io.BytesIO()
-                            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                                for i, gen_img in enumerate(generated_images):
-                                    img_b = get_generated_image_bytes(gen_img['id'])
-                                    if img_b:
-                                        filename = f"collection_{table_name}_variant_{gen_img['variant_id'] or f'var_{i+1}'}.png"
-                                        zip_file.writestr(filename, img_b)
-
-                            zip_buffer.seek(0)
-                            st.download_button(
-                                label="📥 Download ZIP",
-                                data=zip_buffer.getvalue(),
-                                file_name=f"collection_{table_name}_generated_ads.zip",
-                                mime="application/zip",
-                                key=f"zip_dl_{table_name}"
-                            )
+                        # Archive is streamed to disk (and cached) only when the button is clicked
+                        st.download_button(
+                            label="📥 Download All",
+                            data=partial(zip_export.archive_bytes, zip_export.export_collection, table_name),
+                            file_name=f"collection_{table_name}_generated_ads.zip",
+                            mime="application/zip",
+                            key=f"zip_dl_{table_name}",
+                            help="Download all generated images in this collection as ZIP"
+                        )
 
                     if st.button("🗑️ Delete All Generated", key=f"delete_all_gen_{table_name}", help="Delete all generated images in this collection"):
                         if st.session_state.get(f"confirm_delete_all_gen_{table_name}", False):
-                            all_ids = [gen_img['id'] for gen_img in generated_images]
+                            all_ids = [gen_img['id'] for gen_img in list_generated_for_collection(table_name)]
                             delete_generated_images(all_ids)
                             st.success(f"Deleted all {len(all_ids)} generated image(s)")
                             st.rerun()
@@ -2504,11 +1424,11 @@ def main():
                             st.session_state[f"confirm_delete_all_gen_{table_name}"] = True
                             st.warning("Click again to confirm deletion of ALL generated images")
 
-                    # Display generated images
+                    # Display generated images (thumbnails; full image only fetched on download)
                     cols = st.columns(3)
                     for i, gen_img in enumerate(generated_images):
                         with cols[i % 3]:
-                            img_b = get_generated_image_bytes(gen_img['id']) or b""
+                            img_b = thumbs.get(gen_img['id'])
                             if img_b:
                                 # Selection checkbox
                                 is_selected = st.checkbox("Select", key=f"sel_gen_{table_name}_{gen_img['id']}", value=select_all_gen)
@@ -2521,7 +1441,7 @@ def main():
                                 with col_dl:
                                     st.download_button(
                                         label="📥 Download",
-                                        data=img_b,
+                                        data=partial(get_generated_image_bytes, gen_img['id']),
                                         file_name=f"collection_{table_name}_variant_{(gen_img['variant_id'] or 'unknown')}.png",
                                         mime="image/png",
                                         key=f"dl_gen_{table_name}_{gen_img['id']}"
@@ -2581,72 +1501,79 @@ def main():
                     progress_bar.progress(1.0)
                     status_text.empty()
 
-                    if grouped_images:
+                    if grouped_images and run_in_background:
+                        sid = create_session(source=f"collection:{table_name}", note=f"{len(grouped_images)} images")
+                        st.session_state.current_session_id = sid
+                        link_session_uploads(sid, upload_ids)
+                        queue_generation_job(sid, upload_ids, desired_count, use_cache=not fresh_analysis, variation_policy=variation_policy)
+                        st.rerun()
+                    elif grouped_images:
                         try:
-                            # Progress bar for analysis
-                            analysis_progress = st.progress(0)
-                            analysis_status = st.empty()
-                            analysis_status.text("Analyzing images with Assistant…")
-
                             sid = create_session(source=f"collection:{table_name}", note=f"{len(grouped_images)} images")
                             st.session_state.current_session_id = sid
                             link_session_uploads(sid, upload_ids)
 
-                            # Default to desired_count slider above for collection as well
-                            json_prompt, variants_json = ae.analyze_images(None, None, grouped_images, desired_count=desired_count)
-                            analysis_progress.progress(1.0)
-                            analysis_status.empty()
+                            # Prompts stream in from the Assistant; each one starts generating as soon as it is written
+                            json_prompt = ae.direct_prompts_base(desired_count)
+                            analysis_timings = {}
+                            variants = []
+
+                            def _streamed_collection_variants():
+                                # Default to desired_count slider above for collection as well
+                                for i, prompt in enumerate(ae.stream_analysis_prompts(None, None, grouped_images, desired_count=desired_count, timings=analysis_timings, use_cache=not fresh_analysis)):
+                                    v = {"id": f"var_{i+1}", "prompt": prompt}
+                                    variants.append(v)
+                                    yield v
+
+                            # Show prompts prominently
+                            st.markdown("### 🎨 VU Engine Generated Prompts")
+                            prompts_box = st.container()
+
+                            # Progress bar for generation
+                            gen_progress = st.progress(0)
+                            gen_status = st.empty()
+                            gen_status.text("Analyzing images with Assistant…")
+
+                            def _on_collection_prompt(i, v):
+                                vid = v.get('id') or f"var_{i+1}"
+                                if i == 0:
+                                    status_obj2.update(label="Generating variants as prompts arrive…", state="running")
+                                with prompts_box:
+                                    st.markdown(f"**🎯 VU Engine Prompt {i+1} ({vid}):**")
+                                    st.text_area(
+                                        f"Prompt {i+1}",
+                                        value=ae.build_prompt_text(json_prompt, v),
+                                        height=120,
+                                        key=f"collection_prompt_display_{i}")
+                                gen_status.text(f"Prompt {i+1}/{desired_count} received, generating ({ae.GEMINI_CONCURRENCY} at a time)…")
+
+                            def _on_collection_variant(i, img_out, err):
+                                v = variants[i]
+                                vid = v.get('id') or f"var_{i}"
+                                if img_out:
+                                    save_generated_image(upload_ids[0], vid, json_prompt, v, img_out, session_id=st.session_state.get('current_session_id'))
+                                    st.toast(f"Created image for {vid}")
+                                elif err:
+                                    st.toast(f"Image for {vid} failed: {str(err)[:60]}")
+                                gen_progress.progress(min((i + 1) / desired_count, 1.0))
+                                gen_status.text(f"Generated image {i+1}/{desired_count}…")
+
+                            ae.generate_variants_concurrently(
+                                os.getenv("GOOGLE_API_KEY"),
+                                json_prompt,
+                                _streamed_collection_variants(),
+                                size="1024x1024",
+                                on_variant=_on_collection_prompt,
+                                on_result=_on_collection_variant,
+                                variation_policy=variation_policy
+                            )
 
-                            # Handle new direct prompt format
-                            variants = None
-                            if isinstance(variants_json, dict):
-                                if "vu_engine_variants" in variants_json:
-                                    # Legacy format
-                                    variants = variants_json["vu_engine_variants"]
-                                elif "prompts" in variants_json:
-                                    # New direct format - convert to expected structure
-                                    prompts = variants_json["prompts"]
-                                    variants = [{"id": f"var_{i+1}", "prompt": prompt} for i, prompt in enumerate(prompts)]
+                            gen_progress.progress(1.0)
+                            gen_status.empty()
+                            st.caption(analysis_timing_caption(analysis_timings))
                             if not variants:
                                 status_obj2.update(label="No variants returned by assistant.", state="error")
                             else:
-                                # Progress bar for generation
-                                gen_progress = st.progress(0)
-                                gen_status = st.empty()
-
-                                status_obj2.update(label="Generating all variants…", state="running")
-
-                                # Show prompts prominently
-                                st.markdown("### 🎨 VU Engine Generated Prompts")
-                                for idx, v in enumerate(variants):
-                                    vid = v.get('id') or f"var_{idx+1}"
-                                    prompt_text = ae.build_prompt_text(json_prompt, v)
-                                    st.markdown(f"**🎯 VU Engine Prompt {idx+1} ({vid}):**")
-                                    st.text_area(
-                                        f"Prompt {idx+1}",
-                                        value=prompt_text,
-                                        height=120,
-                                        key=f"collection_prompt_display_{idx}")
-
-                                # Generate images with progress tracking
-                                total_variants = len(variants)
-                                for i, v in enumerate(variants):
-                                    gen_progress.progress((i + 1) / total_variants)
-                                    gen_status.text(f"Generating image {i+1}/{total_variants}…")
-
-                                    vid = v.get('id') or f"var_{variants.index(v)}"
-                                    img_out = ae.generate_single_variant_image(
-                                        os.getenv("GOOGLE_API_KEY"),
-                                        json_prompt,
-                                        v,
-                                        size="1024x1024"
-                                    )
-                                    if img_out:
-                                        save_generated_image(upload_ids[0], vid, json_prompt, v, img_out)
-                                        st.toast(f"Created image for {vid}")
-
-                                gen_progress.progress(1.0)
-                                gen_status.empty()
                                 status_obj2.update(label="Generation complete.", state="complete")
                         except Exception as e:
                             status_obj2.update(label=f"Analysis failed: {e}", state="error")
@@ -2712,20 +1639,26 @@ def main():
                 st.info("This session has no original uploads recorded.")
             else:
                 st.markdown("### Original Images")
+                metas = get_upload_metas(upload_ids)
+                thumbs = get_upload_thumbnails(upload_ids)
                 cols = st.columns(4)
                 for i, uid in enumerate(upload_ids):
                     with cols[i % 4]:
-                        meta = get_upload_meta(uid)
-                        img_b = get_upload_bytes(uid) or b""
+                        meta = metas.get(uid)
+                        img_b = thumbs.get(uid)
                         if img_b:
                             label = meta['filename'] if meta else f"upload_{uid}"
                             st.image(img_b, caption=label, width='stretch')
             st.markdown("---")
             st.markdown("### Generated Images")
-            gens = list_generated_for_session(session['id'])
-            if not gens:
+            total_generated = count_generated_for_session(session['id'])
+            if not total_generated:
                 st.info("No generated images for this session yet.")
             else:
+                gens, thumbs = load_gallery_page(
+                    f"session_{session['id']}", total_generated,
+                    lambda limit, after: list_generated_for_session_page(session['id'], limit, after)
+                )
                 # Add bulk delete and download controls
                 col1, col2, col3 = st.columns([2, 1, 1])
                 with col1:
@@ -2745,31 +1678,19 @@ def main():
                         else:
                             st.warning("No images selected")
                 with col3:
-                    if st.button("📥 Download All", key=f"download_all_gen_{session['id']}", help="Download all generated images in this session as ZIP"):
-                        import zipfile
-                        import io
-
-                        # Create a ZIP file in memory
-                        zip_buffer = io.BytesIO()
-                        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                            for i, g in enumerate(gens):
-                                img_b = get_generated_image_bytes(g['id'])
-                                if img_b:
-                                    filename = f"session_{session['id']}_variant_{g['variant_id'] or f'var_{i+1}'}.png"
-                                    zip_file.writestr(filename, img_b)
-
-                        zip_buffer.seek(0)
-                        st.download_button(
-                            label="📥 Download ZIP",
-                            data=zip_buffer.getvalue(),
-                            file_name=f"session_{session['id']}_generated_ads.zip",
-                            mime="application/zip",
-                            key=f"zip_dl_{session['id']}"
-                        )
+                    # Archive is streamed to disk (and cached) only when the button is clicked
+                    st.download_button(
+                        label="📥 Download All",
+                        data=partial(zip_export.archive_bytes, zip_export.export_session, session['id']),
+                        file_name=f"session_{session['id']}_generated_ads.zip",
+                        mime="application/zip",
+                        key=f"zip_dl_{session['id']}",
+                        help="Download all generated images in this session as ZIP"
+                    )
 
                 if st.button("🗑️ Delete All", key=f"delete_all_gen_{session['id']}", help="Delete all generated images in this session"):
                     if st.session_state.get(f"confirm_delete_all_{session['id']}", False):
-                        all_ids = [g['id'] for g in gens]
+                        all_ids = [g['id'] for g in list_generated_for_session(session['id'])]
                         delete_generated_images(all_ids)
                         st.success(f"Deleted all {len(all_ids)} generated image(s)")
                         st.rerun()
@@ -2780,7 +1701,7 @@ def main():
                 cols = st.columns(3)
                 for i, g in enumerate(gens):
                     with cols[i % 3]:
-                        img_b = get_generated_image_bytes(g['id']) or b""
+                        img_b = thumbs.get(g['id'])
                         if img_b:
                             # Selection checkbox
                             is_selected = st.checkbox("Select", key=f"sel_gen_{session['id']}_{g['id']}", value=select_all)
@@ -2793,7 +1714,7 @@ def main():
                             with col_dl:
                                 st.download_button(
                                     label="📥 Download",
-                                    data=img_b,
+                                    data=partial(get_generated_image_bytes, g['id']),
                                     file_name=f"session_{session['id']}_variant_{(g['variant_id'] or 'unknown')}.png",
                                     mime="image/png",
                                     key=f"dl_{session['id']}_{g['id']}"
@@ -1,9 +1,13 @@
+import hashlib
 import json
 import re
 import time
 import base64
 import os
-from typing import List, Tuple, Dict, Any, Optional
+import queue
+import threading
+from concurrent.futures import CancelledError, Future, InvalidStateError, ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional, Callable, Iterable, Iterator
 from io import BytesIO
 
 from openai import OpenAI
@@ -12,6 +16,11 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+try:
+    from . import ads_repository  # when packaged
+except Exception:
+    import ads_repository  # when run directly
+
 # Optional: Google Gemini SDK
 try:
     import google.generativeai as genai  # type: ignore
@@ -25,6 +34,43 @@ ANALYSIS_ASSISTANT_ID = os.getenv("ANALYSIS_ASSISTANT_ID")
 # Google Gemini API key from environment variable
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Assistant runs: stream run events; when streaming is off/unavailable poll the run, sized from the run
+# times seen so far (every MAX seconds until there are some; see _wait_for_run)
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "1").strip().lower() not in ("0", "false", "no")
+RUN_POLL_INITIAL = float(os.getenv("ASSISTANT_POLL_INITIAL_SECONDS", "0.25"))
+RUN_POLL_MAX = float(os.getenv("ASSISTANT_POLL_MAX_SECONDS", "1"))
+
+# Analysis uploads: parallel files.create calls, images downscaled to what the vision model reads
+UPLOAD_CONCURRENCY = int(os.getenv("ASSISTANT_UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_SIDE = int(os.getenv("ASSISTANT_UPLOAD_MAX_SIDE", "2048"))
+UPLOAD_MAX_SHORT_SIDE = int(os.getenv("ASSISTANT_UPLOAD_MAX_SHORT_SIDE", "768"))
+UPLOAD_JPEG_QUALITY = int(os.getenv("ASSISTANT_UPLOAD_JPEG_QUALITY", "85"))
+
+# OpenAI file-id cache: reuse uploads of identical images across analyses until they expire;
+# entries not checked against the API for VALIDATE seconds are re-validated with files.retrieve
+OPENAI_FILE_CACHE = os.getenv("OPENAI_FILE_CACHE", "1").strip().lower() not in ("0", "false", "no")
+OPENAI_FILE_TTL = float(os.getenv("OPENAI_FILE_CACHE_TTL_HOURS", "72")) * 3600
+OPENAI_FILE_VALIDATE = float(os.getenv("OPENAI_FILE_CACHE_VALIDATE_SECONDS", "900"))
+
+# Analysis memo: reuse the Assistant's prompts for an identical image set + settings
+ANALYSIS_CACHE = os.getenv("ANALYSIS_CACHE", "1").strip().lower() not in ("0", "false", "no")
+
+# Gemini image model used for every variant
+GEMINI_IMAGE_MODEL = "models/gemini-2.5-flash-image-preview"
+
+# Gemini output cache (opt-in): images keyed by (model, prompt hash, size, variation index).
+# Variation policy for repeated prompts:
+#   reuse         - every repeat of a prompt gets the same image (generated once per batch, reused later)
+#   per_duplicate - the n-th repeat of a prompt within a batch is its own variation n (reruns reuse them)
+#   refresh       - always generate new images and replace the cached ones
+GEMINI_OUTPUT_CACHE = os.getenv("GEMINI_OUTPUT_CACHE", "0").strip().lower() in ("1", "true", "yes")
+GEMINI_VARIATION_POLICY = os.getenv("GEMINI_VARIATION_POLICY", "reuse").strip().lower()
+VARIATION_POLICIES = ("reuse", "per_duplicate", "refresh")
+
+# Variant generation scheduling: parallel requests and requests-per-minute budget (0 = unlimited)
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "10"))
+
 
 def _extract_json_blocks(text: str) -> List[dict]:
     blocks: List[str] = []
@@ -156,7 +202,7 @@ def _extract_prompts(text: str, desired_count: int = 5) -> List[str]:
     return prompts
 
 
-def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images: List[Tuple[str, bytes]], *, desired_count: int = 5) -> Tuple[dict, dict]:
+def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images: List[Tuple[str, bytes]], *, desired_count: int = 5, timings: Optional[Dict[str, float]] = None, use_cache: bool = True) -> Tuple[dict, dict]:
     """
     VU Engine Ad Creative Generator - Stage A & B Implementation
 
@@ -184,6 +230,8 @@ def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images:
 
     IMPORTANT: Sends ONLY images to assistant (no extra text input besides images).
     Returns base prompt JSON and a dict {"prompts": [..desired_count strings..]}.
+    Per-stage latencies (seconds) are written into `timings` when given.
+    Results are memoized (see stream_analysis_prompts); pass use_cache=False to force a fresh run.
 
     Required prompt qualities:
     - Must start with "Create a" or "Create an".
@@ -192,20 +240,13 @@ def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images:
     - Must describe composition placements explicitly.
     - Must include background/style and dynamic color scheme based on analyzed colors.
     """
-    api_key = api_key or API_KEY
-    assistant_id = assistant_id or ANALYSIS_ASSISTANT_ID
-    client = OpenAI(api_key=api_key)
+    prompts = list(stream_analysis_prompts(api_key, assistant_id, images, desired_count=desired_count, timings=timings, use_cache=use_cache))
+    return direct_prompts_result(prompts)
 
-    file_ids: List[str] = []
-    for name, data in images:
-        file = BytesIO(data)
-        file.name = f"{name}.png" if not hasattr(file, "name") else file.name
-        fr = client.files.create(file=file, purpose="vision")
-        file_ids.append(fr.id)
 
-    thread = client.beta.threads.create()
+def _instruction_text(desired_count: int) -> str:
     # Provide explicit instruction text to solve context and fidelity issues
-    instruction_text = (
+    return (
         f"You are an Ad Creative analyst. Analyze each uploaded image individually and create prompts that perfectly match each image's characteristics.\n"
         f"Generate exactly {desired_count} prompts total, distributed randomly but fairly across all uploaded images.\n"
         "CRITICAL DISTRIBUTION RULE:\n"
@@ -237,58 +278,432 @@ def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images:
         "- Example: 'Image 1: Create a...' then 'Image 2: Create a...' etc.\n"
     )
 
-    # Build a single message with instruction text followed by image parts
-    content: List[Dict[str, Any]] = [
-        {"type": "text", "text": instruction_text}
-    ]
-    for fid in file_ids:
-        content.append({"type": "image_file", "image_file": {"file_id": fid, "detail": "high"}})
 
-    client.beta.threads.messages.create(thread_id=thread.id, role="user", content=content)
-    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant_id)
+def _prepare_upload(name: str, data: bytes) -> Tuple[str, bytes]:
+    """Downscale/re-encode an image to the resolution the vision model actually reads.
+
+    High-detail vision input is fitted within UPLOAD_MAX_SIDE and then scaled so
+    the short side is at most UPLOAD_MAX_SHORT_SIDE; anything larger is only
+    upload time. Opaque images are re-encoded as JPEG, images with transparency
+    as PNG. The original bytes are kept when they are already smaller or when
+    PIL cannot read them.
+    """
+    name = os.path.splitext(name)[0] or name
+    try:
+        from PIL import Image
+    except ImportError:
+        return f"{name}.png", data
+    try:
+        img = Image.open(BytesIO(data))
+        fmt = (img.format or "PNG").lower()
+        scale = min(1.0, UPLOAD_MAX_SIDE / max(img.size), UPLOAD_MAX_SHORT_SIDE / min(img.size))
+        resized = scale < 1.0
+        if resized:
+            target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img.draft("RGB", target)  # JPEG: decode at a reduced scale; no-op for other formats
+            img = img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        out = BytesIO()
+        if has_alpha:
+            img.save(out, format="PNG", optimize=True)
+            ext = "png"
+        else:
+            img.convert("RGB").save(out, format="JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
+            ext = "jpg"
+        encoded = out.getvalue()
+    except Exception as e:  # noqa: BLE001
+        print(f"VU Engine: Could not downscale {name} ({e}); uploading original")
+        return f"{name}.png", data
+
+    original_ext = {"jpeg": "jpg", "png": "png", "webp": "webp", "gif": "gif"}.get(fmt)
+    if not resized and original_ext and len(encoded) >= len(data):
+        return f"{name}.{original_ext}", data
+    return f"{name}.{ext}", encoded
+
+
+def _upload_variant() -> str:
+    """Cache scope for the upload encoding: a settings change means different bytes on OpenAI's side."""
+    return f"{UPLOAD_MAX_SIDE}x{UPLOAD_MAX_SHORT_SIDE}q{UPLOAD_JPEG_QUALITY}"
+
+
+def _upload_images(client: OpenAI, images: List[Tuple[str, bytes]], timings: Dict[str, float], account: Optional[str] = None) -> Tuple[List[str], List[str], List[str]]:
+    """Resolve a file id per image, uploading on a bounded pool; identical images upload once.
+
+    With a cache `account` (see _file_cache_account), images already uploaded for
+    that account are served from the file-id cache: entries past OPENAI_FILE_TTL
+    are replaced, and entries not validated for OPENAI_FILE_VALIDATE seconds are
+    checked with files.retrieve first. Returns (file ids in input order, ids the
+    caller should delete after the run, cached ids used without validation).
+    If any upload fails, uncached uploads are deleted before the error is re-raised.
+    """
+    t0 = time.perf_counter()
+    hashes = [hashlib.sha256(data).hexdigest() for _, data in images]
+    unique: Dict[str, Tuple[str, bytes]] = {}
+    for hash_hex, item in zip(hashes, images):
+        unique.setdefault(hash_hex, item)
+    variant = _upload_variant()
+
+    now = time.time()
+    previous = ads_repository.get_openai_files(unique, account, variant) if account else {}
+    cached = {h: e for h, e in previous.items() if now - e["created_at"] < OPENAI_FILE_TTL}
+
+    def _upload(item: Tuple[str, bytes]) -> Tuple[str, int]:
+        filename, data = _prepare_upload(*item)
+        file = BytesIO(data)
+        file.name = filename
+        return client.files.create(file=file, purpose="vision").id, len(data)
+
+    def _resolve(hash_hex: str) -> Tuple[str, str, int]:
+        entry = cached.get(hash_hex)
+        if entry and now - entry["validated_at"] >= OPENAI_FILE_VALIDATE:
+            try:
+                client.files.retrieve(entry["file_id"])
+                return "validated", entry["file_id"], 0
+            except Exception as e:  # noqa: BLE001
+                print(f"VU Engine: Cached file {entry['file_id']} failed validation ({e}); re-uploading")
+                entry = None
+        if entry:
+            return "cached", entry["file_id"], 0
+        file_id, size = _upload(unique[hash_hex])
+        return "uploaded", file_id, size
+
+    workers = max(1, min(UPLOAD_CONCURRENCY, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-upload") as pool:
+        futures = {h: pool.submit(_resolve, h) for h in unique}
+    # Leaving the pool waited for every task, so results and errors are all settled here
+    resolved = {h: f.result() for h, f in futures.items() if f.exception() is None}
+    errors = [f.exception() for f in futures.values() if f.exception() is not None]
+
+    uploaded = [(h, fid, size) for h, (status, fid, size) in resolved.items() if status == "uploaded"]
+    if account:
+        # Remember successful uploads even when another one failed, so a retry starts further along;
+        # the expired or invalid files they replace are the caller's to delete
+        ads_repository.remember_openai_files(uploaded, account, variant)
+        ads_repository.touch_openai_files(fid for status, fid, _ in resolved.values() if status == "validated")
+        owned = [previous[h]["file_id"] for h, _, _ in uploaded if h in previous]
+    else:
+        owned = [fid for _, fid, _ in uploaded]
+    if errors:
+        _delete_files(client, owned)
+        raise errors[0]
+
+    timings["upload"] = time.perf_counter() - t0
+    counts = {status: 0 for status in ("cached", "validated", "uploaded")}
+    for status, _, _ in resolved.values():
+        counts[status] += 1
+    original = sum(len(unique[h][1]) for h, _, _ in uploaded)
+    sent = sum(size for _, _, size in uploaded)
+    print(f"VU Engine: {len(images)} image(s): {counts['cached']} cached, {counts['validated']} validated, "
+          f"{counts['uploaded']} uploaded ({original / 1e6:.1f} MB → {sent / 1e6:.1f} MB, {workers} at a time) "
+          f"in {timings['upload']:.2f}s")
+    unverified = [fid for status, fid, _ in resolved.values() if status == "cached"]
+    return [resolved[h][1] for h in hashes], owned, unverified
+
+
+def _file_cache_account(api_key: Optional[str]) -> Optional[str]:
+    """File ids are only valid for the account that uploaded them; key the cache by a key fingerprint."""
+    if not OPENAI_FILE_CACHE or not api_key:
+        return None
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _delete_files(client: OpenAI, file_ids: List[str]) -> None:
+    """Delete uploaded analysis files in parallel; failures are logged, not raised."""
+
+    def _delete(fid: str) -> None:
+        try:
+            client.files.delete(fid)
+        except Exception as e:  # noqa: BLE001
+            print(f"VU Engine: Could not delete uploaded file {fid}: {e}")
+
+    if not file_ids:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_CONCURRENCY, len(file_ids))), thread_name_prefix="openai-cleanup") as pool:
+        list(pool.map(_delete, file_ids))
+
+
+def _start_analysis_thread(client: OpenAI, images: List[Tuple[str, bytes]], desired_count: int, timings: Dict[str, float], cleanup: List[str], account: Optional[str] = None) -> str:
+    """Upload the images and post the instruction message; returns the thread id.
 
+    File ids the caller should delete once the run is over are appended to `cleanup`.
+    If the message is rejected while it references cached file ids that were not
+    re-validated, those cache entries are dropped and the images re-uploaded once.
+    """
+    file_ids, owned, unverified = _upload_images(client, images, timings, account)
+    cleanup.extend(owned)
+
+    t0 = time.perf_counter()
+    thread = client.beta.threads.create()
+
+    def _post(ids: List[str]) -> None:
+        # Build a single message with instruction text followed by image parts
+        content: List[Dict[str, Any]] = [
+            {"type": "text", "text": _instruction_text(desired_count)}
+        ]
+        for fid in ids:
+            content.append({"type": "image_file", "image_file": {"file_id": fid, "detail": "high"}})
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content=content)
+
+    try:
+        _post(file_ids)
+    except Exception as e:  # noqa: BLE001
+        if not unverified:
+            raise
+        print(f"VU Engine: Message rejected with cached file ids ({e}); re-uploading")
+        ads_repository.forget_openai_files(unverified)
+        file_ids, owned, _ = _upload_images(client, images, timings, account)
+        cleanup.extend(owned)
+        _post(file_ids)
+    timings["thread"] = time.perf_counter() - t0
+    return thread.id
+
+
+# Seconds per requested prompt of recent completed runs (moving average); sizes the first poll
+_run_seconds_per_prompt: Optional[float] = None
+
+
+def _note_run_seconds(seconds: float, prompts: int):
+    global _run_seconds_per_prompt
+    per_prompt = seconds / max(1, prompts)
+    previous = _run_seconds_per_prompt
+    _run_seconds_per_prompt = per_prompt if previous is None else (previous + per_prompt) / 2
+
+
+def _wait_for_run(client: OpenAI, thread_id: str, run: Any, prompts: int = 1, elapsed: float = 0.0) -> Any:
+    """Poll a run until it leaves the active states.
+
+    Once runs have completed in this process, the first poll comes at 90% of
+    the expected run time (their seconds per prompt × `prompts`, less the
+    `elapsed` seconds already spent), then every RUN_POLL_INITIAL until the
+    expected end, backing off to RUN_POLL_MAX after it; a typical run costs
+    two or three retrieves. Without that history the run is polled every
+    RUN_POLL_MAX.
+    """
+    expected = (_run_seconds_per_prompt or 0.0) * max(1, prompts)
+    due = time.perf_counter() + expected - elapsed
+    delay = max(RUN_POLL_INITIAL, 0.9 * expected - elapsed) if expected else RUN_POLL_MAX
     while run.status in ("queued", "in_progress", "cancelling"):
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        time.sleep(delay)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        delay = RUN_POLL_INITIAL if time.perf_counter() < due else min(delay * 1.5, RUN_POLL_MAX)
+    return run
 
-    if run.status != "completed":
-        raise RuntimeError(f"Assistant run failed: {run.status}")
 
-    msgs = client.beta.threads.messages.list(thread_id=thread.id)
-    raw: Optional[str] = None
+def _latest_assistant_text(client: OpenAI, thread_id: str) -> Optional[str]:
+    msgs = client.beta.threads.messages.list(thread_id=thread_id)
     for m in msgs.data:
         if m.role == "assistant":
             # take first text item
             for part in m.content:
                 if part.type == "text":
-                    raw = part.text.value
-                    break
-        if raw:
-            break
-    if not raw:
-        raise RuntimeError("No assistant response found")
+                    return part.text.value
+    return None
 
-    # VU Engine: Parse prompt-only output in the new format
-    # Extract any non-empty lines as prompts (no validation)
-    lines = [l.strip() for l in raw.splitlines() if l.strip() and len(l.strip()) > 10]
-    prompts = lines[:desired_count]
 
-    # If we don't have enough prompts, duplicate the last one
-    while len(prompts) < desired_count and prompts:
-        prompts.append(prompts[-1])
+def _iter_prompt_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Split streamed text into prompt lines as soon as each line is complete.
+
+    VU Engine: any non-empty line longer than 10 chars is a prompt (no validation).
+    """
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        *complete, buf = buf.split("\n")
+        for line in complete:
+            if len(line.strip()) > 10:
+                yield line.strip()
+    if len(buf.strip()) > 10:
+        yield buf.strip()
+
 
+# =============================================================================
+# ANALYSIS CACHE
+# =============================================================================
+
+_analysis_lock = threading.Lock()
+_analysis_counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "seconds_saved": 0.0}
+
+
+def instruction_version(desired_count: int) -> str:
+    """Fingerprint of the instructions sent to the Assistant; editing them invalidates cached analyses."""
+    return hashlib.sha256(_instruction_text(desired_count).encode()).hexdigest()[:12]
+
+
+def analysis_cache_key(image_hashes: List[str], desired_count: int, assistant_id: Optional[str], version: str) -> str:
+    payload = json.dumps([sorted(image_hashes), desired_count, assistant_id or "", version])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count_analysis(name: str, seconds_saved: float = 0.0) -> None:
+    with _analysis_lock:
+        _analysis_counters[name] += 1
+        _analysis_counters["seconds_saved"] += seconds_saved
+
+
+def analysis_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for this process plus the persistent cache's size and lifetime hits."""
+    with _analysis_lock:
+        out: Dict[str, Any] = dict(_analysis_counters)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = (out["hits"] / lookups) if lookups else 0.0
+    try:
+        summary = ads_repository.analysis_cache_summary()
+    except Exception as e:  # noqa: BLE001
+        print(f"VU Engine: Could not read analysis cache summary: {e}")
+        summary = {"entries": 0, "hits": 0, "seconds_saved": 0.0}
+    out["entries"] = summary["entries"]
+    out["lifetime_hits"] = summary["hits"]
+    out["lifetime_seconds_saved"] = summary["seconds_saved"]
+    return out
+
+
+def reset_analysis_cache_stats() -> None:
+    with _analysis_lock:
+        for k in _analysis_counters:
+            _analysis_counters[k] = 0.0 if k == "seconds_saved" else 0
+
+
+def stream_analysis_prompts(api_key: Optional[str], assistant_id: Optional[str], images: List[Tuple[str, bytes]], *, desired_count: int = 5, timings: Optional[Dict[str, float]] = None, use_cache: bool = True) -> Iterator[str]:
+    """Run the analysis Assistant and yield exactly desired_count prompts as they are written.
+
+    Uses the streaming run API so each prompt is yielded the moment its line is
+    complete; when streaming is disabled or unavailable, falls back to polling
+    the run with exponential backoff and yields the prompts at the end. If the
+    Assistant writes fewer prompts, the last one is repeated. `timings` receives
+    upload/thread/first_prompt/run/cleanup/total latencies in seconds.
+    Uploads are reused through the file-id cache (OPENAI_FILE_CACHE); without it
+    they are deleted once the run is over.
+
+    Completed analyses are memoized (ANALYSIS_CACHE) by the sorted image hashes,
+    desired_count, assistant id and instruction version; a hit yields the stored
+    prompts at once (timings: cache/total). use_cache=False skips the lookup and
+    stores the fresh result in its place.
+    """
+    assistant_id = assistant_id or ANALYSIS_ASSISTANT_ID
+    timings = timings if timings is not None else {}
+    if not ANALYSIS_CACHE:
+        yield from _stream_assistant_prompts(api_key, assistant_id, images, desired_count, timings)
+        return
+
+    started = time.perf_counter()
+    hashes = sorted(hashlib.sha256(data).hexdigest() for _, data in images)
+    version = instruction_version(desired_count)
+    key = analysis_cache_key(hashes, desired_count, assistant_id, version)
+    if use_cache:
+        cached = ads_repository.get_analysis_result(key)
+        if cached:
+            timings["cache"] = timings["total"] = time.perf_counter() - started
+            _count_analysis("hits", cached["analysis_seconds"] or 0.0)
+            print(f"VU Engine: Reusing cached analysis {key[:12]} (hit #{cached['hits']}, "
+                  f"skips ~{cached['analysis_seconds'] or 0:.1f}s of Assistant time)")
+            yield from cached["variants"]["prompts"][:desired_count]
+            return
+        _count_analysis("misses")
+    else:
+        _count_analysis("bypassed")
+
+    prompts: List[str] = []
+    for prompt in _stream_assistant_prompts(api_key, assistant_id, images, desired_count, timings):
+        prompts.append(prompt)
+        yield prompt
+    # Only a run that delivered every prompt gets here (errors and abandoned streams skip it)
+    base, variants = direct_prompts_result(prompts)
+    ads_repository.save_analysis_result(key, assistant_id=assistant_id, desired_count=desired_count,
+                                        instruction_version=version, image_hashes=hashes, base=base,
+                                        variants=variants, analysis_seconds=timings.get("total", 0.0))
+    _count_analysis("stores")
+
+
+def _stream_assistant_prompts(api_key: Optional[str], assistant_id: Optional[str], images: List[Tuple[str, bytes]], desired_count: int, timings: Dict[str, float]) -> Iterator[str]:
+    api_key = api_key or API_KEY
+    started = time.perf_counter()
+    client = OpenAI(api_key=api_key)
+    account = _file_cache_account(api_key)
+    cleanup: List[str] = []
+    try:
+        yield from _run_analysis(client, assistant_id, images, desired_count, timings, cleanup, account)
+    finally:
+        # Uncached uploads are only needed for this run; delete them even if it failed or was
+        # abandoned. With the cache on, only files past their expiry are deleted.
+        t0 = time.perf_counter()
+        if account:
+            cleanup.extend(ads_repository.pop_expired_openai_files(account, OPENAI_FILE_TTL))
+        _delete_files(client, cleanup)
+        timings["cleanup"] = time.perf_counter() - t0
+        timings["total"] = time.perf_counter() - started
+        print("VU Engine: Analysis timings " + " · ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+
+
+def _run_analysis(client: OpenAI, assistant_id: Optional[str], images: List[Tuple[str, bytes]], desired_count: int, timings: Dict[str, float], cleanup: List[str], account: Optional[str]) -> Iterator[str]:
+    thread_id = _start_analysis_thread(client, images, desired_count, timings, cleanup, account)
+
+    run_started = time.perf_counter()
+    prompts: List[str] = []
+    run = None
+
+    def _take(line: str) -> bool:
+        if len(prompts) >= desired_count:
+            return False
+        if not prompts:
+            timings["first_prompt"] = time.perf_counter() - run_started
+        prompts.append(line)
+        return True
+
+    started_run = None  # a run the stream created before it broke
+    if ASSISTANT_STREAMING:
+        stream = None
+        try:
+            with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id) as stream:
+                for line in _iter_prompt_lines(stream.text_deltas):
+                    if _take(line):
+                        yield line
+                run = stream.get_final_run()
+        except Exception as e:  # noqa: BLE001
+            if prompts:
+                raise
+            # The thread can't take a second run while this one is active: wait on it instead
+            started_run = getattr(stream, "current_run", None)
+            if started_run is not None:
+                print(f"VU Engine: Run stream broke ({e}); polling run {started_run.id} instead")
+            else:
+                print(f"VU Engine: Streaming run unavailable ({e}); polling instead")
+            run = None
+
+    if run is None:
+        run = started_run or client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        run = _wait_for_run(client, thread_id, run, desired_count, time.perf_counter() - run_started)
+        if run.status == "completed":
+            for line in _iter_prompt_lines([_latest_assistant_text(client, thread_id) or ""]):
+                if _take(line):
+                    yield line
+    timings["run"] = time.perf_counter() - run_started
+
+    if run.status == "completed":
+        _note_run_seconds(timings["run"], desired_count)
+    if run.status != "completed":
+        raise RuntimeError(f"Assistant run failed: {run.status}")
     if not prompts:
         raise RuntimeError("Assistant returned no usable prompts. Please check the assistant's output or adjust instructions.")
 
-    # Return prompts directly in the new format structure
-    base = {
+    # If we don't have enough prompts, duplicate the last one
+    while len(prompts) < desired_count:
+        prompts.append(prompts[-1])
+        yield prompts[-1]
+
+
+def direct_prompts_base(count: int) -> dict:
+    """Base prompt JSON for the direct-prompt format (the prompts themselves live in the variants)."""
+    return {
         "type": "vu_engine_direct_prompts",
         "engine": "VU Engine v2.0",
         "format": "direct_prompts",
-        "variations_count": len(prompts),
+        "variations_count": count,
         "note": "Direct VU Engine prompts - no JSON wrapper"
     }
 
+
+def direct_prompts_result(prompts: List[str]) -> Tuple[dict, dict]:
+    """Return prompts directly in the new format structure: (base, variants)."""
     variants = {
         "prompts": prompts,
         "metadata": {
@@ -299,8 +714,46 @@ def analyze_images(api_key: Optional[str], assistant_id: Optional[str], images:
             "structure_lock": "enabled"
         }
     }
+    return direct_prompts_base(len(prompts)), variants
+
 
-    return base, variants
+# =============================================================================
+# GEMINI MODEL REGISTRY
+# =============================================================================
+
+_models_lock = threading.Lock()
+_models: Dict[Tuple[str, str], Any] = {}
+_configured_key: Optional[str] = None
+
+
+def get_gemini_model(api_key: str, model_name: str = GEMINI_IMAGE_MODEL) -> Any:
+    """Return the GenerativeModel for (api key, model name), configuring and building it on first use.
+
+    Safe to call from the generation pool: construction happens once under a
+    lock and the model is shared afterwards. google.generativeai keeps the API
+    key process-wide, so configure() only runs again when a different key is
+    used; models are still cached per key so switching back costs nothing.
+    """
+    global _configured_key
+    if not genai:
+        raise RuntimeError("google-generativeai is not installed. Add it to requirements and install.")
+    cache_key = (hashlib.sha256(api_key.encode()).hexdigest(), model_name)
+    with _models_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+        model = _models.get(cache_key)
+        if model is None:
+            model = _models[cache_key] = genai.GenerativeModel(model_name)
+    return model
+
+
+def reset_gemini_models() -> None:
+    """Forget cached models and the configured key (e.g. after swapping the SDK module)."""
+    global _configured_key
+    with _models_lock:
+        _models.clear()
+        _configured_key = None
 
 
 def _gemini_generate_image(api_key: Optional[str], prompt_text: str, *, size: str = "1024x1024", reference_images: Optional[List[bytes]] = None) -> bytes:
@@ -324,12 +777,8 @@ def _gemini_generate_image(api_key: Optional[str], prompt_text: str, *, size: st
     if not key:
         raise RuntimeError("Missing Google API key. Set GOOGLE_API_KEY environment variable.")
 
-    # Configure SDK
-    genai.configure(api_key=key)
-
-    # Use the correct Gemini 2.5 Flash Image Preview model
-    model_name = "models/gemini-2.5-flash-image-preview"
-    model = genai.GenerativeModel(model_name)
+    # Configured once per key and model, then shared by every image and worker thread
+    model = get_gemini_model(key, GEMINI_IMAGE_MODEL)
 
     # Pass prompt verbatim as requested (no automatic additions)
     enhanced_prompt = str(prompt_text).strip()
@@ -507,16 +956,8 @@ def _gemini_generate_image(api_key: Optional[str], prompt_text: str, *, size: st
     raise RuntimeError("VU Engine Error: Gemini 2.5 Flash Image Preview did not return image bytes. The VU Engine may have issues with the prompt format or API configuration. Check that your Gemini API key has access to image generation and that the VU Engine prompt follows the required format.")
 
 
-def generate_single_variant_image(api_key: Optional[str], base_prompt_json: dict, variant_json: dict, *, size: str = "1024x1024", reference_images: Optional[List[bytes]] = None) -> bytes:
-    """VU Engine Single Variant Image Generation with Reference Images.
-
-    Generates one VU Engine variation from the new direct prompt format.
-    Uses reference images to ensure high similarity to originals.
-    Applies raw, casual, unpolished styling with imperfections within ±2% margin.
-    Preserves exact text structure and positioning while breaking polished patterns.
-
-    Now handles direct VU Engine prompt format with reference image support.
-    """
+def variant_prompt_text(variant_json: Any) -> str:
+    """The prompt text Gemini receives for a variant (direct string, "prompt" field or first of "prompts")."""
     # Handle new direct prompt format
     prompt_text = None
 
@@ -537,6 +978,20 @@ def generate_single_variant_image(api_key: Optional[str], base_prompt_json: dict
     if not prompt_text:
         # Final fallback
         prompt_text = "Create a simple ad with raw, unpolished styling and imperfections."
+    return prompt_text
+
+
+def generate_single_variant_image(api_key: Optional[str], base_prompt_json: dict, variant_json: dict, *, size: str = "1024x1024", reference_images: Optional[List[bytes]] = None) -> bytes:
+    """VU Engine Single Variant Image Generation with Reference Images.
+
+    Generates one VU Engine variation from the new direct prompt format.
+    Uses reference images to ensure high similarity to originals.
+    Applies raw, casual, unpolished styling with imperfections within ±2% margin.
+    Preserves exact text structure and positioning while breaking polished patterns.
+
+    Now handles direct VU Engine prompt format with reference image support.
+    """
+    prompt_text = variant_prompt_text(variant_json)
 
     # Pass the Assistant's prompt verbatim to Gemini
     print(f"VU Engine: Generating image for prompt (verbatim): {prompt_text[:140]}...")
@@ -560,3 +1015,251 @@ def build_prompt_text(base_prompt_json: dict, variant_json: dict) -> str:
     return json.dumps(prompt_copy, ensure_ascii=False, indent=2)
 
 
+# =============================================================================
+# VARIANT GENERATION SCHEDULER
+# =============================================================================
+
+class TokenBucket:
+    """Token bucket allowing `rate_per_minute` acquisitions on average, with bursts up to `capacity`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = max(0.0, float(rate_per_minute)) / 60.0  # tokens per second; 0 = unlimited
+        self.capacity = max(1.0, float(capacity if capacity is not None else 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """Block until a token is available. Returns False if `stop` is set while waiting."""
+        if self.rate <= 0:
+            return not (stop and stop.is_set())
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+def generate_variants_concurrently(
+    api_key: Optional[str],
+    base_prompt_json: dict,
+    variants: Iterable[Any],
+    *,
+    size: str = "1024x1024",
+    max_concurrency: Optional[int] = None,
+    rpm: Optional[float] = None,
+    on_variant: Optional[Callable[[int, Any], None]] = None,
+    on_result: Optional[Callable[[int, Optional[bytes], Optional[Exception]], None]] = None,
+    stop_on_first_failure: bool = True,
+    generate: Optional[Callable[..., bytes]] = None,
+    use_output_cache: Optional[bool] = None,
+    variation_policy: Optional[str] = None,
+) -> List[Optional[bytes]]:
+    """Generate one image per variant on a bounded pool under a requests-per-minute budget.
+
+    `variants` may be a list or any iterable, e.g. stream_analysis_prompts()
+    output: each variant is scheduled as soon as it arrives, so image 1 can be
+    generating while the Assistant is still writing prompt 5.
+
+    Callbacks run on the calling thread, so they can drive Streamlit widgets:
+    `on_variant(index, variant)` when a variant arrives, and
+    `on_result(index, image_bytes, error)` per finished variant, in variant order.
+    With `stop_on_first_failure`, variants that haven't started are dropped
+    (never reported) when the first variant fails, as the sequential flows used
+    to stop there too. `generate` defaults to generate_single_variant_image.
+
+    With the output cache (`use_output_cache`, default GEMINI_OUTPUT_CACHE),
+    variants whose (model, prompt, size, variation index) was generated before
+    are served from the cache without spending a request, and repeats of a
+    prompt within the batch share one generation under the "reuse" policy.
+    `variation_policy` (default GEMINI_VARIATION_POLICY) is one of
+    VARIATION_POLICIES; "refresh" forces new images.
+    """
+    generate = generate or generate_single_variant_image
+    cache_on = GEMINI_OUTPUT_CACHE if use_output_cache is None else use_output_cache
+    policy = (variation_policy or GEMINI_VARIATION_POLICY).strip().lower()
+    if policy not in VARIATION_POLICIES:
+        raise ValueError(f"Unknown variation policy {policy!r}; expected one of {', '.join(VARIATION_POLICIES)}")
+    batch_keys: Dict[str, Future] = {}
+    prompt_repeats: Dict[str, int] = {}
+    workers = max(1, int(max_concurrency if max_concurrency is not None else GEMINI_CONCURRENCY))
+    bucket = TokenBucket(GEMINI_RPM if rpm is None else rpm, capacity=workers)
+    stop = threading.Event()
+    events: "queue.Queue[Tuple[str, Any, Any]]" = queue.Queue()
+    futures: List[Any] = []
+    results: List[Optional[bytes]] = []
+    producer_error: List[Exception] = []
+
+    def _cache_entry(variant: Any) -> Tuple[str, str, int]:
+        prompt_hash = hashlib.sha256(variant_prompt_text(variant).encode()).hexdigest()
+        variation = 0
+        if policy == "per_duplicate":
+            variation = prompt_repeats.get(prompt_hash, 0)
+            prompt_repeats[prompt_hash] = variation + 1
+        return generation_cache_key(GEMINI_IMAGE_MODEL, prompt_hash, size, variation), prompt_hash, variation
+
+    def _run(variant: Any, entry: Optional[Tuple[str, str, int]] = None) -> Optional[bytes]:
+        if stop.is_set():
+            raise _Skipped()
+        if entry and policy != "refresh":
+            cached = ads_repository.get_cached_generation(entry[0])
+            if cached:
+                _count_generation("cached")
+                return cached
+        if not bucket.acquire(stop):
+            raise _Skipped()
+        image = generate(api_key, base_prompt_json, variant, size=size)
+        _count_generation("generated")
+        if entry and image:
+            ads_repository.store_generation(entry[0], image, model=GEMINI_IMAGE_MODEL, prompt_sha256=entry[1],
+                                            size=size, variation=entry[2])
+        return image
+
+    def _produce(pool: ThreadPoolExecutor):
+        count = 0
+        try:
+            for variant in variants:
+                if stop.is_set():
+                    break
+                events.put(("variant", count, variant))
+                entry = _cache_entry(variant) if cache_on else None
+                if entry and policy != "refresh" and entry[0] in batch_keys:
+                    # Same prompt, size and variation as an earlier variant: share its result
+                    fut = _shared_result(batch_keys[entry[0]])
+                    _count_generation("shared")
+                else:
+                    fut = pool.submit(_run, variant, entry)
+                    if entry:
+                        batch_keys[entry[0]] = fut
+                futures.append(fut)
+                fut.add_done_callback(lambda f, i=count: events.put(("done", i, f)))
+                count += 1
+        except Exception as e:  # noqa: BLE001 - e.g. the analysis stream failed midway
+            producer_error.append(e)
+        finally:
+            events.put(("end", count, None))
+
+    started = time.perf_counter()
+    finished: Dict[int, Optional[Tuple[Optional[bytes], Optional[Exception]]]] = {}  # None = skipped
+    next_to_deliver = 0
+    total: Optional[int] = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-gen") as pool:
+        producer = threading.Thread(target=_produce, args=(pool,), name="gemini-gen-feed", daemon=True)
+        producer.start()
+        try:
+            while total is None or next_to_deliver < total:
+                kind, i, payload = events.get()
+                if kind == "end":
+                    total = i
+                elif kind == "variant":
+                    results.append(None)
+                    if on_variant:
+                        on_variant(i, payload)
+                else:
+                    try:
+                        finished[i] = (payload.result(), None)
+                    except (_Skipped, CancelledError):
+                        finished[i] = None
+                    except Exception as e:  # noqa: BLE001
+                        finished[i] = (None, e)
+                    if i == 0 and stop_on_first_failure and not (finished[i] and finished[i][0]):
+                        stop.set()
+                        for f in list(futures):
+                            f.cancel()
+
+                # Deliver the contiguous finished prefix in order
+                while next_to_deliver in finished:
+                    outcome = finished.pop(next_to_deliver)
+                    if outcome is not None:
+                        results[next_to_deliver] = outcome[0]
+                        if on_result:
+                            on_result(next_to_deliver, *outcome)
+                    next_to_deliver += 1
+        except BaseException:
+            # A callback failed (or the user stopped the script): don't start anything new
+            stop.set()
+            for f in list(futures):
+                f.cancel()
+            raise
+        producer.join()
+
+    done = sum(1 for r in results if r)
+    print(f"VU Engine: Generated {done}/{len(results)} variant(s) in {time.perf_counter() - started:.1f}s "
+          f"(concurrency={workers}, rpm={bucket.rate * 60:g}"
+          + (f", output cache {policy}: {len(batch_keys)} unique)" if cache_on else ")"))
+    if producer_error:
+        raise producer_error[0]
+    return results
+
+
+class _Skipped(Exception):
+    """A variant dropped because generation was stopped before it started."""
+
+
+def _shared_result(source: Future) -> Future:
+    """A future that settles with `source`'s outcome, for a variant served by an earlier identical one."""
+    shared: Future = Future()
+
+    def _copy(src: Future) -> None:
+        try:
+            if src.cancelled():
+                shared.cancel()
+            elif src.exception() is not None:
+                shared.set_exception(src.exception())
+            else:
+                shared.set_result(src.result())
+        except InvalidStateError:
+            pass  # the shared future was cancelled on its own (generation stopped)
+
+    source.add_done_callback(_copy)
+    return shared
+
+
+# =============================================================================
+# GENERATION CACHE
+# =============================================================================
+
+_generation_lock = threading.Lock()
+_generation_counters = {"generated": 0, "cached": 0, "shared": 0}
+
+
+def generation_cache_key(model: str, prompt_sha256: str, size: str, variation: int) -> str:
+    return hashlib.sha256(json.dumps([model, prompt_sha256, size, variation]).encode()).hexdigest()
+
+
+def _count_generation(name: str) -> None:
+    with _generation_lock:
+        _generation_counters[name] += 1
+
+
+def generation_cache_stats() -> Dict[str, Any]:
+    """Requests made vs served from the cache or shared within a batch (this process), plus cache size."""
+    with _generation_lock:
+        out: Dict[str, Any] = dict(_generation_counters)
+    served = out["cached"] + out["shared"]
+    total = served + out["generated"]
+    out["saved_rate"] = (served / total) if total else 0.0
+    try:
+        summary = ads_repository.generation_cache_summary()
+    except Exception as e:  # noqa: BLE001
+        print(f"VU Engine: Could not read generation cache summary: {e}")
+        summary = {"entries": 0, "hits": 0}
+    out["entries"] = summary["entries"]
+    out["lifetime_hits"] = summary["hits"]
+    return out
+
+
+def reset_generation_cache_stats() -> None:
+    with _generation_lock:
+        for k in _generation_counters:
+            _generation_counters[k] = 0
+
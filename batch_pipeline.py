@@ -0,0 +1,253 @@
+"""
+Headless search → save → generate pipeline.
+
+Runs the same steps as the UI without a browser: fans out an Ads Library
+search per domain × country (ads_search.run_facebook_ads_fanout, ads deduped
+by ad_archive_id), saves every ad to a collection (save_ad_to_table, which stores the creative as an upload), then
+queues one analyze+generate job per saved ad (or per query with
+--group query) and runs them on --concurrency job slots through
+generation_worker.run_job. Jobs, sessions and images land in saved_ads.db
+exactly as the UI's would, so results show up in the Generated Ads tab.
+
+Progress is written as JSON lines (stdout by default, or --out); the engines'
+own logging goes to stderr.
+
+    python batch_pipeline.py --domains acme.com,example.com --countries US,GB \\
+        --count 20 --collection nightly --variants 3 --concurrency 2 > progress.jsonl
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, TextIO
+
+try:
+    from . import ads_repository as repo  # when packaged
+    from . import ads_search
+    from . import generation_worker
+except Exception:
+    import ads_repository as repo  # when run directly
+    import ads_search
+    import generation_worker
+
+SAVE_WORKERS = int(os.getenv("BATCH_SAVE_WORKERS", "8"))
+
+
+class ProgressLog:
+    """Thread-safe JSONL writer; every event carries `t`, seconds since the run started."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields: Any):
+        line = json.dumps({"event": event, "t": round(time.perf_counter() - self.started, 3), **fields}, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def _query_note(query: Dict[str, Any]) -> str:
+    return f"{query['domain']} {query['country']}" if query["domain"] else "unattributed"
+
+
+def _split(values: List[str]) -> List[str]:
+    """Accept both `--domains a.com b.com` and `--domains a.com,b.com`."""
+    return [v.strip() for value in values for v in value.split(",") if v.strip()]
+
+
+def resolve_collection(name: str, description: str = "") -> str:
+    """Use an existing collection table by name, or create one (create_ads_table adds the ads_ prefix)."""
+    existing = {row[0] for row in repo.get_available_tables()}
+    for candidate in (name, "ads_" + name.lower()):
+        if candidate in existing:
+            return candidate
+    return repo.create_ads_table(name, description)
+
+
+# =============================================================================
+# PIPELINE STEPS
+# =============================================================================
+
+def search(log: ProgressLog, apify_token: str, domains: List[str], countries: List[str], *,
+           mode: Optional[str] = None, concurrency: Optional[int] = None, **search_args) -> List[Dict[str, Any]]:
+    """Fan out one search per domain × country and dedup the ads; returns (query, ads) records for the
+    queries that succeeded. An ad found by several queries is listed under each of them; single-run ads
+    that matched no query go in a last record with domain and country None."""
+
+    def _on_query(query):
+        fields = {k: query[k] for k in ("domain", "country", "items", "kept")}
+        if query["error"]:
+            log.emit("search_error", **fields, error=query["error"][:500], seconds=round(query["seconds"], 3))
+        else:
+            log.emit("search", **fields, seconds=round(query["seconds"], 3))
+
+    result = ads_search.run_facebook_ads_fanout(apify_token, domains, countries, mode=mode,
+                                                max_concurrency=concurrency, on_query=_on_query, **search_args)
+    log.emit("search_done", queries=len(result["queries"]), ads=len(result["ads"]), duplicates=result["duplicates"],
+             unattributed=result["unattributed"],
+             new_by_query={f"{q['domain']}/{q['country']}": q["new"] for q in result["queries"]},
+             with_creative=sum(1 for ad in result["ads"] if ad.get("creative_url") or ad.get("original_image_url")),
+             scrape_seconds=round(result["scrape_seconds"], 3), validation_seconds=round(result["validation_seconds"], 3))
+    records = []
+    for query in result["queries"]:
+        if query["error"]:
+            continue
+        label = f"{query['domain']}/{query['country']}"
+        records.append({"domain": query["domain"], "country": query["country"],
+                        "ads": [ad for ad in result["ads"] if label in ad.get("matched_queries", ())]})
+    unattributed = [ad for ad in result["ads"] if not ad.get("matched_queries")]
+    if unattributed:
+        records.append({"domain": None, "country": None, "ads": unattributed})
+    return records
+
+
+def save(log: ProgressLog, table_name: str, queries: List[Dict[str, Any]], workers: int = SAVE_WORKERS) -> Dict[str, int]:
+    """Save every ad to the collection (image fetches run on `workers` threads). Returns ad_archive_id → upload_id."""
+    seen = set()
+    jobs = []
+    for query in queries:
+        for ad in query["ads"]:
+            ad_id = ad.get("ad_archive_id")
+            if ad_id and ad_id not in seen:
+                seen.add(ad_id)
+                jobs.append((query, ad))
+
+    def _save(job):
+        query, ad = job
+        try:
+            ok, message = repo.save_ad_to_table(table_name, ad, notes=f"batch: {_query_note(query)}")
+        finally:
+            repo.close_connection()
+        log.emit("saved", ad_archive_id=ad["ad_archive_id"], domain=query["domain"], country=query["country"],
+                 ok=ok, message=message)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch-save") as pool:
+        list(pool.map(_save, jobs))
+    uploads = {ad["ad_archive_id"]: ad.get("upload_id") for ad in repo.get_saved_ads(table_name)}
+    return {ad_id: uploads[ad_id] for ad_id in seen if uploads.get(ad_id)}
+
+
+def queue_jobs(log: ProgressLog, table_name: str, queries: List[Dict[str, Any]], upload_ids: Dict[str, int], *,
+               variants: int, group: str, use_cache: bool, variation_policy: Optional[str]) -> List[int]:
+    """Create a session per ad (or per query) and enqueue its analyze+generate job."""
+    groups = []
+    if group == "query":
+        for query in queries:
+            ids = list(dict.fromkeys(upload_ids[ad["ad_archive_id"]] for ad in query["ads"]
+                                     if ad.get("ad_archive_id") in upload_ids))
+            if ids:
+                groups.append((_query_note(query), ids))
+    else:
+        groups = [(f"ad {ad_id}", [uid]) for ad_id, uid in upload_ids.items()]
+
+    job_ids = []
+    for note, ids in groups:
+        sid = repo.create_session(source=f"batch:{table_name}", note=f"{note}: {len(ids)} images")
+        repo.link_session_uploads(sid, ids)
+        job_id = generation_worker.enqueue_generation(sid, ids, variants, use_cache=use_cache,
+                                                      variation_policy=variation_policy)
+        log.emit("job_queued", job_id=job_id, session_id=sid, uploads=len(ids), note=note)
+        job_ids.append(job_id)
+    return job_ids
+
+
+def generate(log: ProgressLog, job_ids: List[int], concurrency: int) -> List[Dict[str, Any]]:
+    """Run this batch's jobs on `concurrency` slots (other queued jobs are left to the workers)."""
+    worker_id = f"batch:{os.getpid()}"
+    slot_concurrency, slot_rpm = generation_worker.slot_budget(concurrency)
+    summaries = []
+
+    def _run(job_id: int):
+        try:
+            job = repo.claim_job(job_id, worker_id)
+            if job is None:
+                log.emit("job_skipped", job_id=job_id, reason="already claimed or cancelled")
+                return
+            summary = generation_worker.run_job(job, rpm=slot_rpm, max_concurrency=slot_concurrency,
+                                                on_event=lambda e: log.emit(e.pop("event"), **e))
+            summary.pop("timings", None)
+            log.emit("job_done", **summary)
+            summaries.append(summary)
+        finally:
+            repo.close_connection()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch-job") as pool:
+        list(pool.map(_run, job_ids))
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search, save and generate ads without the UI (JSONL progress)")
+    parser.add_argument("--domains", nargs="+", required=True, help="domains to search (space or comma separated)")
+    parser.add_argument("--countries", nargs="+", default=["US"], help="country codes (space or comma separated)")
+    parser.add_argument("--count", type=int, default=10, help="ads per search")
+    parser.add_argument("--active-status", default="active", choices=["active", "inactive", "all"])
+    parser.add_argument("--exact-phrase", action="store_true")
+    parser.add_argument("--fanout-mode", choices=list(ads_search.FANOUT_MODES), default=ads_search.FANOUT_MODE,
+                        help="one actor run per query, or every query in a single run")
+    parser.add_argument("--search-concurrency", type=int, default=ads_search.FANOUT_CONCURRENCY,
+                        help="actor runs at the same time in concurrent mode")
+    parser.add_argument("--collection", required=True, help="collection to save into (created if missing)")
+    parser.add_argument("--variants", type=int, default=3, help="images to generate per job (0 = search and save only)")
+    parser.add_argument("--group", choices=["ad", "query"], default="ad",
+                        help="one analysis per ad, or one per domain × country over all its ads (plus one for single-run ads no query matched)")
+    parser.add_argument("--concurrency", type=int, default=generation_worker.WORKER_JOBS,
+                        help="jobs generating at the same time (they share GEMINI_CONCURRENCY/GEMINI_RPM)")
+    parser.add_argument("--save-workers", type=int, default=SAVE_WORKERS)
+    parser.add_argument("--fresh-analysis", action="store_true", help="ignore cached Assistant prompts")
+    parser.add_argument("--variation-policy", choices=["reuse", "per_duplicate", "refresh"])
+    parser.add_argument("--apify-token", default=os.getenv("APIFY_TOKEN") or os.getenv("APIFY_API_TOKEN"))
+    parser.add_argument("--out", help="JSONL progress file (default: stdout)")
+    parser.add_argument("--db", default=repo.DB_PATH)
+    args = parser.parse_args()
+
+    if not args.apify_token:
+        parser.error("an Apify token is required (--apify-token or APIFY_TOKEN)")
+    repo.DB_PATH = args.db
+    out = open(args.out, "a", encoding="utf-8") if args.out else sys.stdout
+    log = ProgressLog(out)
+    domains, countries = _split(args.domains), _split(args.countries)
+
+    # Engine logging is print()-based; keep it off the JSONL stream
+    with contextlib.redirect_stdout(sys.stderr):
+        repo.init_database()
+        repo.init_generation_tables()
+        table_name = resolve_collection(args.collection, f"Batch pipeline: {', '.join(domains)}")
+        log.emit("start", domains=domains, countries=countries, collection=table_name,
+                 variants=args.variants, concurrency=args.concurrency)
+
+        queries = search(log, args.apify_token, domains, countries, mode=args.fanout_mode,
+                         concurrency=args.search_concurrency, count=args.count,
+                         exact_phrase=args.exact_phrase, active_status=args.active_status)
+        upload_ids = save(log, table_name, queries, args.save_workers)
+        summaries = []
+        if args.variants > 0 and upload_ids:
+            job_ids = queue_jobs(log, table_name, queries, upload_ids, variants=args.variants, group=args.group,
+                                 use_cache=not args.fresh_analysis, variation_policy=args.variation_policy)
+            gen_started = time.perf_counter()
+            summaries = generate(log, job_ids, args.concurrency)
+            gen_secs = time.perf_counter() - gen_started
+        else:
+            gen_secs = 0.0
+
+        images = sum(s["completed"] for s in summaries)
+        log.emit("summary", queries=sum(1 for q in queries if q["domain"]), ads=len({ad["ad_archive_id"] for q in queries for ad in q["ads"]}),
+                 saved=len(upload_ids),
+                 jobs=len(summaries), jobs_done=sum(1 for s in summaries if s["status"] == "done"),
+                 images=images, failed=sum(s["failed"] for s in summaries),
+                 generation_seconds=round(gen_secs, 3),
+                 images_per_min=round(images * 60 / gen_secs, 2) if gen_secs else 0.0,
+                 seconds=round(time.perf_counter() - log.started, 3))
+    if args.out:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
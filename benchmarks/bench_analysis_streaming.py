@@ -0,0 +1,105 @@
+"""
+Benchmark: Assistant analysis with the previous fixed 1s polling vs the
+current polling (cold, then sized from the previous run) vs a streamed run
+that feeds image generation as prompts arrive, plus a rerun of the same
+images served from the analysis cache.
+
+Uses the stub OpenAI client (benchmarks/fake_openai.py) and stub Gemini SDK
+(benchmarks/fake_genai.py). The Assistant sits queued for --queue-delay
+seconds, then writes one prompt every --prompt-time seconds. Caches live in a
+temporary database, not saved_ads.db.
+
+    python benchmarks/bench_analysis_streaming.py --prompts 5 --queue-delay 1.0 --prompt-time 0.8 --gen-latency 2.0
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ads_repository  # noqa: E402
+import assistant_engine as ae  # noqa: E402
+import fake_genai  # noqa: E402
+import fake_openai  # noqa: E402
+
+IMAGES = [("img_1", b"\x89PNG fake image 1"), ("img_2", b"\x89PNG fake image 2")]
+_wait_for_run = ae._wait_for_run
+
+
+def _fixed_wait_for_run(client, thread_id, run, prompts=1, elapsed=0.0):
+    """The previous poll loop: retrieve the run once a second."""
+    while run.status in ("queued", "in_progress", "cancelling"):
+        time.sleep(1.0)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+    return run
+
+
+def _analyze_then_generate(count: int, timings: dict, marks: dict):
+    base, variants_json = ae.analyze_images("stub", "asst_stub", IMAGES, desired_count=count, timings=timings)
+    marks["analysis_done"] = time.perf_counter()
+    variants = [{"id": f"var_{i + 1}", "prompt": p} for i, p in enumerate(variants_json["prompts"])]
+    ae.generate_variants_concurrently("stub", base, variants, on_result=lambda i, img, err: marks.setdefault("first_image", time.perf_counter()))
+
+
+def _streamed(count: int, timings: dict, marks: dict):
+    stream = ae.stream_analysis_prompts("stub", "asst_stub", IMAGES, desired_count=count, timings=timings)
+    variants = ({"id": f"var_{i + 1}", "prompt": p} for i, p in enumerate(stream))
+    ae.generate_variants_concurrently("stub", ae.direct_prompts_base(count), variants,
+                                      on_result=lambda i, img, err: marks.setdefault("first_image", time.perf_counter()))
+    marks["analysis_done"] = marks["t0"] + timings["total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--queue-delay", type=float, default=1.0)
+    parser.add_argument("--prompt-time", type=float, default=0.8)
+    parser.add_argument("--gen-latency", type=float, default=2.0, help="fake Gemini seconds per image")
+    args = parser.parse_args()
+
+    ae.genai = fake_genai.install(latency=args.gen_latency)
+    ae.OpenAI = fake_openai.install(prompt_count=args.prompts, queue_delay=args.queue_delay,
+                                    prompt_write_time=args.prompt_time, upload_latency=0.2)
+    ae.GEMINI_RPM = 0
+    ae.OPENAI_FILE_CACHE = False  # every scenario pays the same upload stage
+    ads_repository.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_analysis_"), "bench.db")
+
+    # (label, streaming, poll loop, forget earlier run times, run, cached)
+    scenarios = [
+        ("poll fixed 1s", False, _fixed_wait_for_run, True, _analyze_then_generate, False),
+        ("poll cold", False, _wait_for_run, True, _analyze_then_generate, False),
+        ("poll learned", False, _wait_for_run, False, _analyze_then_generate, False),
+        ("stream+overlap", True, _wait_for_run, False, _streamed, False),
+        ("cached rerun", True, _wait_for_run, False, _streamed, True),
+    ]
+    print(f"{args.prompts} prompts, queue {args.queue_delay}s, {args.prompt_time}s/prompt, Gemini {args.gen_latency}s/image")
+    print(f"{'path':<16}{'analysis':>10}{'1st prompt':>12}{'1st image':>11}{'all done':>10}{'polls':>7}")
+    for label, streaming, wait_for_run, forget, run, cached in scenarios:
+        ae.ASSISTANT_STREAMING, ae._wait_for_run = streaming, wait_for_run
+        if forget:
+            ae._run_seconds_per_prompt = None
+        ae.ANALYSIS_CACHE = cached
+        if cached:
+            with contextlib.redirect_stdout(io.StringIO()):
+                list(ae.stream_analysis_prompts("stub", "asst_stub", IMAGES, desired_count=args.prompts))
+        fake_openai.reset()
+        timings: dict = {}
+        marks = {"t0": time.perf_counter()}
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(args.prompts, timings, marks)
+        end = time.perf_counter()
+        t0 = marks["t0"]
+        first_prompt = timings["cache"] if cached else timings["upload"] + timings["thread"] + timings["first_prompt"]
+        print(f"{label:<16}{marks['analysis_done'] - t0:>9.2f}s{first_prompt:>11.2f}s"
+              f"{marks['first_image'] - t0:>10.2f}s{end - t0:>9.2f}s{fake_openai.counters['retrieves']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: the analysis upload stage, serial full-size uploads vs the bounded
+parallel pool with pre-upload downscaling, and a repeat analysis served from
+the file-id cache (first run fills it, second run reuses it).
+
+Builds --images photo-like PNGs at --size pixels and uploads them through the
+stub OpenAI client (benchmarks/fake_openai.py), which charges --latency per
+request plus size / --bandwidth. Reports the upload-stage time, bytes sent and
+how many files were uploaded and deleted. The cache lives in a temporary
+database, not saved_ads.db.
+
+    python benchmarks/bench_analysis_uploads.py --images 8 --size 2400x3000 --latency 0.4 --bandwidth 1.5e6
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+import ads_repository  # noqa: E402
+import assistant_engine as ae  # noqa: E402
+import fake_openai  # noqa: E402
+
+
+def _make_image(i: int, width: int, height: int) -> bytes:
+    # Gradient + shapes + mild noise: compresses like a real ad screenshot, not like a flat fill
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for k in range(12):
+        x, y = (k * 197 + i * 53) % width, (k * 311 + i * 97) % height
+        draw.rectangle([x, y, x + width // 5, y + height // 9], fill=((k * 40) % 256, (i * 70) % 256, 180))
+        draw.text((x + 10, y + 10), f"Offer {i}-{k}", fill=(255, 255, 255))
+    noise = Image.effect_noise((width // 2, height // 2), 24).resize((width, height)).convert("RGB")
+    img = Image.blend(img, noise, 0.15).filter(ImageFilter.SMOOTH)
+    out = io.BytesIO()
+    img.save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--size", default="2400x3000", help="WIDTHxHEIGHT of the generated images")
+    parser.add_argument("--latency", type=float, default=0.4, help="stub seconds per files.create call")
+    parser.add_argument("--bandwidth", type=float, default=1.5e6, help="stub bytes/second per upload")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    images = [(f"img_{i + 1}", _make_image(i, width, height)) for i in range(args.images)]
+    raw_mb = sum(len(d) for _, d in images) / 1e6
+
+    ae.OpenAI = fake_openai.install(upload_latency=args.latency, upload_bandwidth=args.bandwidth,
+                                    queue_delay=0.0, prompt_write_time=0.0, prompt_count=1)
+    ads_repository.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_uploads_"), "bench.db")
+    prepare = ae._prepare_upload
+    concurrency = ae.UPLOAD_CONCURRENCY
+    scenarios = [
+        ("serial, original", 1, False, False),
+        ("parallel, original", concurrency, False, False),
+        ("parallel, downscaled", concurrency, True, False),
+        ("cache, 1st run", concurrency, True, True),
+        ("cache, repeat", concurrency, True, True),
+    ]
+    print(f"{args.images} images {args.size} ({raw_mb:.1f} MB), stub {args.latency}s/request + {args.bandwidth / 1e6:.1f} MB/s")
+    print(f"{'path':<22}{'upload':>9}{'sent':>10}{'uploaded':>10}{'deleted':>9}")
+    for label, workers, downscale, cache in scenarios:
+        ae.UPLOAD_CONCURRENCY = workers
+        ae.OPENAI_FILE_CACHE = cache
+        ae._prepare_upload = prepare if downscale else (lambda name, data: (f"{name}.png", data))
+        fake_openai.reset()
+        timings: dict = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            list(ae.stream_analysis_prompts("stub", "asst_stub", images, desired_count=1, timings=timings,
+                                            use_cache=False))  # measure uploads, not the analysis memo
+        print(f"{label:<22}{timings['upload']:>8.2f}s{fake_openai.counters['bytes_uploaded'] / 1e6:>8.1f}MB"
+              f"{fake_openai.counters['files_created']:>10}{fake_openai.counters['files_deleted']:>9}")
+    ae._prepare_upload = prepare
+
+
+if __name__ == "__main__":
+    main()
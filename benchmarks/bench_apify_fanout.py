@@ -0,0 +1,82 @@
+"""
+Benchmark: serial per-query searches vs fan-out (concurrent runs / one run).
+
+Uses the stub Apify client (benchmarks/fake_apify.py): each actor run pays
+--start seconds of start-up, then --item-latency seconds per ad. Creative
+validation is stubbed out so only the search orchestration is measured.
+
+    python benchmarks/bench_apify_fanout.py --domains 20 --countries 5 --count 10 --start 2.0
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ads_search  # noqa: E402
+import fake_apify  # noqa: E402
+
+COUNTRY_CODES = ["US", "GB", "CA", "AU", "DE", "FR", "IT", "ES", "NL", "SE"]
+
+
+def _serial(domains, countries, count):
+    ads, seen, dup = [], set(), 0
+    for domain in domains:
+        for country in countries:
+            for ad in ads_search.run_facebook_ads_scrape("stub", domain, count=count, country=country):
+                if ad["ad_archive_id"] in seen:
+                    dup += 1
+                    continue
+                seen.add(ad["ad_archive_id"])
+                ads.append(ad)
+    return ads, dup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--countries", type=int, default=5)
+    parser.add_argument("--count", type=int, default=10, help="ads per query")
+    parser.add_argument("--start", type=float, default=2.0, help="fake actor start-up seconds per run")
+    parser.add_argument("--item-latency", type=float, default=0.02, help="fake seconds per scraped ad")
+    args = parser.parse_args()
+
+    ads_search.ApifyClient = fake_apify.install(start_latency=args.start, item_latency=args.item_latency)
+    ads_search._is_valid_creative = lambda url: True
+    domains = [f"competitor{i}.com" for i in range(args.domains)]
+    countries = COUNTRY_CODES[:args.countries]
+
+    scenarios = [
+        ("serial", None, None),
+        ("concurrent c=4", "concurrent", 4),
+        ("concurrent c=16", "concurrent", 16),
+        ("single_run", "single_run", None),
+    ]
+    print(f"{len(domains)} domains x {len(countries)} countries, {args.count} ads/query, "
+          f"start {args.start}s, {args.item_latency}s/ad")
+    print(f"{'mode':<17}{'wall':>8}{'runs':>6}{'peak':>6}{'unique':>8}{'dups':>6}{'query p50':>11}")
+    for label, mode, concurrency in scenarios:
+        fake_apify.reset()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode is None:
+                ads, dup = _serial(domains, countries, args.count)
+                p50 = (time.perf_counter() - t0) / (len(domains) * len(countries))
+            else:
+                result = ads_search.run_facebook_ads_fanout("stub", domains, countries, count=args.count,
+                                                            mode=mode, max_concurrency=concurrency)
+                ads, dup = result["ads"], result["duplicates"]
+                p50 = sorted(q["seconds"] for q in result["queries"])[len(result["queries"]) // 2]
+        secs = time.perf_counter() - t0
+        print(f"{label:<17}{secs:>7.2f}s{fake_apify.counters['runs']:>6}{fake_apify.counters['max_concurrent_runs']:>6}"
+              f"{len(ads):>8}{dup:>6}{p50:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
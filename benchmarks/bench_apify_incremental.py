@@ -0,0 +1,89 @@
+"""
+Benchmark: a blocking actor call() before reading the dataset vs starting the
+run and reading its dataset while the actor is still scraping
+(ads_search.APIFY_INCREMENTAL_READS, iter_run_pages).
+
+Uses the stub Apify client (benchmarks/fake_apify.py) with Ads Library-shaped
+items from bench_creative_extraction.make_item: the run starts after
+--start seconds and appends one item every --item-latency seconds; every
+dataset request costs --page-latency seconds. Creative validation is stubbed
+at --validate-latency seconds per candidate on the real validation pool, so
+with incremental reads it overlaps the scrape. Reports time to the first ad,
+total time, dataset requests and status polls for each path.
+
+    python benchmarks/bench_apify_incremental.py --count 500 --item-latency 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ads_search  # noqa: E402
+import fake_apify  # noqa: E402
+from bench_creative_extraction import make_item  # noqa: E402
+
+DOMAIN = "brand0.com"
+
+
+def _items(url, count):
+    rng = random.Random(count)
+    return [make_item(rng, n, pages=5) for n in range(count)]
+
+
+def _run(incremental: bool, count: int, page_size: int):
+    ads_search.APIFY_INCREMENTAL_READS = incremental
+    fake_apify.reset()
+    started = time.perf_counter()
+    first_ad = None
+    ads = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in ads_search.stream_facebook_ads_scrape("stub", DOMAIN, count=count, page_size=page_size):
+            ads += 1
+            if first_ad is None:
+                first_ad = time.perf_counter() - started
+    return {"ads": ads, "first_ad": first_ad, "total": time.perf_counter() - started,
+            "requests": fake_apify.counters["pages"], "polls": fake_apify.counters["status_polls"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500, help="ads the actor scrapes")
+    parser.add_argument("--page-size", type=int, default=ads_search.DATASET_PAGE_SIZE)
+    parser.add_argument("--start", type=float, default=1.0, help="actor start-up seconds")
+    parser.add_argument("--item-latency", type=float, default=0.01, help="actor seconds per scraped item")
+    parser.add_argument("--page-latency", type=float, default=0.02, help="seconds per dataset request")
+    parser.add_argument("--validate-latency", type=float, default=0.02, help="seconds per creative check")
+    parser.add_argument("--poll-initial", type=float, default=ads_search.APIFY_POLL_INITIAL)
+    parser.add_argument("--poll-max", type=float, default=ads_search.APIFY_POLL_MAX)
+    args = parser.parse_args()
+
+    ads_search.ApifyClient = fake_apify.install(start_latency=args.start, item_latency=args.item_latency,
+                                                page_latency=args.page_latency)
+    fake_apify.make_items = _items
+    ads_search.APIFY_POLL_INITIAL = args.poll_initial
+    ads_search.APIFY_POLL_MAX = args.poll_max
+    ads_search._is_valid_creative = lambda url: time.sleep(args.validate_latency) or True
+
+    scrape = args.start + args.count * args.item_latency
+    print(f"{args.count} ads, actor ~{scrape:.1f}s, pages of {args.page_size}, {args.page_latency}s/request, "
+          f"{args.validate_latency}s/check, polls {args.poll_initial}s..{args.poll_max}s")
+    print(f"{'path':<14}{'1st ad':>9}{'total':>9}{'requests':>10}{'polls':>7}")
+    results = {}
+    for label, incremental in (("call + read", False), ("incremental", True)):
+        result = results[label] = _run(incremental, args.count, args.page_size)
+        assert result["ads"] == args.count, result
+        print(f"{label:<14}{result['first_ad']:>8.2f}s{result['total']:>8.2f}s"
+              f"{result['requests']:>10}{result['polls']:>7}")
+    print(f"total speedup {results['call + read']['total'] / results['incremental']['total']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
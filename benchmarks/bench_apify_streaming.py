@@ -0,0 +1,116 @@
+"""
+Benchmark: reading the whole Apify dataset before processing it vs streaming
+it page by page (ads_search.stream_facebook_ads_scrape).
+
+Uses the stub Apify client (benchmarks/fake_apify.py) with Ads Library-shaped
+items from bench_creative_extraction.make_item. Every dataset request costs
+--page-latency seconds; creative validation is stubbed at --validate-latency
+seconds per candidate on the real validation pool. Reports time to the first
+ad, total time, and the peak memory the client side holds on top of the
+finished dataset (tracemalloc, measured in a separate pass).
+
+    python benchmarks/bench_apify_streaming.py --count 500 --page-size 25
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ads_search  # noqa: E402
+import fake_apify  # noqa: E402
+from bench_creative_extraction import make_item  # noqa: E402
+
+DOMAIN = "brand0.com"
+
+
+def _items(url, count):
+    rng = random.Random(count)
+    return [make_item(rng, n, pages=5) for n in range(count)]
+
+
+def materialized(count: int, page_size: int):
+    """The previous path: list() the whole dataset, parse it all, validate it all."""
+    client = ads_search.ApifyClient("stub")
+    dataset_id = ads_search._call_actor(client, [ads_search.build_ads_library_url(DOMAIN)], count, "active")
+    items = list(client.dataset(dataset_id).iterate_items())
+    kept = ads_search._select_items(items, None, None)
+    yield from ads_search._attach_creatives([(record, DOMAIN) for record in kept], "stub")
+
+
+def streamed(count: int, page_size: int):
+    return ads_search.stream_facebook_ads_scrape("stub", DOMAIN, count=count, page_size=page_size)
+
+
+def _run(path, count: int, page_size: int, trace: bool):
+    marks = {}
+    real_call = ads_search._call_actor
+
+    def _call_and_mark(*args, **kwargs):
+        dataset_id = real_call(*args, **kwargs)
+        marks["dataset_ready"] = time.perf_counter()
+        if trace:
+            marks["base"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        return dataset_id
+
+    ads_search._call_actor = _call_and_mark
+    if trace:
+        tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        ads = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in path(count, page_size):
+                ads += 1
+                marks.setdefault("first_ad", time.perf_counter())
+        marks["done"] = time.perf_counter()
+        if trace:
+            marks["peak"] = tracemalloc.get_traced_memory()[1] - marks["base"]
+    finally:
+        ads_search._call_actor = real_call
+        if trace:
+            tracemalloc.stop()
+    marks["ads"] = ads
+    marks["started"] = started
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500, help="ads in the dataset")
+    parser.add_argument("--page-size", type=int, default=ads_search.DATASET_PAGE_SIZE)
+    parser.add_argument("--start", type=float, default=1.0, help="actor run seconds before the dataset is ready")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="seconds per dataset request")
+    parser.add_argument("--validate-latency", type=float, default=0.02, help="seconds per creative check")
+    args = parser.parse_args()
+
+    ads_search.ApifyClient = fake_apify.install(start_latency=args.start, item_latency=0.0,
+                                                page_latency=args.page_latency)
+    fake_apify.make_items = _items
+    ads_search.APIFY_INCREMENTAL_READS = False  # both paths wait for the finished dataset here
+    ads_search._is_valid_creative = lambda url: time.sleep(args.validate_latency) or True
+
+    print(f"{args.count} ads, pages of {args.page_size}, {args.page_latency}s/request, "
+          f"{args.validate_latency}s/check, actor {args.start}s")
+    print(f"{'path':<14}{'1st ad':>9}{'total':>9}{'requests':>10}{'peak mem':>11}")
+    for label, path in (("materialized", materialized), ("streamed", streamed)):
+        fake_apify.reset()
+        timed = _run(path, args.count, args.page_size, trace=False)
+        requests = fake_apify.counters["pages"]
+        traced = _run(path, args.count, args.page_size, trace=True)
+        assert timed["ads"] == traced["ads"] == args.count
+        print(f"{label:<14}{timed['first_ad'] - timed['started']:>8.2f}s{timed['done'] - timed['started']:>8.2f}s"
+              f"{requests:>10}{traced['peak'] / 1048576:>9.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: inline SQLite BLOBs vs. the blob store.
+
+Builds a scratch saved_ads.db with generated images stored inline (the old
+layout), times a Generated Ads gallery render (list the session, load every
+original and variant) plus a full generated_ads scan, then runs the
+migration and repeats the measurements.
+
+    python benchmarks/bench_blob_store.py --sessions 20 --per-session 10 --image-kb 600
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def _seed_inline(sessions: int, per_session: int, image_kb: int):
+    conn = sqlite3.connect('saved_ads.db')
+    cursor = conn.cursor()
+    for s in range(sessions):
+        cursor.execute('INSERT INTO sessions (source, note) VALUES (?, ?)', ("bench", f"session {s}"))
+        sid = cursor.lastrowid
+        original = os.urandom(image_kb * 1024)
+        cursor.execute('INSERT INTO uploads (filename, content_type, sha256, data) VALUES (?, ?, ?, ?)',
+                       (f"orig_{s}.png", "image/png", f"legacy-{s}", sqlite3.Binary(original)))
+        uid = cursor.lastrowid
+        cursor.execute('INSERT INTO session_uploads (session_id, upload_id) VALUES (?, ?)', (sid, uid))
+        for v in range(per_session):
+            cursor.execute('''
+                INSERT INTO generated_ads (upload_id, session_id, variant_id, prompt_json, variant_json, image_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (uid, sid, f"var_{v + 1}", json.dumps({}), json.dumps({"prompt": "x" * 400}),
+                  sqlite3.Binary(os.urandom(image_kb * 1024))))
+    conn.commit()
+    conn.close()
+
+
+def _measure(repo, label: str):
+    sessions = repo.list_sessions()
+    t0 = time.perf_counter()
+    for session in sessions:
+        for uid in repo.list_session_uploads(session['id']):
+            repo.get_upload_meta(uid)
+            repo.get_upload_bytes(uid)
+        for g in repo.list_generated_for_session(session['id']):
+            repo.get_generated_image_bytes(g['id'])
+    gallery_s = (time.perf_counter() - t0) / len(sessions)
+
+    conn = sqlite3.connect('saved_ads.db')
+    t0 = time.perf_counter()
+    rows = conn.execute('SELECT * FROM generated_ads').fetchall()
+    scan_s = time.perf_counter() - t0
+    conn.close()
+
+    size_mb = os.path.getsize('saved_ads.db') / 1048576
+    print(f"{label:<8}{size_mb:>10.1f} MB{gallery_s * 1000:>14.1f} ms{scan_s * 1000:>16.1f} ms  ({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--per-session", type=int, default=10)
+    parser.add_argument("--image-kb", type=int, default=600)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_blob_store_")
+    os.chdir(workdir)
+
+    import ads_repository as repo  # noqa: E402
+    import blob_store  # noqa: E402
+
+    repo.DB_PATH = 'saved_ads.db'
+    repo.init_database()
+    repo.init_generation_tables()
+
+    blob_store.set_blob_store(blob_store.LocalBlobStore(os.path.join(workdir, "blob_store")))
+    _seed_inline(args.sessions, args.per_session, args.image_kb)
+
+    print(f"{args.sessions} sessions x ({args.per_session} variants + 1 original) x {args.image_kb} KB, scratch dir {workdir}")
+    print(f"{'layout':<8}{'db size':>13}{'gallery/session':>17}{'SELECT * scan':>19}")
+    _measure(repo, "inline")
+
+    t0 = time.perf_counter()
+    result = blob_store.migrate_sqlite_blobs('saved_ads.db')
+    print(f"migration: {result['uploads'] + result['generated_ads']} blobs in {time.perf_counter() - t0:.1f}s")
+    _measure(repo, "blobs")
+
+
+if __name__ == "__main__":
+    main()
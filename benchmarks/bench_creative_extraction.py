@@ -0,0 +1,240 @@
+"""
+Benchmark: per-item cost of ranking an ad's creative candidates, the previous
+multi-walk extractor vs the single-pass one in ads_search.
+
+Snapshots are synthetic Apify items shaped like Ads Library results (cards,
+images, video previews, profile pictures, ad copy, optional creative/creatives
+blocks), or recorded items from a JSON-lines file with --from (one Apify item
+per line). Every item's ranked URL list is compared between the two paths.
+
+    python benchmarks/bench_creative_extraction.py --items 10000
+    python benchmarks/bench_creative_extraction.py --from recorded_items.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import ads_search  # noqa: E402
+from ads_search import _get_snapshot_dict, estimate_image_size_from_url, find_creative_urls_in_object  # noqa: E402
+
+
+# =============================================================================
+# PREVIOUS EXTRACTOR (as it was before the single-pass walk)
+# =============================================================================
+
+def legacy_is_likely_creative_url(url):
+    if not ('fbcdn.net' in url or 'facebook.com' in url or 'fbsbx.com' in url):
+        return False
+    exclude_patterns = [
+        'icon', 'avatar', 'emoji', 'badge', '1x1', 'pixel', 'spinner',
+        '/photos/', '/profile/', '/pages/', '/groups/', '/events/',
+        'logo', 'brand', 'company', 'profile_picture', 'page_profile',
+        'thumbnail', 'small', 'tiny',
+        'video', '.mp4', 'video_hd_url', 'video_preview_image_url'
+    ]
+    if any(pattern in url.lower() for pattern in exclude_patterns):
+        return False
+    include_patterns = ['scontent', '/t39.', '/t31.', 'creative', 'ad', 'campaign']
+    return any(pattern in url.lower() for pattern in include_patterns)
+
+
+def legacy_find_creative_urls_deep(obj, path=""):
+    urls = []
+
+    def _search_recursive(current_obj, current_path):
+        if isinstance(current_obj, dict):
+            for k, v in current_obj.items():
+                new_path = f"{current_path}.{k}" if current_path else k
+                if isinstance(v, str) and legacy_is_likely_creative_url(v):
+                    urls.append({'url': v, 'source': new_path, 'type': 'deep_search',
+                                 'size_hint': estimate_image_size_from_url(v)})
+                else:
+                    _search_recursive(v, new_path)
+        elif isinstance(current_obj, list):
+            for i, item in enumerate(current_obj):
+                _search_recursive(item, f"{current_path}[{i}]")
+
+    _search_recursive(obj, path)
+    return urls
+
+
+def _legacy_story_image(story_spec, key, creative_type, creatives):
+    if story_spec.get(key):
+        data = story_spec[key]
+        if isinstance(data, dict) and data.get("image"):
+            img_url = data["image"]
+            if isinstance(img_url, dict) and img_url.get("url"):
+                url = img_url["url"]
+                if legacy_is_likely_creative_url(url):
+                    creatives.append({'url': url, 'source': f'creative.object_story_spec.{key}.image.url',
+                                      'type': creative_type, 'size_hint': estimate_image_size_from_url(url)})
+
+
+def legacy_extract(item, ad_id):
+    snap = _get_snapshot_dict(item)
+    creatives = []
+    if snap.get("creatives"):
+        creative_data = snap["creatives"]
+        if isinstance(creative_data, list):
+            for creative in creative_data:
+                if isinstance(creative, dict):
+                    creatives.extend(find_creative_urls_in_object(creative, f"creatives[{creative_data.index(creative)}]"))
+    if snap.get("creative"):
+        creative_obj = snap["creative"]
+        if isinstance(creative_obj, dict):
+            if creative_obj.get("thumbnail"):
+                thumb = creative_obj["thumbnail"]
+                if isinstance(thumb, str) and legacy_is_likely_creative_url(thumb):
+                    creatives.append({'url': thumb, 'source': 'creative.thumbnail', 'type': 'creative_thumbnail',
+                                      'size_hint': estimate_image_size_from_url(thumb)})
+            if creative_obj.get("object_story_spec"):
+                story_spec = creative_obj["object_story_spec"]
+                if isinstance(story_spec, dict):
+                    _legacy_story_image(story_spec, "link_data", "link_data_image", creatives)
+                    _legacy_story_image(story_spec, "video_data", "video_data_image", creatives)
+    for url_info in legacy_find_creative_urls_deep(snap):
+        url = url_info['url']
+        if any(skip in url.lower() for skip in [
+            'icon', 'avatar', 'emoji', 'badge', '1x1', 'pixel', 'spinner',
+            '/photos/', '/profile/', '/pages/', '/groups/', '/events/',
+            'logo', 'brand', 'company', 'profile_picture', 'page_profile',
+            'video', 'video_hd_url', 'video_preview_image_url'
+        ]):
+            continue
+        if legacy_is_likely_creative_url(url):
+            creatives.append(url_info)
+    seen_urls = set()
+    unique_creatives = []
+    priority_order = ['creative_thumbnail', 'link_data_image', 'video_data_image', 'direct_field', 'deep_search']
+    creatives.sort(key=lambda x: priority_order.index(x.get('type', 'deep_search')) if x.get('type') in priority_order else 999)
+    for creative in creatives:
+        if creative['url'] not in seen_urls:
+            seen_urls.add(creative['url'])
+            unique_creatives.append(creative)
+    return unique_creatives
+
+
+def legacy_rank(item, ad_id):
+    priority_order = {'creative_thumbnail': 1, 'link_data_image': 2, 'video_data_image': 3,
+                      'direct_field': 4, 'deep_search': 5}
+    creatives = legacy_extract(item, ad_id)
+    ranked = sorted(creatives, key=lambda c: (priority_order.get(c.get('type'), 999), -c.get('size_hint', 0)))
+    return [c['url'] for c in ranked]
+
+
+# =============================================================================
+# SNAPSHOTS
+# =============================================================================
+
+def _cdn(rng, kind, ad_id, n):
+    size = rng.choice(["s600x600", "p720x720", "s1080x1080"])
+    return f"https://scontent-{rng.choice(['iad3-1', 'lhr8-1', 'fra3-2'])}.xx.fbcdn.net/v/{kind}/{ad_id}_{n}_{size}_n.jpg?stp=dst-jpg&_nc_cat=1&oh=00_{rng.getrandbits(48):x}"
+
+
+def make_item(rng: random.Random, n: int, pages: int = 500) -> dict:
+    """One synthetic Ads Library item; the mix of layouts roughly follows real scrapes."""
+    ad_id = str(10 ** 15 + n)
+    page = n % pages
+    copy = " ".join(rng.choice(["Shop", "today", "free", "shipping", "limited", "offer", "new", "styles"]) for _ in range(40))
+    snap = {
+        "page_id": str(10 ** 14 + page),
+        "page_name": f"Brand {page}",
+        "page_profile_uri": f"https://www.facebook.com/brand{page}/",
+        "page_profile_picture_url": f"https://scontent.xx.fbcdn.net/v/t39.30808-1/profile_{page}_n.jpg",
+        "body": {"text": copy},
+        "title": "Limited offer",
+        "caption": f"brand{page}.com",
+        "link_url": f"https://brand{page}.com/p/{n}",
+        "link_description": copy[:120],
+        "cta_text": "Shop now",
+        "cta_type": "SHOP_NOW",
+        "display_format": rng.choice(["IMAGE", "DCO", "VIDEO", "CAROUSEL"]),
+        "branded_content": None,
+        "extra_texts": [{"text": copy[:60]}],
+        "extra_links": [],
+        "images": [],
+        "videos": [],
+        "cards": [],
+    }
+    for i in range(rng.choice([1, 1, 1, 2])):
+        snap["images"].append({"original_image_url": _cdn(rng, "t39.35426-6", ad_id, i),
+                               "resized_image_url": _cdn(rng, "t39.35426-6", ad_id, i).replace("_n.jpg", "_s.jpg"),
+                               "watermarked_resized_image_url": None})
+    if snap["display_format"] == "VIDEO":
+        snap["videos"].append({"video_hd_url": f"https://video.xx.fbcdn.net/v/t42.1790-2/{ad_id}_hd.mp4",
+                               "video_sd_url": f"https://video.xx.fbcdn.net/v/t42.1790-2/{ad_id}_sd.mp4",
+                               "video_preview_image_url": _cdn(rng, "t39.35426-6", ad_id, 9)})
+    if snap["display_format"] in ("CAROUSEL", "DCO"):
+        for i in range(rng.randint(2, 8)):
+            snap["cards"].append({"title": f"Card {i}", "body": copy[:80], "cta_text": "Shop now",
+                                  "link_url": f"https://brand{page}.com/p/{n}/{i}",
+                                  "original_image_url": _cdn(rng, "t39.35426-6", ad_id, 10 + i),
+                                  "resized_image_url": _cdn(rng, "t31.18172-8", ad_id, 10 + i),
+                                  "video_preview_image_url": None})
+    if n % 10 == 0:
+        snap["creative"] = {"thumbnail": _cdn(rng, "t39.30808-6", ad_id, 20),
+                            "object_story_spec": {"link_data": {"image": {"url": _cdn(rng, "t39.30808-6", ad_id, 21)}},
+                                                  "video_data": {"image": {"url": _cdn(rng, "t31.18172-8", ad_id, 22)}}}}
+    if n % 7 == 0:
+        snap["creatives"] = [{"image_url": _cdn(rng, "t39.30808-6", ad_id, 30 + i),
+                              "image": {"url": _cdn(rng, "t31.18172-8", ad_id, 40 + i)}} for i in range(2)]
+    if n % 5 == 0:
+        snap = json.dumps(snap)  # some scrapes return the snapshot as a JSON string
+    return {"ad_archive_id": ad_id, "page_name": f"Brand {page}", "start_date": 1704067200,
+            "is_active": True, "snapshot": snap}
+
+
+def load_items(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _time(rank, items, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            rank(item, item.get("ad_archive_id", ""))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000, help="synthetic items (ignored with --from)")
+    parser.add_argument("--from", dest="source", help="JSON-lines file of recorded Apify items")
+    parser.add_argument("--repeat", type=int, default=3, help="passes per extractor; the fastest counts")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.source:
+        items = load_items(args.source)
+    else:
+        rng = random.Random(args.seed)
+        items = [make_item(rng, n) for n in range(args.items)]
+
+    mismatches = 0
+    for item in items:
+        ad_id = item.get("ad_archive_id", "")
+        if legacy_rank(item, ad_id) != ads_search.rank_creative_candidate_urls(item, ad_id):
+            mismatches += 1
+
+    legacy_secs = _time(legacy_rank, items, args.repeat)
+    single_secs = _time(ads_search.rank_creative_candidate_urls, items, args.repeat)
+    print(f"{len(items)} items, best of {args.repeat}")
+    print(f"{'extractor':<14}{'total':>9}{'per item':>12}")
+    for label, secs in (("multi-walk", legacy_secs), ("single-pass", single_secs)):
+        print(f"{label:<14}{secs:>8.2f}s{secs * 1e6 / max(1, len(items)):>10.1f}µs")
+    print(f"speedup {legacy_secs / single_secs:.2f}x; ranked lists differing: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: serial vs pooled creative validation, and full download vs
+Range probe, against a local stub CDN.
+
+Each stub ad has a couple of "profile picture" candidates (too small to be a
+creative) ahead of the real creative, mimicking fbcdn snapshots. The stub
+listens on several loopback addresses so the per-host limit behaves like it
+does across real CDN edges.
+
+    python benchmarks/bench_creative_validation.py --ads 60 --latency 0.15
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import creative_validation as cv  # noqa: E402
+import image_fetcher  # noqa: E402
+from image_fetcher import fetch_image_bytes  # noqa: E402
+
+
+
+def _jpeg(side: int) -> bytes:
+    from PIL import Image
+
+    img = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    out = BytesIO()
+    img.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+CREATIVE_BYTES = _jpeg(600)
+PROFILE_PIC_BYTES = _jpeg(40)
+
+
+def _make_handler(latency: float):
+    class StubCDNHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real CDN
+        disable_nagle_algorithm = True
+
+        def do_GET(self):  # noqa: N802
+            time.sleep(latency)
+            body = PROFILE_PIC_BYTES if "/profile/" in self.path else CREATIVE_BYTES
+            total = len(body)
+            rng = self.headers.get("Range", "")
+            if rng.startswith("bytes=0-"):
+                end = min(int(rng.split("-", 1)[1]), total - 1)
+                body = body[:end + 1]
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes 0-{end}/{total}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubCDNHandler
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing early-rejected streams is expected
+
+
+def _candidate_lists(port: int, ads: int, hosts: int):
+    lists = []
+    for i in range(ads):
+        host = f"127.0.0.{1 + i % hosts}"
+        base = f"http://{host}:{port}"
+        lists.append([
+            f"{base}/profile/{i}_a.jpg",
+            f"{base}/profile/{i}_b.jpg",
+            f"{base}/t39.{i}/creative.jpg",
+        ])
+    return lists
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ads", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.15, help="stub response latency in seconds")
+    parser.add_argument("--hosts", type=int, default=4, help="number of loopback hosts to spread ads across")
+    parser.add_argument("--workers", type=int, default=cv.MAX_WORKERS)
+    parser.add_argument("--per-host", type=int, default=cv.PER_HOST_LIMIT)
+    parser.add_argument("--pool-size", type=int, default=image_fetcher.POOL_SIZE)
+    args = parser.parse_args()
+    image_fetcher.configure_client(pool_size=args.pool_size)
+
+    server = _QuietServer(("", 0), _make_handler(args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    def full(url):
+        return fetch_image_bytes(url, timeout=5.0)
+
+    def probe(url):
+        return image_fetcher.check_creative_url(url, probe=True)
+
+    scenarios = [
+        ("serial/full", full, 1),
+        ("pooled/full", full, args.workers),
+        ("pooled/probe", probe, args.workers),
+    ]
+
+    lists = _candidate_lists(port, args.ads, args.hosts)
+    rows = []
+    try:
+        for label, fetch, workers in scenarios:
+            image_fetcher.stats.reset()
+            t0 = time.perf_counter()
+            results = cv.validate_candidates_concurrently(
+                lists, fetch, max_workers=workers, per_host_limit=args.per_host
+            )
+            rows.append((label, time.perf_counter() - t0, results, image_fetcher.stats.snapshot()))
+    finally:
+        server.shutdown()
+
+    baseline = rows[0][2]
+    print(f"ads={args.ads} candidates/ad=3 latency={args.latency}s hosts={args.hosts} "
+          f"workers={args.workers} per_host={args.per_host}")
+    print(f"{'path':<14}{'wall':>9}{'speedup':>9}{'requests':>10}{'new conns':>11}{'reuse':>7}{'KB read':>10}  same result")
+    for label, secs, results, st in rows:
+        print(
+            f"{label:<14}{secs:>8.2f}s{rows[0][1] / secs:>8.1f}x{st['requests']:>10}{st['new_connections']:>11}"
+            f"{st['reuse_rate']:>7.0%}{st['bytes_received'] / 1024:>10.0f}  {'yes' if results == baseline else 'NO'}"
+        )
+    found = sum(1 for ok, _ in baseline if ok)
+    print(f"creatives found: {found}/{args.ads}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: per-image gallery loading vs batched thumbnails.
+
+Seeds a scratch saved_ads.db with one session of real PNG generations, then
+renders the session gallery's data three ways:
+
+- per-image:  get_upload_meta/get_upload_bytes per original and
+              get_generated_image_bytes per variant (full-size PNGs)
+- thumbs/cold: get_upload_metas + get_*_thumbnails on rows saved before
+               thumbnails existed (built on first view)
+- thumbs/warm: the same once the thumbnails table is populated (new saves
+               build their thumbnail at save time)
+
+and reports SQL statements, wall time and bytes that would be sent to the browser.
+
+    python benchmarks/bench_gallery_thumbnails.py --originals 4 --variants 40 --side 1024
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ads_repository as repo  # noqa: E402
+import blob_store  # noqa: E402
+
+
+def _png(side: int, seed: int) -> bytes:
+    """Photo-like PNG (gradient + noise) so sizes resemble real generations."""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((side, side))
+    noise = Image.effect_noise((side, side), 24 + seed % 16)
+    img = Image.merge("RGB", (gradient, noise, gradient.rotate(90)))
+    out = BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+def _per_image(session_id: int) -> int:
+    sent = 0
+    for uid in repo.list_session_uploads(session_id):
+        repo.get_upload_meta(uid)
+        sent += len(repo.get_upload_bytes(uid) or b"")
+    for g in repo.list_generated_for_session(session_id):
+        sent += len(repo.get_generated_image_bytes(g['id']) or b"")
+    return sent
+
+
+def _batched(session_id: int) -> int:
+    upload_ids = repo.list_session_uploads(session_id)
+    repo.get_upload_metas(upload_ids)
+    thumbs = repo.get_upload_thumbnails(upload_ids)
+    gens = repo.list_generated_for_session(session_id)
+    thumbs_g = repo.get_generated_thumbnails([g['id'] for g in gens])
+    return sum(map(len, thumbs.values())) + sum(map(len, thumbs_g.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--originals", type=int, default=4)
+    parser.add_argument("--variants", type=int, default=40)
+    parser.add_argument("--side", type=int, default=1024)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_thumbs_")
+    blob_store.set_blob_store(blob_store.LocalBlobStore(os.path.join(workdir, "blob_store")))
+    repo.DB_PATH = os.path.join(workdir, "saved_ads.db")
+    repo.init_database()
+    repo.init_generation_tables()
+
+    sid = repo.create_session("bench", "thumbnails")
+    uids = [repo.save_uploaded_image(f"orig_{i}.png", "image/png", _png(args.side, 1000 + i)) for i in range(args.originals)]
+    repo.link_session_uploads(sid, uids)
+    for v in range(args.variants):
+        repo.save_generated_image(uids[v % len(uids)], f"var_{v + 1}", {}, {}, _png(args.side, v), session_id=sid)
+
+    repo.get_connection().execute('DELETE FROM thumbnails')  # simulate pre-thumbnail rows
+    repo.get_connection().commit()
+
+    statements = []
+    repo.get_connection().set_trace_callback(statements.append)
+
+    print(f"{args.originals} originals + {args.variants} variants, {args.side}px PNGs, thumbnails {repo.THUMBNAIL_SIZE}px WebP")
+    print(f"{'path':<13}{'SQL stmts':>10}{'wall':>11}{'sent to browser':>18}")
+    for label, render in (("per-image", _per_image), ("thumbs/cold", _batched), ("thumbs/warm", _batched)):
+        statements.clear()
+        t0 = time.perf_counter()
+        sent = render(sid)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<13}{len(statements):>10}{elapsed * 1000:>9.1f}ms{sent / 1024:>15.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: per-image SDK overhead of configuring and constructing the Gemini
+model on every image (the old path) vs the cached model registry.
+
+Uses the stub Gemini SDK (benchmarks/fake_genai.py) with --configure-cost and
+--model-cost seconds charged per genai.configure() / GenerativeModel(); the
+generate call itself costs --latency (0 isolates the overhead).
+
+    python benchmarks/bench_gemini_model_registry.py --images 40 --configure-cost 0.01 --model-cost 0.03
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import assistant_engine as ae  # noqa: E402
+import fake_genai  # noqa: E402
+
+
+def _configure_every_time(api_key, model_name=ae.GEMINI_IMAGE_MODEL):
+    # The old behaviour: configure and build a model inside every image call
+    ae.genai.configure(api_key=api_key)
+    return ae.genai.GenerativeModel(model_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--configure-cost", type=float, default=0.01)
+    parser.add_argument("--model-cost", type=float, default=0.03)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake Gemini seconds per image")
+    args = parser.parse_args()
+
+    ae.genai = fake_genai.install(latency=args.latency, configure_cost=args.configure_cost, model_init_cost=args.model_cost)
+    ae.GEMINI_RPM = 0
+    ae.GEMINI_OUTPUT_CACHE = False
+    variants = [{"id": f"var_{i + 1}", "prompt": f"Create a raw ad with the text \"Offer {i + 1}\""} for i in range(args.images)]
+
+    print(f"{args.images} images, configure {args.configure_cost * 1000:.0f} ms, model init {args.model_cost * 1000:.0f} ms, "
+          f"generate {args.latency * 1000:.0f} ms")
+    print(f"{'path':<22}{'wall':>8}{'per image':>11}{'configure':>11}{'models':>8}")
+    registry = ae.get_gemini_model
+    for label, get_model, workers in (("per image, serial", _configure_every_time, 1),
+                                      ("registry, serial", registry, 1),
+                                      ("per image, c=4", _configure_every_time, 4),
+                                      ("registry, c=4", registry, 4)):
+        ae.get_gemini_model = get_model
+        ae.reset_gemini_models()
+        fake_genai.reset()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # the engine logs every response
+            results = ae.generate_variants_concurrently("stub-key", {}, variants, max_concurrency=workers)
+        secs = time.perf_counter() - t0
+        assert all(results)
+        print(f"{label:<22}{secs:>7.2f}s{secs / args.images * 1000:>9.1f}ms"
+              f"{fake_genai.counters['configure']:>11}{fake_genai.counters['models']:>8}")
+    ae.get_gemini_model = registry
+
+
+if __name__ == "__main__":
+    main()
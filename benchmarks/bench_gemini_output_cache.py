@@ -0,0 +1,66 @@
+"""
+Benchmark: Gemini requests and wall time for a batch with padded duplicate
+prompts, without the output cache vs each variation policy, cold (first
+session) and warm (the same prompts again in a later session).
+
+Uses the stub Gemini SDK (benchmarks/fake_genai.py). The cache and its blobs
+live in a temporary directory, not saved_ads.db / blob_store.
+
+    python benchmarks/bench_gemini_output_cache.py --unique 3 --variants 5 --latency 1.0
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_output_cache_")
+os.environ["BLOB_STORE_BACKEND"] = "local"
+os.environ["BLOB_STORE_DIR"] = os.path.join(TMP_DIR, "blobs")
+
+import ads_repository  # noqa: E402
+import assistant_engine as ae  # noqa: E402
+import fake_genai  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--unique", type=int, default=3, help="distinct prompts the Assistant wrote")
+    parser.add_argument("--variants", type=int, default=5, help="desired_count (the last prompt pads the rest)")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake Gemini seconds per image")
+    args = parser.parse_args()
+
+    ae.genai = fake_genai.install(latency=args.latency)
+    ae.GEMINI_RPM = 0
+    prompts = [f"Create a raw ad with the text \"Offer {i + 1}\"" for i in range(args.unique)]
+    prompts += [prompts[-1]] * (args.variants - len(prompts))
+    variants = [{"id": f"var_{i + 1}", "prompt": p} for i, p in enumerate(prompts)]
+
+    scenarios = [("no cache", False, "reuse"), ("reuse", True, "reuse"),
+                 ("per_duplicate", True, "per_duplicate"), ("refresh", True, "refresh")]
+    print(f"{args.variants} variants ({args.unique} unique prompts), fake Gemini {args.latency}s/image, "
+          f"concurrency {ae.GEMINI_CONCURRENCY}")
+    print(f"{'policy':<15}{'cold req':>9}{'cold':>8}{'warm req':>10}{'warm':>8}")
+    for label, cache, policy in scenarios:
+        ads_repository.DB_PATH = os.path.join(TMP_DIR, f"{label.replace(' ', '_')}.db")
+        row = []
+        for _ in ("cold", "warm"):
+            fake_genai.reset()
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = ae.generate_variants_concurrently("stub-key", {}, variants, use_output_cache=cache,
+                                                            variation_policy=policy)
+            assert all(results)
+            row += [fake_genai.counters["calls"], time.perf_counter() - t0]
+        print(f"{label:<15}{row[0]:>9}{row[1]:>7.2f}s{row[2]:>10}{row[3]:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: sequential variant generation vs the concurrent scheduler.
+
+Runs assistant_engine's full generation path against a fake Gemini SDK
+(benchmarks/fake_genai.py) with a fixed per-image latency, comparing the old
+loop (one variant at a time plus the 0.5s UX sleep) with
+generate_variants_concurrently at a few concurrency/RPM settings.
+
+    python benchmarks/bench_gemini_scheduler.py --variants 8 --latency 1.0
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import assistant_engine as ae  # noqa: E402
+import fake_genai  # noqa: E402
+
+
+def _sequential(variants):
+    out = []
+    for v in variants:
+        out.append(ae.generate_single_variant_image("stub-key", {}, v, size="1024x1024"))
+        time.sleep(0.5)  # the old loops' "small delay for better UX"
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake Gemini seconds per image")
+    args = parser.parse_args()
+
+    ae.genai = fake_genai.install(latency=args.latency)
+    variants = [{"id": f"var_{i + 1}", "prompt": f"Create a raw ad with the text \"Offer {i + 1}\""} for i in range(args.variants)]
+
+    scenarios = [
+        ("sequential", None, None),
+        ("c=2 rpm=unl", 2, 0),
+        ("c=4 rpm=unl", 4, 0),
+        ("c=4 rpm=120", 4, 120),
+        ("c=8 rpm=unl", 8, 0),
+    ]
+    print(f"{args.variants} variants, fake Gemini latency {args.latency}s")
+    print(f"{'schedule':<14}{'wall':>8}{'img/min':>9}{'max in flight':>15}  in order")
+    for label, concurrency, rpm in scenarios:
+        fake_genai.reset()
+        order = []
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # the engine logs every response
+            if concurrency is None:
+                results = _sequential(variants)
+                order = list(range(len(results)))
+            else:
+                results = ae.generate_variants_concurrently(
+                    "stub-key", {}, variants, max_concurrency=concurrency, rpm=rpm,
+                    on_result=lambda i, img, err: order.append(i),
+                )
+        secs = time.perf_counter() - t0
+        ok = sum(1 for r in results if r)
+        print(f"{label:<14}{secs:>7.2f}s{ok * 60 / secs:>9.1f}{fake_genai.counters['max_in_flight']:>15}  "
+              f"{'yes' if order == sorted(order) and len(order) == ok else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: memory held by search results in session state, a list of ad
+dicts vs an AdResultSet, plus the cost of one render pass over the rows.
+
+Ads are built the way a search builds them (ads_search.parse_ad_item over
+synthetic Apify items, plus the creative and matched_queries fields). Each
+simulated browser session decodes its own copy, as separate searches do, so
+nothing is shared between sessions except what the container interns. Memory
+is what tracemalloc sees retained after the ads are stored.
+
+    python benchmarks/bench_result_set_memory.py --ads 500 --sessions 8
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ads_search  # noqa: E402
+from ad_results import AdResultSet  # noqa: E402
+from bench_creative_extraction import make_item  # noqa: E402
+
+# What display_ad_card reads for every card on a rerun
+CARD_FIELDS = ("page_name", "ad_archive_id", "is_active", "cta_text", "start_date", "original_image_url",
+               "creative_url", "video_url", "display_url", "creative_found", "creative_urls", "page_id",
+               "categories", "cta_type", "website_url", "end_date", "total_active_time", "collation_count",
+               "entity_type")
+
+
+def search_payload(ads: int, seed: int, pages: int) -> str:
+    """One search's ads, serialized so every session can decode a private copy."""
+    rng = random.Random(seed)
+    out = []
+    for n in range(ads):
+        record = ads_search.parse_ad_item(make_item(rng, n, pages))
+        ad = record.to_dict()
+        ad["matched_queries"] = [f"brand{n % pages}.com/{rng.choice(['US', 'GB', 'CA'])}"]
+        urls = record.ranked_creative_urls()[:1]
+        ad.update(creative_found=bool(urls), creative_urls=urls, creative_url=urls[0] if urls else None)
+        out.append(ad)
+    return json.dumps(out)
+
+
+def _retained(build, payload: str, sessions: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(json.loads(payload)) for _ in range(sessions)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+
+def _render_pass(ads) -> float:
+    started = time.perf_counter()
+    for ad in ads:
+        for field in CARD_FIELDS:
+            ad.get(field)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ads", type=int, default=500, help="ads per search")
+    parser.add_argument("--sessions", type=int, default=8, help="browser sessions holding a copy")
+    parser.add_argument("--pages", type=int, default=5, help="distinct Facebook pages among the ads")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    payload = search_payload(args.ads, args.seed, args.pages)
+    total = args.ads * args.sessions
+    print(f"{args.ads} ads from {args.pages} page(s) × {args.sessions} session(s)")
+    print(f"{'storage':<14}{'retained':>11}{'per ad':>10}{'render pass':>14}")
+    results = {}
+    for label, build in (("list of dicts", lambda ads: ads), ("AdResultSet", AdResultSet)):
+        kept, used = _retained(build, payload, args.sessions)
+        render = min(_render_pass(kept[0]) for _ in range(5))
+        results[label] = used
+        print(f"{label:<14}{used / 1048576:>9.2f}MB{used / total:>9.0f}B{render * 1000:>12.2f}ms")
+        assert [dict(ad) for ad in kept[0]] == json.loads(payload)
+        del kept
+    print(f"memory ratio {results['list of dicts'] / results['AdResultSet']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
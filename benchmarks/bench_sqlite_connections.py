@@ -0,0 +1,110 @@
+"""
+Benchmark: connection-per-call SQLite vs the pooled WAL connection layer.
+
+Seeds a scratch saved_ads.db (blob store on local disk), then times the DB
+calls of a full Generated Ads gallery render (collections list, every
+session, its originals and variants) a number of times:
+
+- per-call: a fresh default `sqlite3.connect()` per helper (the old layout)
+- pooled:   ads_repository's cached per-thread WAL connection
+
+    python benchmarks/bench_sqlite_connections.py --sessions 40 --per-session 6 --renders 20
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ads_repository as repo  # noqa: E402
+import blob_store  # noqa: E402
+
+
+def _seed(sessions: int, per_session: int):
+    for s in range(sessions):
+        sid = repo.create_session("bench", f"session {s}")
+        uid = repo.save_uploaded_image(f"orig_{s}.png", "image/png", os.urandom(4096))
+        repo.link_session_uploads(sid, [uid])
+        for v in range(per_session):
+            repo.save_generated_image(uid, f"var_{v + 1}", {}, {"prompt": "x" * 400}, os.urandom(4096), session_id=sid)
+
+
+def _render():
+    """The DB side of one Generated Ads tab render."""
+    calls = 1
+    repo.get_available_tables()
+    sessions = repo.list_sessions()
+    calls += 1
+    for session in sessions:
+        upload_ids = repo.list_session_uploads(session['id'])
+        calls += 1
+        for uid in upload_ids:
+            repo.get_upload_meta(uid)
+            repo.get_upload_bytes(uid)
+            calls += 2
+        gens = repo.list_generated_for_session(session['id'])
+        calls += 1
+        for g in gens:
+            repo.get_generated_image_bytes(g['id'])
+            calls += 1
+    return calls
+
+
+def _time_renders(renders: int):
+    _render()  # warm the OS page cache / blob files
+    t0 = time.perf_counter()
+    for _ in range(renders):
+        calls = _render()
+    return (time.perf_counter() - t0) / renders, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--per-session", type=int, default=6)
+    parser.add_argument("--renders", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    blob_store.set_blob_store(blob_store.LocalBlobStore(os.path.join(workdir, "blob_store")))
+
+    # Identical data in both files; the per-call copy stays in the default rollback journal mode
+    pooled_db = os.path.join(workdir, "pooled.db")
+    per_call_db = os.path.join(workdir, "per_call.db")
+    repo.DB_PATH = pooled_db
+    repo.init_database()
+    repo.init_generation_tables()
+    _seed(args.sessions, args.per_session)
+    repo.close_connection()
+    with sqlite3.connect(pooled_db) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copyfile(pooled_db, per_call_db)
+    with sqlite3.connect(per_call_db) as conn:
+        conn.execute("PRAGMA journal_mode=DELETE")
+
+    pooled_get_connection = repo.get_connection
+
+    repo.DB_PATH = per_call_db
+    repo.get_connection = lambda: sqlite3.connect(repo.DB_PATH)
+    per_call_s, calls = _time_renders(args.renders)
+
+    repo.DB_PATH = pooled_db
+    repo.get_connection = pooled_get_connection
+    pooled_s, _ = _time_renders(args.renders)
+
+    print(f"{args.sessions} sessions x ({args.per_session} variants + 1 original), "
+          f"{calls} DB calls per render, {args.renders} renders")
+    print(f"{'layout':<10}{'per render':>12}{'per call':>12}")
+    for label, secs in (("per-call", per_call_s), ("pooled", pooled_s)):
+        print(f"{label:<10}{secs * 1000:>10.1f}ms{secs * 1e6 / calls:>10.0f}us")
+    print(f"speedup: {per_call_s / pooled_s:.1f}x")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
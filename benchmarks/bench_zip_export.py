@@ -0,0 +1,84 @@
+"""
+Benchmark: in-memory ZIP (BytesIO + ZIP_DEFLATED) vs the streaming export.
+
+Seeds a scratch session with photo-like PNG generations and compares the old
+"Download All" path against zip_export (cold build, then cached), reporting
+wall time and peak Python heap via tracemalloc.
+
+    python benchmarks/bench_zip_export.py --variants 40 --side 1024
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ads_repository as repo  # noqa: E402
+import blob_store  # noqa: E402
+import zip_export  # noqa: E402
+
+
+def _png(side: int, seed: int) -> bytes:
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((side, side))
+    noise = Image.effect_noise((side, side), 24 + seed % 16)
+    img = Image.merge("RGB", (gradient, noise, gradient.rotate(90)))
+    out = BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+def _in_memory(session_id: int) -> int:
+    """The previous Download All implementation."""
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i, g in enumerate(repo.list_generated_for_session(session_id)):
+            img_b = repo.get_generated_image_bytes(g['id'])
+            if img_b:
+                zip_file.writestr(f"session_{session_id}_variant_{g['variant_id'] or f'var_{i+1}'}.png", img_b)
+    zip_buffer.seek(0)
+    return len(zip_buffer.getvalue())
+
+
+def _streaming(session_id: int) -> int:
+    return os.path.getsize(zip_export.export_session(session_id))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, default=40)
+    parser.add_argument("--side", type=int, default=1024)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_zip_")
+    blob_store.set_blob_store(blob_store.LocalBlobStore(os.path.join(workdir, "blob_store")))
+    repo.DB_PATH = os.path.join(workdir, "saved_ads.db")
+    zip_export.EXPORT_DIR = os.path.join(workdir, "exports")
+    repo.init_database()
+    repo.init_generation_tables()
+
+    sid = repo.create_session("bench", "zip export")
+    for v in range(args.variants):
+        repo.save_generated_image(1, f"var_{v + 1}", {}, {}, _png(args.side, v), session_id=sid)
+
+    print(f"{args.variants} variants, {args.side}px PNGs")
+    print(f"{'path':<18}{'wall':>10}{'peak heap':>12}{'archive':>12}")
+    for label, build in (("in-memory/deflate", _in_memory), ("stream/cold", _streaming), ("stream/cached", _streaming)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        size = build(sid)
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<18}{elapsed:>9.2f}s{peak / 1048576:>10.1f}MB{size / 1048576:>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Stand-in for `apify_client.ApifyClient` used by the benchmarks.
+
+Covers what ads_search calls: client.actor(name).call(run_input=...) or
+.start(run_input=...) plus client.run(id).get(), and
+client.dataset(id).list_items(offset=, limit=) / iterate_items(). A run waits
+`start_latency` seconds (container start), then scrapes its URLs one after
+another at `item_latency` seconds per item, appending each item to its
+dataset as it goes, and ends in `final_status`. Items are generated from the Ads
+Library URL: ad ids repeat across countries for the same domain (`overlap` of
+them), so fan-out dedup has something to remove. Datasets are kept as JSON
+and every read decodes fresh copies, like a network fetch; a list_items call
+costs `page_latency` seconds (iterate_items reads in pages of
+`iterate_page_size`). Counters record runs, items, dataset page reads,
+status polls and peak concurrent runs.
+
+    import fake_apify
+    ads_search.ApifyClient = fake_apify.install(start_latency=2.0, item_latency=0.02)
+"""
+
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+start_latency = 2.0
+item_latency = 0.02
+overlap = 0.5  # fraction of a domain's ads that show up in every country
+page_latency = 0.0  # seconds per dataset list_items call
+final_status = "SUCCEEDED"  # status a run ends in
+iterate_page_size = 1000  # items per request behind iterate_items
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+counters = {"runs": 0, "items": 0, "pages": 0, "status_polls": 0, "concurrent_runs": 0, "max_concurrent_runs": 0}
+_datasets = {}
+_runs = {}
+
+
+def reset():
+    with _lock:
+        for k in counters:
+            counters[k] = 0
+        _datasets.clear()
+        _runs.clear()
+
+
+def make_items(url, count):
+    """The ads a search URL returns: `overlap` of them shared across countries, the rest per country."""
+    params = parse_qs(urlparse(url).query)
+    domain = params.get("q", ["example.com"])[0].strip('"')
+    country = params.get("country", ["US"])[0]
+    shared = int(count * overlap)
+    items = []
+    for n in range(count):
+        ad_id = f"{domain}-{n}" if n < shared else f"{domain}-{country}-{n}"
+        items.append({
+            "ad_archive_id": ad_id,
+            "url": url,
+            "page_name": domain,
+            "start_date": "2024-01-01",
+            "snapshot": {
+                "link_url": f"https://{domain}/offer/{n}",
+                "caption": domain,
+                "images": [{"original_image_url": f"https://scontent.fbcdn.net/t39.30808-6/{ad_id}_n.jpg",
+                            "resized_image_url": f"https://scontent.fbcdn.net/t39.30808-6/{ad_id}_s600x600.jpg"}],
+                "cards": [],
+            },
+        })
+    return items
+
+
+def _scrape(run_id, dataset_id, run_input):
+    with _lock:
+        counters["runs"] += 1
+        counters["concurrent_runs"] += 1
+        counters["max_concurrent_runs"] = max(counters["max_concurrent_runs"], counters["concurrent_runs"])
+    scraped = 0
+    try:
+        time.sleep(start_latency)
+        _runs[run_id]["status"] = "RUNNING"
+        for entry in run_input.get("urls", []):
+            for item in make_items(entry["url"], int(run_input.get("count", 10))):
+                time.sleep(item_latency)
+                _datasets[dataset_id].append(json.dumps(item))
+                scraped += 1
+    finally:
+        with _lock:
+            counters["concurrent_runs"] -= 1
+            counters["items"] += scraped
+        _runs[run_id]["status"] = final_status
+
+
+class _Actor:
+    def __init__(self, name):
+        self.name = name
+
+    def start(self, run_input=None, **_):
+        """Returns at once; the run scrapes on a background thread, appending items as it goes."""
+        dataset_id = f"ds-{next(_ids)}"
+        run_id = f"run-{dataset_id}"
+        _datasets[dataset_id] = []
+        thread = threading.Thread(target=_scrape, args=(run_id, dataset_id, run_input or {}), daemon=True)
+        _runs[run_id] = {"id": run_id, "status": "READY", "defaultDatasetId": dataset_id, "thread": thread}
+        thread.start()
+        return _Run(run_id).view()
+
+    def call(self, run_input=None, **_):
+        run = self.start(run_input=run_input)
+        _runs[run["id"]]["thread"].join()
+        return _Run(run["id"]).view()
+
+
+class _Run:
+    def __init__(self, run_id):
+        self.run_id = run_id
+
+    def view(self):
+        run = _runs[self.run_id]
+        return {"id": run["id"], "status": run["status"], "defaultDatasetId": run["defaultDatasetId"]}
+
+    def get(self, **_):
+        with _lock:
+            counters["status_polls"] += 1
+        return self.view() if self.run_id in _runs else None
+
+
+class _Dataset:
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+
+    def list_items(self, offset=None, limit=None, **_):
+        time.sleep(page_latency)
+        stored = _datasets.get(self.dataset_id, [])  # a running actor may still be appending
+        offset = offset or 0
+        total = len(stored)
+        end = total if limit is None else min(offset + limit, total)
+        with _lock:
+            counters["pages"] += 1
+        items = [json.loads(raw) for raw in stored[offset:end]]
+        return SimpleNamespace(items=items, total=total, offset=offset, count=len(items),
+                               limit=limit or 0, desc=False)
+
+    def iterate_items(self, offset=None, limit=None, **_):
+        offset = offset or 0
+        end = len(_datasets.get(self.dataset_id, [])) if limit is None else offset + limit
+        while offset < end:
+            page = self.list_items(offset=offset, limit=min(iterate_page_size, end - offset))
+            if not page.items:
+                return
+            yield from page.items
+            offset += page.count
+
+
+class FakeApifyClient:
+    def __init__(self, token=None, **_):
+        self.token = token
+
+    def actor(self, name):
+        return _Actor(name)
+
+    def dataset(self, dataset_id):
+        return _Dataset(dataset_id)
+
+    def run(self, run_id):
+        return _Run(run_id)
+
+
+def install(**settings):
+    """Apply module settings (start_latency, item_latency, overlap, page_latency, ...), reset counters and return the
+    client class (assign it to ads_search.ApifyClient)."""
+    import sys
+
+    module = sys.modules[__name__]
+    for name, value in settings.items():
+        if not hasattr(module, name):
+            raise AttributeError(f"fake_apify has no setting {name!r}")
+        setattr(module, name, value)
+    reset()
+    return FakeApifyClient
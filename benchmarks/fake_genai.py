@@ -0,0 +1,77 @@
+"""
+Stand-in for `google.generativeai` used by the benchmarks.
+
+Implements just what assistant_engine touches (configure, GenerativeModel,
+generate_content returning inline image bytes) with configurable latencies,
+and counts calls/concurrency so throughput and overhead can be measured
+without network access or API spend.
+
+    import fake_genai
+    ae.genai = fake_genai.install(latency=1.0)
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+# A 1x1 PNG is enough for the engine's response parsing
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c63f8cfc0f01f0005000201a5f1f9b6"
+    "0000000049454e44ae426082"
+)
+
+latency = 1.0  # seconds per generate_content call
+configure_cost = 0.0  # seconds spent in configure()
+model_init_cost = 0.0  # seconds spent constructing a GenerativeModel
+
+_lock = threading.Lock()
+counters = {"configure": 0, "models": 0, "calls": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def reset():
+    with _lock:
+        for k in counters:
+            counters[k] = 0
+
+
+def configure(api_key=None, **_):
+    time.sleep(configure_cost)
+    with _lock:
+        counters["configure"] += 1
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **_):
+        time.sleep(model_init_cost)
+        self.model_name = model_name
+        with _lock:
+            counters["models"] += 1
+
+    def generate_content(self, content, **_):
+        with _lock:
+            counters["calls"] += 1
+            counters["in_flight"] += 1
+            counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+        try:
+            time.sleep(latency)
+        finally:
+            with _lock:
+                counters["in_flight"] -= 1
+        part = SimpleNamespace(inline_data=SimpleNamespace(data=PNG_BYTES, mime_type="image/png"))
+        return SimpleNamespace(binary=None, parts=[part], candidates=[])
+
+
+def install(*, latency=None, configure_cost=None, model_init_cost=None):
+    """Set the stub's timings, reset counters and return the module (assign it to ae.genai)."""
+    import sys
+
+    module = sys.modules[__name__]
+    if latency is not None:
+        module.latency = latency
+    if configure_cost is not None:
+        module.configure_cost = configure_cost
+    if model_init_cost is not None:
+        module.model_init_cost = model_init_cost
+    reset()
+    return module
@@ -0,0 +1,202 @@
+"""
+Stand-in for the `openai.OpenAI` client used by the benchmarks.
+
+Covers the calls assistant_engine makes (files.create/delete, threads,
+messages, runs.create/retrieve/stream) with configurable latencies: the run
+sits in the queue for `queue_delay` seconds, then the Assistant "writes" one
+prompt every `prompt_write_time` seconds. With `stream_breaks` a streamed
+run's connection drops once the run is created, before any text, while the
+run itself carries on. Uploaded files stay live until
+deleted: files.retrieve and image parts in messages fail for unknown ids.
+Counters record API calls; reset() clears them but keeps the live files.
+
+    import fake_openai
+    ae.OpenAI = fake_openai.install(prompt_count=5, queue_delay=1.0, prompt_write_time=0.8)
+"""
+
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+upload_latency = 0.3
+upload_bandwidth = 0  # bytes/second per upload, added on top of upload_latency (0 = size doesn't matter)
+delete_latency = 0.05
+queue_delay = 1.0
+prompt_write_time = 0.8
+prompt_count = 5
+streaming = True
+stream_breaks = False
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+counters = {"files_created": 0, "files_deleted": 0, "file_retrieves": 0, "bytes_uploaded": 0, "retrieves": 0,
+            "streams": 0, "runs": 0, "max_concurrent_uploads": 0, "concurrent_uploads": 0}
+_runs = {}
+_live_files = set()
+
+
+def reset():
+    with _lock:
+        for k in counters:
+            counters[k] = 0
+        _runs.clear()
+
+
+class NotFoundError(Exception):
+    pass
+
+
+def _bump(name, n=1):
+    with _lock:
+        counters[name] += n
+
+
+def _prompts():
+    return [f"Image 1: Create a raw, casual ad with the text \"Offer {i + 1}\" in bold condensed sans" for i in range(prompt_count)]
+
+
+class _Files:
+    def create(self, file=None, purpose=None, **_):
+        data = file.read() if hasattr(file, "read") else bytes(file or b"")
+        with _lock:
+            counters["concurrent_uploads"] += 1
+            counters["max_concurrent_uploads"] = max(counters["max_concurrent_uploads"], counters["concurrent_uploads"])
+        try:
+            time.sleep(upload_latency + (len(data) / upload_bandwidth if upload_bandwidth else 0))
+        finally:
+            with _lock:
+                counters["concurrent_uploads"] -= 1
+        _bump("files_created")
+        _bump("bytes_uploaded", len(data))
+        file_id = f"file-{next(_ids)}"
+        with _lock:
+            _live_files.add(file_id)
+        return SimpleNamespace(id=file_id, bytes=len(data), purpose=purpose)
+
+    def delete(self, file_id, **_):
+        time.sleep(delete_latency)
+        with _lock:
+            if file_id not in _live_files:
+                raise NotFoundError(f"No such File object: {file_id}")
+            _live_files.discard(file_id)
+        _bump("files_deleted")
+        return SimpleNamespace(id=file_id, deleted=True)
+
+    def retrieve(self, file_id, **_):
+        _bump("file_retrieves")
+        if file_id not in _live_files:
+            raise NotFoundError(f"No such File object: {file_id}")
+        return SimpleNamespace(id=file_id, status="processed")
+
+
+class _Run:
+    def __init__(self, thread_id):
+        self.id = f"run-{next(_ids)}"
+        self.thread_id = thread_id
+        self.created = time.monotonic()
+
+    @property
+    def done_at(self):
+        return self.created + queue_delay + prompt_count * prompt_write_time
+
+    def view(self):
+        status = "completed" if time.monotonic() >= self.done_at else "in_progress"
+        return SimpleNamespace(id=self.id, status=status)
+
+
+class _Stream:
+    """Mimics AssistantStreamManager/AssistantEventHandler: `text_deltas`, current_run and get_final_run()."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def current_run(self):
+        return self.run.view()
+
+    @property
+    def text_deltas(self):
+        if stream_breaks:
+            raise ConnectionError("stream connection dropped")
+        time.sleep(queue_delay)
+        for line in _prompts():
+            # Each prompt arrives in a few deltas, finished by its newline
+            for piece in (line[:20], line[20:], "\n"):
+                time.sleep(prompt_write_time / 3)
+                yield piece
+
+    def get_final_run(self):
+        return SimpleNamespace(id=self.run.id, status="completed")
+
+
+class _Runs:
+    def create(self, thread_id, assistant_id=None, **_):
+        _bump("runs")
+        run = _Run(thread_id)
+        _runs[thread_id] = run
+        return run.view()
+
+    def retrieve(self, thread_id, run_id, **_):
+        _bump("retrieves")
+        return _runs[thread_id].view()
+
+    def stream(self, thread_id, assistant_id=None, **_):
+        if not streaming:
+            raise RuntimeError("streaming not supported by this stub")
+        _bump("streams")
+        _bump("runs")
+        run = _Run(thread_id)
+        _runs[thread_id] = run
+        return _Stream(run)
+
+
+class _Messages:
+    def create(self, thread_id, role=None, content=None, **_):
+        for part in content or []:
+            file_id = part.get("image_file", {}).get("file_id") if isinstance(part, dict) else None
+            if file_id and file_id not in _live_files:
+                raise NotFoundError(f"Invalid 'content[].image_file.file_id': {file_id}")
+        return SimpleNamespace(id=f"msg-{next(_ids)}")
+
+    def list(self, thread_id, **_):
+        text = SimpleNamespace(value="\n".join(_prompts()))
+        msg = SimpleNamespace(role="assistant", content=[SimpleNamespace(type="text", text=text)])
+        return SimpleNamespace(data=[msg])
+
+
+class _Threads:
+    def __init__(self):
+        self.runs = _Runs()
+        self.messages = _Messages()
+
+    def create(self, **_):
+        return SimpleNamespace(id=f"thread-{next(_ids)}")
+
+
+class FakeOpenAI:
+    def __init__(self, api_key=None, **_):
+        self.api_key = api_key
+        self.files = _Files()
+        self.beta = SimpleNamespace(threads=_Threads())
+
+
+def install(**settings):
+    """Apply module settings (upload_latency, upload_bandwidth, queue_delay, prompt_write_time, prompt_count,
+    streaming, stream_breaks, ...), reset counters and return the client class (assign it to ae.OpenAI)."""
+    import sys
+
+    module = sys.modules[__name__]
+    for name, value in settings.items():
+        if not hasattr(module, name):
+            raise AttributeError(f"fake_openai has no setting {name!r}")
+        setattr(module, name, value)
+    _live_files.clear()
+    reset()
+    return FakeOpenAI
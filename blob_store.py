@@ -0,0 +1,273 @@
+"""
+Pluggable blob storage for image bytes.
+
+Images are addressed by their sha256 (the hash `uploads.sha256` already
+dedups on); SQLite rows keep only the hash and size. Backends:
+
+- local: files under BLOB_STORE_DIR, sharded as `ab/abcdef...`
+- s3:    any S3-compatible endpoint (e.g. a local MinIO stand-in), via boto3
+
+Run `python blob_store.py migrate` to move BLOBs already stored inside
+saved_ads.db into the configured store.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import BinaryIO, Iterable, Optional
+
+# Optional: S3-compatible backend
+try:
+    import boto3  # type: ignore
+except Exception:  # pragma: no cover - optional at runtime
+    boto3 = None
+
+BACKEND = os.getenv("BLOB_STORE_BACKEND", "local").strip().lower()
+LOCAL_DIR = os.getenv("BLOB_STORE_DIR", "blob_store")
+S3_BUCKET = os.getenv("BLOB_STORE_S3_BUCKET", "pixepay-blobs")
+S3_ENDPOINT = os.getenv("BLOB_STORE_S3_ENDPOINT")  # e.g. http://localhost:9000 for MinIO
+S3_PREFIX = os.getenv("BLOB_STORE_S3_PREFIX", "")
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed store: put() returns the sha256 the bytes are filed under."""
+
+    def put(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def get(self, hash_hex: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def exists(self, hash_hex: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, hash_hex: str):
+        raise NotImplementedError
+
+    def open(self, hash_hex: str) -> Optional[BinaryIO]:
+        """Readable stream of the blob (callers read it in chunks), or None if missing."""
+        data = self.get(hash_hex)
+        return BytesIO(data) if data is not None else None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, hash_hex: str) -> str:
+        return os.path.join(self.root, hash_hex[:2], hash_hex)
+
+    def put(self, data: bytes) -> str:
+        hash_hex = sha256_hex(data)
+        path = self.path_for(hash_hex)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return hash_hex
+
+    def get(self, hash_hex: str) -> Optional[bytes]:
+        try:
+            with open(self.path_for(hash_hex), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, hash_hex: str) -> bool:
+        return os.path.exists(self.path_for(hash_hex))
+
+    def open(self, hash_hex: str) -> Optional[BinaryIO]:
+        try:
+            return open(self.path_for(hash_hex), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def delete(self, hash_hex: str):
+        try:
+            os.remove(self.path_for(hash_hex))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket: str, *, endpoint_url: Optional[str] = None, prefix: str = ""):
+        if not boto3:
+            raise RuntimeError("boto3 is not installed. Install it to use BLOB_STORE_BACKEND=s3.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, hash_hex: str) -> str:
+        return f"{self.prefix}{hash_hex[:2]}/{hash_hex}"
+
+    def put(self, data: bytes) -> str:
+        hash_hex = sha256_hex(data)
+        if not self.exists(hash_hex):
+            self.client.put_object(Bucket=self.bucket, Key=self._key(hash_hex), Body=data)
+        return hash_hex
+
+    def get(self, hash_hex: str) -> Optional[bytes]:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(hash_hex))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return obj["Body"].read()
+
+    def open(self, hash_hex: str) -> Optional[BinaryIO]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(hash_hex))["Body"]
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def exists(self, hash_hex: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(hash_hex))
+            return True
+        except Exception:
+            return False
+
+    def delete(self, hash_hex: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(hash_hex))
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide store selected by BLOB_STORE_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BACKEND == "s3":
+                    _store = S3BlobStore(S3_BUCKET, endpoint_url=S3_ENDPOINT, prefix=S3_PREFIX)
+                else:
+                    _store = LocalBlobStore(LOCAL_DIR)
+    return _store
+
+
+def set_blob_store(store: BlobStore):
+    global _store
+    with _store_lock:
+        _store = store
+
+
+# =============================================================================
+# SCHEMA + MIGRATION (saved_ads.db)
+# =============================================================================
+
+def ensure_blob_columns(cursor: sqlite3.Cursor):
+    """Add the hash/size columns that replace the inline BLOB columns."""
+    cursor.execute("PRAGMA table_info(uploads)")
+    cols = [r[1] for r in cursor.fetchall()]
+    if 'size' not in cols:
+        cursor.execute("ALTER TABLE uploads ADD COLUMN size INTEGER")
+
+    cursor.execute("PRAGMA table_info(generated_ads)")
+    cols = [r[1] for r in cursor.fetchall()]
+    if 'image_sha256' not in cols:
+        cursor.execute("ALTER TABLE generated_ads ADD COLUMN image_sha256 TEXT")
+    if 'image_size' not in cols:
+        cursor.execute("ALTER TABLE generated_ads ADD COLUMN image_size INTEGER")
+
+
+# (table, column) pairs holding blob hashes; a table not created yet holds none
+BLOB_REFERENCES = (("uploads", "sha256"), ("generated_ads", "image_sha256"), ("generation_cache", "image_sha256"))
+
+
+def _referenced(cursor: sqlite3.Cursor, table: str, column: str, hash_hex: str) -> bool:
+    try:
+        cursor.execute(f'SELECT 1 FROM {table} WHERE {column} = ? LIMIT 1', (hash_hex,))
+    except sqlite3.OperationalError:
+        return False
+    return cursor.fetchone() is not None
+
+
+def release_blobs(cursor: sqlite3.Cursor, hashes: Iterable[Optional[str]], store: Optional[BlobStore] = None):
+    """Delete blobs that are no longer referenced by any of BLOB_REFERENCES."""
+    store = store or get_blob_store()
+    for hash_hex in set(h for h in hashes if h):
+        if not any(_referenced(cursor, table, column, hash_hex) for table, column in BLOB_REFERENCES):
+            store.delete(hash_hex)
+
+
+def migrate_sqlite_blobs(db_path: str = os.getenv("SAVED_ADS_DB", "saved_ads.db"), store: Optional[BlobStore] = None, *,
+                         batch_size: int = 50, vacuum: bool = True) -> dict:
+    """Move uploads.data / generated_ads.image_data into `store`, leaving hash + size in the rows."""
+    store = store or get_blob_store()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    ensure_blob_columns(cursor)
+    conn.commit()
+
+    size_before = os.path.getsize(db_path)
+    moved = {"uploads": 0, "generated_ads": 0, "bytes": 0}
+
+    while True:
+        cursor.execute('SELECT id, data FROM uploads WHERE data IS NOT NULL LIMIT ?', (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for row_id, data in rows:
+            data = bytes(data)
+            hash_hex = store.put(data)
+            cursor.execute('UPDATE uploads SET sha256 = ?, size = ?, data = NULL WHERE id = ?', (hash_hex, len(data), row_id))
+            moved["uploads"] += 1
+            moved["bytes"] += len(data)
+        conn.commit()
+
+    while True:
+        cursor.execute('SELECT id, image_data FROM generated_ads WHERE image_data IS NOT NULL LIMIT ?', (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for row_id, data in rows:
+            data = bytes(data)
+            hash_hex = store.put(data)
+            cursor.execute('UPDATE generated_ads SET image_sha256 = ?, image_size = ?, image_data = NULL WHERE id = ?', (hash_hex, len(data), row_id))
+            moved["generated_ads"] += 1
+            moved["bytes"] += len(data)
+        conn.commit()
+
+    if vacuum:
+        conn.execute("VACUUM")
+        # In WAL mode the shrunk file only lands on disk once the log is checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    moved["db_bytes_before"] = size_before
+    moved["db_bytes_after"] = os.path.getsize(db_path)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blob store maintenance for saved_ads.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="move BLOBs out of the SQLite database into the blob store")
+    mig.add_argument("--db", default=os.getenv("SAVED_ADS_DB", "saved_ads.db"))
+    mig.add_argument("--batch-size", type=int, default=50)
+    mig.add_argument("--no-vacuum", action="store_true", help="skip VACUUM (file size won't shrink)")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        started = time.perf_counter()
+        result = migrate_sqlite_blobs(args.db, batch_size=args.batch_size, vacuum=not args.no_vacuum)
+        print(f"📦 Moved {result['uploads']} upload(s) and {result['generated_ads']} generated image(s) "
+              f"({result['bytes'] / 1048576:.1f} MB) to the {BACKEND} blob store")
+        print(f"🗜️ {args.db}: {result['db_bytes_before'] / 1048576:.1f} MB → {result['db_bytes_after'] / 1048576:.1f} MB "
+              f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Concurrent creative validation.
+
+Validates the ranked creative candidates of many ads at once on a bounded
+thread pool, capping in-flight requests per CDN host, and hands results back
+in the same order the ads were submitted.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+# Pool sizing (override via environment)
+MAX_WORKERS = int(os.getenv("CREATIVE_VALIDATION_WORKERS", "8"))
+PER_HOST_LIMIT = int(os.getenv("CREATIVE_VALIDATION_PER_HOST", "4"))
+# "probe": Range request + header sniffing; "full": download the whole image
+VALIDATION_MODE = os.getenv("CREATIVE_VALIDATION_MODE", "probe").strip().lower()
+
+
+class HostLimiter:
+    """Hands out one bounded semaphore per URL host."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def slot(self, url: str) -> threading.BoundedSemaphore:
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            sem = self._slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.limit)
+                self._slots[host] = sem
+            return sem
+
+
+def first_valid_candidate(
+    candidates: Sequence[str],
+    fetch: Callable[[str], Any],
+    limiter: Optional[HostLimiter] = None,
+) -> Tuple[bool, str]:
+    """Try candidates in priority order and return the first one `fetch` accepts (truthy result)."""
+    for url in candidates:
+        if limiter is not None:
+            with limiter.slot(url):
+                data = fetch(url)
+        else:
+            data = fetch(url)
+        if data:
+            return True, url
+    return False, ""
+
+
+def validate_candidates_concurrently(
+    candidate_lists: Sequence[Sequence[str]],
+    fetch: Callable[[str], Any],
+    *,
+    max_workers: Optional[int] = None,
+    per_host_limit: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Tuple[bool, str]]:
+    """Validate each ad's candidate list and return (found, url) per ad, in input order.
+
+    Candidates within one ad are still tried in priority order so the chosen URL
+    matches the serial path; different ads are validated in parallel.
+    `on_progress(done, total)` is always called from the calling thread, so it is
+    safe to drive Streamlit widgets from it. `max_workers=1` runs serially.
+    """
+    workers = MAX_WORKERS if max_workers is None else max(1, int(max_workers))
+    limiter = HostLimiter(PER_HOST_LIMIT if per_host_limit is None else per_host_limit)
+
+    total = len(candidate_lists)
+    results: List[Tuple[bool, str]] = [(False, "")] * total
+    done = 0
+
+    if workers == 1:
+        for i, candidates in enumerate(candidate_lists):
+            results[i] = first_valid_candidate(candidates, fetch)
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="creative-validate") as pool:
+        futures = {}
+        for i, candidates in enumerate(candidate_lists):
+            if candidates:
+                futures[pool.submit(first_valid_candidate, candidates, fetch, limiter)] = i
+            else:
+                done += 1
+        if on_progress and done:
+            on_progress(done, total)
+
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:  # noqa: BLE001
+                print(f"❌ Creative validation worker failed for item {i}: {e}")
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+
+    return results
@@ -0,0 +1,298 @@
+"""
+Background worker for analyze+generate jobs.
+
+The UI (or any other producer) queues a job with enqueue_generation() after it
+has created the session and stored the reference images; a worker process
+claims jobs from the generation_jobs table in saved_ads.db, streams the
+Assistant prompts, generates the images and saves each one with
+save_generated_image as soon as it finishes. Progress, prompts and errors are
+written back to the job row, which the UI polls. Several workers (and several
+job slots per worker) can share one database: claims are atomic, and a job
+whose worker stops heartbeating is requeued.
+
+CLI:
+    python generation_worker.py                # run until interrupted
+    python generation_worker.py --jobs 2       # two jobs at a time
+    python generation_worker.py --once         # drain the queue, then exit
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from . import ads_repository as repo  # when packaged
+    from . import assistant_engine as ae
+except Exception:
+    import ads_repository as repo  # when run directly
+    import assistant_engine as ae
+
+JOB_POLL_SECONDS = float(os.getenv("GENERATION_JOB_POLL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("GENERATION_JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.getenv("GENERATION_JOB_STALE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "2"))
+WORKER_JOBS = max(1, int(os.getenv("GENERATION_WORKER_JOBS", "1")))
+DEFAULT_SIZE = "1024x1024"
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callbacks when the job's cancel flag is set."""
+
+
+def enqueue_generation(
+    session_id: int,
+    upload_ids: List[int],
+    desired_count: int,
+    *,
+    size: str = DEFAULT_SIZE,
+    use_cache: bool = True,
+    variation_policy: Optional[str] = None,
+    variant_prefix: str = "var",
+) -> int:
+    """Queue analysis of a session's uploads plus one image per prompt. Returns the job id.
+
+    The uploads must already be saved (save_uploaded_image) and linked to the
+    session; variants are saved as `<variant_prefix>_<n>` against the first one.
+    """
+    if not upload_ids:
+        raise ValueError("A generation job needs at least one upload")
+    payload = {
+        "upload_ids": list(upload_ids),
+        "desired_count": int(desired_count),
+        "size": size,
+        "use_cache": bool(use_cache),
+        "variation_policy": variation_policy,
+        "variant_prefix": variant_prefix,
+    }
+    return repo.enqueue_generation_job(session_id, payload, int(desired_count))
+
+
+def slot_budget(jobs: int):
+    """(max_concurrency, rpm) for one of `jobs` concurrent job slots: an equal share of the Gemini budget."""
+    jobs = max(1, int(jobs))
+    return max(1, ae.GEMINI_CONCURRENCY // jobs), (ae.GEMINI_RPM / jobs if ae.GEMINI_RPM else ae.GEMINI_RPM)
+
+
+def workers_alive() -> bool:
+    """True if some worker heartbeated recently enough to pick up queued jobs."""
+    return repo.live_worker_count(JOB_STALE_SECONDS) > 0
+
+
+# =============================================================================
+# JOB EXECUTION
+# =============================================================================
+
+def run_job(job: Dict[str, Any], *, api_key: Optional[str] = None, rpm: Optional[float] = None,
+            max_concurrency: Optional[int] = None,
+            on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Run one claimed job to completion and record its final state. Returns a summary.
+
+    `on_event` receives small dicts ("prompt", "image", "error") as the job
+    progresses; the CLI uses it for logging. The job row is updated either way.
+    """
+    job_id = job["id"]
+    payload = job["payload"]
+    upload_ids = payload["upload_ids"]
+    desired_count = payload["desired_count"]
+    prefix = payload.get("variant_prefix") or "var"
+    cancelled = threading.Event()
+    stop_heartbeat = threading.Event()
+    # Variants an earlier attempt saved before its worker was lost are kept, not generated again
+    saved_variants = set(repo.job_variant_ids(job_id))
+    progress = {"completed": len(saved_variants), "failed": 0}
+    prompts: List[str] = []
+    variants: List[Dict[str, Any]] = []
+    timings: Dict[str, float] = {}
+
+    def _emit(event: Dict[str, Any]):
+        if on_event:
+            on_event({"job_id": job_id, **event})
+
+    def _heartbeat():
+        # Keeps the claim alive during long Assistant/Gemini calls and picks up cancel requests
+        try:
+            while not stop_heartbeat.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    repo.update_job(job_id)
+                    if repo.job_cancel_requested(job_id):
+                        cancelled.set()
+                except Exception as e:
+                    print(f"⚠️ Job {job_id} heartbeat failed: {e}")
+        finally:
+            repo.close_connection()
+
+    def _check_cancel():
+        if cancelled.is_set() or repo.job_cancel_requested(job_id):
+            cancelled.set()
+            raise JobCancelled()
+
+    images = []
+    for upload_id in upload_ids:
+        data = repo.get_upload_bytes(upload_id)
+        if data:
+            images.append((f"upload_{upload_id}", data))
+    if not images:
+        repo.finish_job(job_id, "failed", message="No images", error="None of the job's uploads could be loaded")
+        return {"job_id": job_id, "status": "failed", **progress}
+
+    base = ae.direct_prompts_base(desired_count)
+
+    def _streamed_variants():
+        stream = ae.stream_analysis_prompts(None, None, images, desired_count=desired_count, timings=timings,
+                                            use_cache=payload.get("use_cache", True))
+        for i, prompt in enumerate(stream):
+            v = {"id": f"{prefix}_{i+1}", "prompt": prompt}
+            if v["id"] in saved_variants:
+                prompts.append(prompt)
+                repo.update_job(job_id, prompts=prompts, completed=progress["completed"])
+                _emit({"event": "skipped", "variant_id": v["id"], "reason": "saved by an earlier attempt"})
+                continue
+            variants.append(v)
+            yield v
+
+    def _on_prompt(i, v):
+        _check_cancel()
+        prompts.append(v["prompt"])
+        repo.update_job(job_id, prompts=prompts, message=f"Prompt {len(prompts)}/{desired_count} received, generating")
+        _emit({"event": "prompt", "index": i, "variant_id": v["id"]})
+
+    def _on_image(i, img, err):
+        v = variants[i]
+        if img:
+            gen_id = repo.save_generated_image(upload_ids[0], v["id"], base, v, img, session_id=job["session_id"],
+                                               job_id=job_id)
+            progress["completed"] += 1
+            _emit({"event": "image", "index": i, "variant_id": v["id"], "generated_id": gen_id, "bytes": len(img)})
+        else:
+            progress["failed"] += 1
+            _emit({"event": "error", "index": i, "variant_id": v["id"], "error": str(err)[:200]})
+        done = progress["completed"] + progress["failed"]
+        repo.update_job(job_id, completed=progress["completed"], failed=progress["failed"],
+                        message=f"Generated {done}/{max(desired_count, len(prompts))}")
+        _check_cancel()
+
+    heartbeat = threading.Thread(target=_heartbeat, name=f"job-{job_id}-heartbeat", daemon=True)
+    heartbeat.start()
+    started = time.perf_counter()
+    try:
+        repo.update_job(job_id, message="Analyzing with Assistant")
+        ae.generate_variants_concurrently(
+            api_key or os.getenv("GOOGLE_API_KEY"),
+            base,
+            _streamed_variants(),
+            size=payload.get("size") or DEFAULT_SIZE,
+            rpm=rpm,
+            max_concurrency=max_concurrency,
+            on_variant=_on_prompt,
+            on_result=_on_image,
+            variation_policy=payload.get("variation_policy"),
+        )
+        total = len(prompts)
+        secs = time.perf_counter() - started
+        if not prompts:
+            status, message, error = "failed", "No prompts returned by assistant", None
+        elif progress["completed"] == 0:
+            status, message, error = "failed", f"No images generated ({total} prompt(s))", None
+        else:
+            status, error = "done", None
+            message = f"Generated {progress['completed']}/{total} image(s) in {secs:.1f}s"
+        repo.update_job(job_id, total=total, completed=progress["completed"], failed=progress["failed"])
+        repo.finish_job(job_id, status, message=message, error=error)
+    except JobCancelled:
+        status = "cancelled"
+        repo.finish_job(job_id, status, message=f"Cancelled after {progress['completed']} image(s)")
+    except Exception as e:
+        status = "failed"
+        repo.finish_job(job_id, status, message="Failed", error=str(e)[:500])
+        print(f"❌ Job {job_id} failed: {e}")
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+    return {"job_id": job_id, "status": status, "prompts": len(prompts), **progress, "timings": timings}
+
+
+# =============================================================================
+# WORKER LOOP
+# =============================================================================
+
+def work(*, jobs: int = WORKER_JOBS, poll: float = JOB_POLL_SECONDS, once: bool = False,
+         stop: Optional[threading.Event] = None,
+         on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> int:
+    """Claim and run jobs on `jobs` slots until `stop` is set (or, with `once`, the queue is empty).
+
+    Each slot gets an equal share of GEMINI_CONCURRENCY and GEMINI_RPM, so a
+    busy worker stays inside the same Gemini budget as one interactive run.
+    Returns the number of jobs processed.
+    """
+    jobs = max(1, int(jobs))
+    stop = stop or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    slot_concurrency, slot_rpm = slot_budget(jobs)
+    processed = [0]
+    processed_lock = threading.Lock()
+
+    repo.init_generation_tables()
+    repo.register_worker(worker_id, os.getpid(), socket.gethostname())
+    requeued, failed = repo.requeue_stale_jobs(JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+    if requeued or failed:
+        print(f"♻️ Requeued {requeued} stale job(s), failed {failed} out of attempts")
+    print(f"👷 Worker {worker_id}: {jobs} slot(s), Gemini {slot_concurrency} at a time per slot")
+
+    def _slot():
+        try:
+            while not stop.is_set():
+                job = repo.claim_next_job(worker_id)
+                if job is None:
+                    if once:
+                        return
+                    stop.wait(poll)
+                    continue
+                print(f"▶️ Job {job['id']} (session {job['session_id']}): {job['payload']['desired_count']} variant(s)")
+                summary = run_job(job, rpm=slot_rpm, max_concurrency=slot_concurrency, on_event=on_event)
+                print(f"⏹️ Job {job['id']} {summary['status']}: {summary['completed']} image(s), {summary['failed']} failed")
+                with processed_lock:
+                    processed[0] += 1
+        finally:
+            repo.close_connection()
+
+    slots = [threading.Thread(target=_slot, name=f"job-slot-{n}", daemon=True) for n in range(jobs)]
+    for t in slots:
+        t.start()
+    try:
+        last_sweep = time.monotonic()
+        while any(t.is_alive() for t in slots):
+            stop.wait(min(poll, JOB_HEARTBEAT_SECONDS))
+            repo.worker_heartbeat(worker_id)
+            if time.monotonic() - last_sweep >= JOB_STALE_SECONDS / 2:
+                repo.requeue_stale_jobs(JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+                last_sweep = time.monotonic()
+    except KeyboardInterrupt:
+        print("🛑 Stopping after the running job(s) finish...")
+        stop.set()
+        for t in slots:
+            t.join()
+    finally:
+        repo.unregister_worker(worker_id)
+    return processed[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued analyze+generate jobs")
+    parser.add_argument("--jobs", type=int, default=WORKER_JOBS, help="jobs to run at the same time")
+    parser.add_argument("--poll", type=float, default=JOB_POLL_SECONDS, help="seconds between queue checks when idle")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--db", default=repo.DB_PATH)
+    args = parser.parse_args()
+
+    repo.DB_PATH = args.db
+    started = time.perf_counter()
+    count = work(jobs=args.jobs, poll=args.poll, once=args.once)
+    print(f"✅ Processed {count} job(s) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
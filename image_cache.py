@@ -0,0 +1,242 @@
+"""
+Content-addressed on-disk image cache.
+
+Downloaded creatives are stored once per sha256 (the same hash the `uploads`
+table dedups on) under `<IMAGE_CACHE_DIR>/blobs/ab/abcdef...`, with a small
+SQLite index mapping URL -> sha256. Entries expire after a TTL and the blob
+store is kept under a size budget by evicting least-recently-used blobs.
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from .blob_store import LocalBlobStore  # when packaged
+except Exception:
+    from blob_store import LocalBlobStore  # when run directly
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".image_cache")
+ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_HOURS", "168")) * 3600
+MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+_initialized_dirs = set()
+
+
+def _blobs() -> LocalBlobStore:
+    return LocalBlobStore(os.path.join(CACHE_DIR, "blobs"))
+
+
+def _blob_path(hash_hex: str) -> str:
+    return _blobs().path_for(hash_hex)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(CACHE_DIR, "index.db"), timeout=10)
+    if CACHE_DIR not in _initialized_dirs:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS url_index (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_url_index_sha ON url_index(sha256)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs(last_access)")
+        conn.commit()
+        _initialized_dirs.add(CACHE_DIR)
+    return conn
+
+
+def _bump(counter: str, n: int = 1):
+    with _lock:
+        _counters[counter] += n
+
+
+def _ensure_dir():
+    os.makedirs(os.path.join(CACHE_DIR, "blobs"), exist_ok=True)
+
+
+def lookup(url: str) -> Optional[str]:
+    """Return the sha256 cached for `url` if it is present and not expired."""
+    if not ENABLED or not url:
+        return None
+    try:
+        _ensure_dir()
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT sha256, fetched_at FROM url_index WHERE url = ?', (url,))
+        row = cursor.fetchone()
+        if row and time.time() - row[1] > TTL_SECONDS:
+            cursor.execute('DELETE FROM url_index WHERE url = ?', (url,))
+            conn.commit()
+            _bump("expired")
+            row = None
+        conn.close()
+        if row and os.path.exists(_blob_path(row[0])):
+            return row[0]
+    except Exception as e:  # noqa: BLE001
+        print(f"⚠️ Image cache lookup failed: {e}")
+    return None
+
+
+def get(url: str) -> Optional[bytes]:
+    """Return cached bytes for `url`, or None (counted as a miss)."""
+    hash_hex = lookup(url)
+    if hash_hex:
+        try:
+            with open(_blob_path(hash_hex), 'rb') as f:
+                data = f.read()
+            conn = _connect()
+            conn.execute('UPDATE blobs SET last_access = ? WHERE sha256 = ?', (time.time(), hash_hex))
+            conn.commit()
+            conn.close()
+            _bump("hits")
+            return data
+        except Exception as e:  # noqa: BLE001
+            print(f"⚠️ Image cache read failed: {e}")
+    if ENABLED:
+        _bump("misses")
+    return None
+
+
+def _record(url: str, hash_hex: str, size: int):
+    now = time.time()
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)
+        ON CONFLICT(sha256) DO UPDATE SET last_access = excluded.last_access
+    ''', (hash_hex, size, now))
+    cursor.execute('INSERT OR REPLACE INTO url_index (url, sha256, fetched_at) VALUES (?, ?, ?)', (url, hash_hex, now))
+    conn.commit()
+    conn.close()
+    _bump("stores")
+    evict()
+
+
+def put(url: str, data: bytes) -> Optional[str]:
+    """Store `data` for `url` and return its sha256. Never raises."""
+    if not ENABLED or not url or not data:
+        return None
+    try:
+        _ensure_dir()
+        hash_hex = _blobs().put(data)
+        _record(url, hash_hex, len(data))
+        return hash_hex
+    except Exception as e:  # noqa: BLE001
+        print(f"⚠️ Image cache write failed: {e}")
+        return None
+
+
+def put_file(url: str, src_path: str) -> Optional[str]:
+    """Like put(), but hashes and copies an already-downloaded file in chunks."""
+    if not ENABLED or not url:
+        return None
+    try:
+        _ensure_dir()
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(CACHE_DIR, "blobs", f"incoming.{threading.get_ident()}.part")
+        size = 0
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(64 * 1024), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+        hash_hex = digest.hexdigest()
+        path = _blob_path(hash_hex)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        _record(url, hash_hex, size)
+        return hash_hex
+    except Exception as e:  # noqa: BLE001
+        print(f"⚠️ Image cache write failed: {e}")
+        return None
+
+
+def copy_to(url: str, dest_path: str) -> Optional[int]:
+    """Copy the cached blob for `url` to `dest_path`; returns its size on a hit."""
+    hash_hex = lookup(url)
+    if hash_hex:
+        try:
+            shutil.copyfile(_blob_path(hash_hex), dest_path)
+            conn = _connect()
+            conn.execute('UPDATE blobs SET last_access = ? WHERE sha256 = ?', (time.time(), hash_hex))
+            conn.commit()
+            conn.close()
+            _bump("hits")
+            return os.path.getsize(dest_path)
+        except Exception as e:  # noqa: BLE001
+            print(f"⚠️ Image cache read failed: {e}")
+    if ENABLED:
+        _bump("misses")
+    return None
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """Drop least-recently-used blobs until the store fits `max_bytes`. Returns blobs removed."""
+    budget = MAX_BYTES if max_bytes is None else int(max_bytes)
+    removed = 0
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(SUM(size), 0) FROM blobs')
+    total = cursor.fetchone()[0]
+    if total > budget:
+        cursor.execute('SELECT sha256, size FROM blobs ORDER BY last_access ASC')
+        for hash_hex, size in cursor.fetchall():
+            if total <= budget:
+                break
+            _blobs().delete(hash_hex)
+            cursor.execute('DELETE FROM url_index WHERE sha256 = ?', (hash_hex,))
+            cursor.execute('DELETE FROM blobs WHERE sha256 = ?', (hash_hex,))
+            total -= size
+            removed += 1
+        conn.commit()
+    conn.close()
+    if removed:
+        _bump("evictions", removed)
+    return removed
+
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters for this process plus the current on-disk footprint."""
+    with _lock:
+        out: Dict[str, Any] = dict(_counters)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = (out["hits"] / lookups) if lookups else 0.0
+    out["entries"] = 0
+    out["bytes"] = 0
+    if ENABLED and os.path.isdir(CACHE_DIR):
+        try:
+            conn = _connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs')
+            out["entries"], out["bytes"] = cursor.fetchone()
+            conn.close()
+        except Exception:
+            pass
+    return out
+
+
+def reset_stats():
+    with _lock:
+        for k in _counters:
+            _counters[k] = 0
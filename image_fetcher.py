@@ -0,0 +1,460 @@
+"""
+Image fetching for Facebook ad creatives.
+
+Shared by the search (creative validation), save and generate flows in app.py.
+All downloads go through one pooled, keep-alive httpx client so repeated
+requests to the fbcdn hosts reuse TCP/TLS connections (HTTP/2 when the `h2`
+package is installed).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    from . import image_cache  # when packaged
+except Exception:
+    import image_cache  # when run directly
+
+try:
+    from PIL import ImageFile  # header sniffing for probe mode
+except Exception:  # pragma: no cover - optional at runtime
+    ImageFile = None
+
+try:
+    import h2  # noqa: F401  # enables HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover - optional at runtime
+    HTTP2_AVAILABLE = False
+
+# Pool tuning (override via environment)
+POOL_SIZE = int(os.getenv("IMAGE_FETCH_POOL_SIZE", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("IMAGE_FETCH_KEEPALIVE_SECONDS", "30"))
+USE_HTTP2 = os.getenv("IMAGE_FETCH_HTTP2", "1").strip().lower() not in ("0", "false", "no")
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+    ),
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Referer": "https://www.facebook.com/ads/library/",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "Sec-Fetch-Dest": "image",
+    "Sec-Fetch-Mode": "no-cors",
+    "Sec-Fetch-Site": "cross-site",
+}
+
+# =============================================================================
+# SHARED CONNECTION POOL
+# =============================================================================
+
+class FetchStats:
+    """Thread-safe counters for requests vs. newly opened connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.http2_responses = 0
+            self.bytes_received = 0
+
+    def trace(self, event_name: str, info: Dict[str, Any]):
+        # httpcore trace hook: a TCP connect means the pool had nothing to reuse
+        if event_name == "connection.connect_tcp.started":
+            with self._lock:
+                self.new_connections += 1
+
+    def record_response(self, resp: httpx.Response):
+        with self._lock:
+            self.requests += 1
+            if resp.http_version == "HTTP/2":
+                self.http2_responses += 1
+
+    def record_bytes(self, n: int):
+        with self._lock:
+            self.bytes_received += n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": (reused / self.requests) if self.requests else 0.0,
+                "http2_responses": self.http2_responses,
+                "bytes_received": self.bytes_received,
+            }
+
+
+stats = FetchStats()
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+_pool_size = POOL_SIZE
+_http2 = USE_HTTP2
+
+
+def _build_client() -> httpx.Client:
+    limits = httpx.Limits(
+        max_connections=_pool_size,
+        max_keepalive_connections=_pool_size,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return httpx.Client(
+        headers=DEFAULT_HEADERS,
+        limits=limits,
+        http2=_http2 and HTTP2_AVAILABLE,
+        follow_redirects=True,
+    )
+
+
+def get_client() -> httpx.Client:
+    """Return the process-wide pooled client (safe to share across threads)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def configure_client(*, pool_size: Optional[int] = None, http2: Optional[bool] = None):
+    """Rebuild the shared client with a new pool size / HTTP/2 setting."""
+    global _pool_size, _http2
+    with _client_lock:
+        if pool_size is not None:
+            _pool_size = max(1, int(pool_size))
+        if http2 is not None:
+            _http2 = bool(http2)
+    close_client()
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+# =============================================================================
+# IMAGE FETCH HELPER (robust against CDN timeouts)
+# =============================================================================
+
+MIN_CREATIVE_BYTES = 5000  # Creatives should be much larger than profile pics (5KB+)
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+VALID_CONTENT_TYPES = ("image/", "application/octet-stream")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".svg", ".bmp")
+
+
+class ImageRejected(Exception):
+    """The URL answered, but not with a usable creative; retrying won't help.
+
+    `drain` marks bodies small enough that reading them is cheaper than losing
+    the keep-alive connection.
+    """
+
+    def __init__(self, message: str, *, drain: bool = False):
+        super().__init__(message)
+        self.drain = drain
+
+
+def _check_response_headers(url: str, resp: httpx.Response, max_bytes: int):
+    """Reject on Content-Type / Content-Length before reading any of the body."""
+    ct = resp.headers.get("Content-Type", "").lower()
+    is_valid_type = any(ct.startswith(vt) for vt in VALID_CONTENT_TYPES)
+    has_image_ext = url.lower().endswith(IMAGE_EXTENSIONS)
+    if not (is_valid_type or has_image_ext):
+        raise ImageRejected(f"Unexpected content-type: {ct}")
+
+    # Content-Length is the encoded size; only trust it for identity bodies
+    declared = resp.headers.get("Content-Length")
+    if declared and declared.isdigit() and not resp.headers.get("Content-Encoding"):
+        declared_len = int(declared)
+        if declared_len < MIN_CREATIVE_BYTES:
+            raise ImageRejected(f"Content too small for creative: {declared_len} bytes", drain=True)
+        if declared_len > max_bytes:
+            raise ImageRejected(f"Content too large: {declared_len} bytes (max {max_bytes})")
+
+
+def _download(url: str, *, timeout: float, retries: int, max_bytes: Optional[int],
+              save_path: Optional[str], keep_bytes: bool) -> Tuple[Optional[bytes], int, Optional[Exception]]:
+    """Stream `url` in chunks into memory and/or `save_path`.
+
+    Returns (body or None, size, last_error); size is 0 on failure.
+    """
+    limit = MAX_IMAGE_BYTES if max_bytes is None else int(max_bytes)
+    tmp_path = f"{save_path}.part" if save_path else None
+
+    last_err: Exception | None = None
+    for attempt in range(1, retries + 1):
+        buf = bytearray() if keep_bytes else None
+        fh = None
+        size = 0
+        try:
+            with get_client().stream("GET", url, timeout=timeout, extensions={"trace": stats.trace}) as resp:
+                stats.record_response(resp)
+                resp.raise_for_status()
+                try:
+                    _check_response_headers(url, resp, limit)
+                except ImageRejected as e:
+                    if e.drain:
+                        stats.record_bytes(len(resp.read()))
+                    raise
+
+                if tmp_path:
+                    try:
+                        fh = open(tmp_path, 'wb')
+                    except Exception as e:
+                        print(f"❌ Failed to save to {save_path}: {e}")
+                        return None, 0, e
+
+                for chunk in resp.iter_bytes(CHUNK_SIZE):
+                    size += len(chunk)
+                    stats.record_bytes(len(chunk))
+                    if size > limit:
+                        raise ImageRejected(f"Content too large: over {limit} bytes")
+                    if buf is not None:
+                        buf += chunk
+                    if fh is not None:
+                        fh.write(chunk)
+
+            if size < MIN_CREATIVE_BYTES:
+                raise ImageRejected(f"Content too small for creative: {size} bytes")
+
+            if fh is not None:
+                fh.close()
+                fh = None
+                os.replace(tmp_path, save_path)
+                print(f"💾 Saved creative to: {save_path}")
+
+            return (bytes(buf) if buf is not None else None), size, None
+
+        except ImageRejected as e:
+            # Deterministic answer from the server: don't download it again
+            last_err = e
+            break
+        except Exception as e:  # noqa: BLE001
+            last_err = e
+            if attempt < retries:
+                time.sleep(1)  # Brief pause between retries
+            continue
+        finally:
+            if fh is not None:
+                fh.close()
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    return None, 0, last_err
+
+
+def _warn_fetch_failed(url: str, err: Optional[Exception]):
+    try:
+        import streamlit as _st  # local import to avoid circulars
+        _st.warning(f"Image fetch failed: {url[:50]}... ({str(err)[:50]})")
+    except Exception:
+        pass
+
+
+def _clean_url(url: str) -> Optional[str]:
+    if not url or not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        return None
+    return url
+
+
+def fetch_image_bytes(url: str, *, timeout: float = 10.0, retries: int = 3, save_path: str | None = None,
+                      max_bytes: int | None = None) -> bytes | None:
+    """Download image bytes with robust retry and comprehensive headers.
+
+    Served from the on-disk image cache when the URL was fetched before.
+
+    The body is streamed: non-image Content-Types and bodies outside
+    [MIN_CREATIVE_BYTES, max_bytes] are rejected from the headers (or as soon
+    as the limit is crossed) and are not retried. When `save_path` is given the
+    chunks are also written to disk as they arrive.
+
+    Returns None on failure.
+    """
+    url = _clean_url(url)
+    if not url:
+        return None
+
+    cached = image_cache.get(url)
+    if cached is not None:
+        if save_path:
+            try:
+                with open(save_path, 'wb') as f:
+                    f.write(cached)
+                print(f"💾 Saved creative to: {save_path}")
+            except Exception as e:
+                print(f"❌ Failed to save to {save_path}: {e}")
+                return None
+        return cached
+
+    data, _, last_err = _download(url, timeout=timeout, retries=retries, max_bytes=max_bytes,
+                                  save_path=save_path, keep_bytes=True)
+    if data is not None:
+        image_cache.put(url, data)
+        return data
+
+    # Don't show warnings for validation attempts (save_path=None)
+    # Only show warnings if we're actually trying to save/display an image
+    if save_path is not None:
+        _warn_fetch_failed(url, last_err)
+    return None
+
+
+def download_image_to_file(url: str, save_path: str, *, timeout: float = 10.0, retries: int = 3,
+                           max_bytes: int | None = None) -> int | None:
+    """Stream an image straight to `save_path` without holding it in memory.
+
+    Returns the number of bytes written, or None on failure.
+    """
+    url = _clean_url(url)
+    if not url:
+        return None
+
+    size = image_cache.copy_to(url, save_path)
+    if size:
+        return size
+
+    _, size, last_err = _download(url, timeout=timeout, retries=retries, max_bytes=max_bytes,
+                                  save_path=save_path, keep_bytes=False)
+    if size:
+        image_cache.put_file(url, save_path)
+        return size
+
+    _warn_fetch_failed(url, last_err)
+    return None
+
+
+# =============================================================================
+# VALIDATION-ONLY PROBE (Range request + header sniffing)
+# =============================================================================
+
+PROBE_BYTES = int(os.getenv("IMAGE_PROBE_BYTES", "16384"))
+MIN_CREATIVE_DIMENSION = int(os.getenv("IMAGE_MIN_CREATIVE_DIMENSION", "100"))
+
+
+def _total_size(resp: httpx.Response) -> Optional[int]:
+    """Full resource size from Content-Range (206) or Content-Length (200)."""
+    if resp.status_code == 206:
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2].strip()
+        return int(total) if total.isdigit() else None
+    declared = resp.headers.get("Content-Length", "")
+    if declared.isdigit() and not resp.headers.get("Content-Encoding"):
+        return int(declared)
+    return None
+
+
+def probe_image(url: str, *, timeout: float = 10.0, retries: int = 2, probe_bytes: int | None = None) -> Dict[str, Any]:
+    """Classify `url` as a creative from its first bytes, without downloading it.
+
+    Sends `Range: bytes=0-N` and feeds the head of the body to Pillow until the
+    image header (format and dimensions) is parsed. Returns a dict with
+    `ok` True/False, or None when the server gave too little to decide (no
+    size information), in which case callers should fall back to a full fetch.
+    """
+    result: Dict[str, Any] = {"url": url, "ok": None, "size": None, "content_type": None,
+                              "format": None, "width": None, "height": None, "reason": ""}
+    url = _clean_url(url)
+    if not url:
+        result.update(ok=False, reason="invalid url")
+        return result
+
+    n = PROBE_BYTES if probe_bytes is None else max(1, int(probe_bytes))
+    headers = {"Range": f"bytes=0-{n - 1}", "Accept-Encoding": "identity"}
+
+    for attempt in range(1, retries + 1):
+        try:
+            with get_client().stream("GET", url, headers=headers, timeout=timeout,
+                                     extensions={"trace": stats.trace}) as resp:
+                stats.record_response(resp)
+                resp.raise_for_status()
+                result["content_type"] = resp.headers.get("Content-Type", "").lower()
+                result["size"] = _total_size(resp)
+
+                parser = ImageFile.Parser() if ImageFile is not None else None
+                read = 0
+                chunks = resp.iter_bytes(CHUNK_SIZE)
+                for chunk in chunks:
+                    read += len(chunk)
+                    stats.record_bytes(len(chunk))
+                    if parser is not None:
+                        try:
+                            parser.feed(chunk)
+                        except Exception:
+                            parser = None  # not something Pillow understands
+                    if parser is not None and parser.image is not None:
+                        break
+                    if read >= n:
+                        break
+                # A 206 body is at most `n` bytes: finish it so the connection is reused
+                if resp.status_code == 206:
+                    for chunk in chunks:
+                        stats.record_bytes(len(chunk))
+
+                if parser is not None and parser.image is not None:
+                    result["format"] = parser.image.format
+                    result["width"], result["height"] = parser.image.size
+            break
+        except Exception as e:  # noqa: BLE001
+            result["reason"] = str(e)
+            if attempt < retries:
+                time.sleep(1)
+    else:
+        result["ok"] = False
+        return result
+
+    ct = result["content_type"] or ""
+    size = result["size"]
+    width, height = result["width"], result["height"]
+    if not (any(ct.startswith(vt) for vt in VALID_CONTENT_TYPES) or url.lower().endswith(IMAGE_EXTENSIONS)):
+        result.update(ok=False, reason=f"Unexpected content-type: {ct}")
+    elif size is not None and size < MIN_CREATIVE_BYTES:
+        result.update(ok=False, reason=f"Content too small for creative: {size} bytes")
+    elif size is not None and size > MAX_IMAGE_BYTES:
+        result.update(ok=False, reason=f"Content too large: {size} bytes")
+    elif width is not None and min(width, height) < MIN_CREATIVE_DIMENSION:
+        result.update(ok=False, reason=f"Image too small for creative: {width}x{height}")
+    elif size is not None:
+        result.update(ok=True, reason="")
+    else:
+        result["reason"] = "size unknown"
+    return result
+
+
+def check_creative_url(url: str, *, probe: bool = True) -> bool:
+    """Validation-only check: is `url` a real creative (not a profile pic/logo)?
+
+    URLs already in the image cache passed a full download before. Otherwise
+    uses probe_image when `probe` is set and it can decide, or a full
+    fetch_image_bytes download (which populates the cache).
+    """
+    if image_cache.lookup(url):
+        return True
+    if probe:
+        verdict = probe_image(url)["ok"]
+        if verdict is not None:
+            return verdict
+    return fetch_image_bytes(url) is not None
+
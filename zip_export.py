@@ -0,0 +1,195 @@
+"""
+Streaming ZIP export for generated images.
+
+Archives are written entry by entry to a spool file on disk, copying each
+image from the blob store in chunks, so no more than one chunk of an image is
+held in memory at a time. PNG/JPEG/WebP are already compressed and go in as
+ZIP_STORED. Finished archives are cached under ZIP_EXPORT_DIR, keyed by the
+set of generated ids (or image hashes), so repeated downloads are free.
+
+CLI:
+    python zip_export.py session 12 --out session_12.zip
+    python zip_export.py collection my_collection
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+import time
+import zipfile
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    from . import ads_repository as repo  # when packaged
+except Exception:
+    import ads_repository as repo  # when run directly
+
+EXPORT_DIR = os.getenv("ZIP_EXPORT_DIR", ".exports")
+MAX_CACHED_ARCHIVES = int(os.getenv("ZIP_EXPORT_CACHE_ENTRIES", "20"))
+CHUNK_SIZE = 1024 * 1024
+
+# Formats that don't shrink under DEFLATE
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+
+# (archive name, opener returning a readable stream or None)
+Entry = Tuple[str, Callable[[], Optional[BinaryIO]]]
+
+# One build lock per archive path, so a large build only holds up requests for the same archive
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def _compress_type(arcname: str) -> int:
+    return zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def _unique_name(arcname: str, used: set) -> str:
+    """Variant ids repeat across uploads; suffix duplicates instead of writing duplicate zip members."""
+    if arcname not in used:
+        used.add(arcname)
+        return arcname
+    stem, ext = os.path.splitext(arcname)
+    n = 2
+    while f"{stem}_{n}{ext}" in used:
+        n += 1
+    used.add(f"{stem}_{n}{ext}")
+    return f"{stem}_{n}{ext}"
+
+
+def write_archive(entries: Iterable[Entry], dest_path: str) -> int:
+    """Stream `entries` into a ZIP at `dest_path` (via a .part spool file). Returns entries written."""
+    tmp_path = f"{dest_path}.{threading.get_ident()}.part"
+    written = 0
+    used: set = set()
+    now = time.localtime()[:6]
+    try:
+        with zipfile.ZipFile(tmp_path, 'w') as zf:
+            for arcname, opener in entries:
+                src = opener()
+                if src is None:
+                    continue
+                info = zipfile.ZipInfo(_unique_name(arcname, used), date_time=now)
+                info.compress_type = _compress_type(arcname)
+                with src, zf.open(info, 'w') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                written += 1
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written
+
+
+def _prune_cache():
+    try:
+        archives = [os.path.join(EXPORT_DIR, f) for f in os.listdir(EXPORT_DIR) if f.endswith(".zip")]
+    except FileNotFoundError:
+        return
+    archives.sort(key=os.path.getmtime, reverse=True)
+    for path in archives[MAX_CACHED_ARCHIVES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_archive(cache_key: str, entries: Callable[[], Iterable[Entry]]) -> str:
+    """Return the cached archive for `cache_key`, building it from `entries()` on a miss."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{hashlib.sha256(cache_key.encode()).hexdigest()[:32]}.zip")
+    if _touch(path):
+        return path
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(path, threading.Lock())
+    try:
+        with lock:
+            if _touch(path):  # built by another request while this one waited
+                return path
+            started = time.perf_counter()
+            count = write_archive(entries(), path)
+            print(f"📦 Built export archive ({count} file(s), {os.path.getsize(path) / 1048576:.1f} MB) "
+                  f"in {time.perf_counter() - started:.2f}s")
+            _prune_cache()
+    finally:
+        with _build_locks_guard:
+            if _build_locks.get(path) is lock and not lock.locked():
+                del _build_locks[path]
+    return path
+
+
+def _touch(path: str) -> bool:
+    """Mark a cached archive as recently used (keeps it out of pruning); False if it isn't there."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def export_generated(rows: Sequence[Dict[str, Any]], prefix: str) -> str:
+    """Archive the images of generated_ads rows, keyed by the set of their ids."""
+    gen_ids = sorted(r['id'] for r in rows)
+    key = f"generated:{os.path.abspath(repo.DB_PATH)}:{prefix}:{','.join(map(str, gen_ids))}"
+
+    def entries():
+        for i, r in enumerate(rows):
+            yield f"{prefix}_variant_{r['variant_id'] or f'var_{i+1}'}.png", lambda gid=r['id']: repo.open_generated_image(gid)
+
+    return cached_archive(key, entries)
+
+
+def export_session(session_id: int) -> str:
+    return export_generated(repo.list_generated_for_session(session_id), f"session_{session_id}")
+
+
+def export_collection(table_name: str) -> str:
+    return export_generated(repo.list_generated_for_collection(table_name), f"collection_{table_name}")
+
+
+def export_images(images: Sequence[Tuple[str, bytes]]) -> str:
+    """Archive in-memory (filename, bytes) pairs, keyed by their content hashes."""
+    key = "images:" + ",".join(f"{name}={hashlib.sha256(data).hexdigest()}" for name, data in images)
+    return cached_archive(key, lambda: ((name, lambda d=data: BytesIO(d)) for name, data in images))
+
+
+def read_archive(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def archive_bytes(export: Callable[..., str], *args) -> bytes:
+    """`export(*args)` then read the archive; handy as a deferred st.download_button payload."""
+    return read_archive(export(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export generated images as a ZIP without the UI")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ses = sub.add_parser("session", help="export every generated image of a session")
+    ses.add_argument("session_id", type=int)
+    col = sub.add_parser("collection", help="export every generated image of a collection")
+    col.add_argument("table_name")
+    for p in (ses, col):
+        p.add_argument("--out", help="destination file (default: <session|collection>_<id>_generated_ads.zip)")
+        p.add_argument("--db", default=repo.DB_PATH)
+    args = parser.parse_args()
+
+    repo.DB_PATH = args.db
+    started = time.perf_counter()
+    if args.command == "session":
+        path = export_session(args.session_id)
+        out = args.out or f"session_{args.session_id}_generated_ads.zip"
+    else:
+        path = export_collection(args.table_name)
+        out = args.out or f"collection_{args.table_name}_generated_ads.zip"
+    shutil.copyfile(path, out)
+    with zipfile.ZipFile(out) as zf:
+        count = len(zf.infolist())
+    print(f"✅ Wrote {out} ({count} file(s), {os.path.getsize(out) / 1048576:.1f} MB) in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()